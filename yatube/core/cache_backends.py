@@ -0,0 +1,306 @@
+"""Кеши, общие для всех процессов веб-сервера.
+
+SQLiteCache хранит записи в файле SQLite в режиме WAL и подходит для
+нескольких воркеров на одной машине. RedisCache работает с любым
+клиентом с API redis-py: настоящим redis или локальной заменой,
+указанной в OPTIONS['CLIENT_CLASS']. Целые числа оба кеша хранят как
+есть, без pickle, чтобы incr() менял их атомарно на стороне хранилища.
+"""
+import os
+import pickle
+import random
+import re
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)'
+)
+
+# Пределы целых SQLite; большие числа хранятся через pickle.
+SQLITE_INTEGERS = range(-2 ** 63, 2 ** 63)
+# UPDATE ... RETURNING появился в SQLite 3.35.
+SQLITE_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+REDIS_DELETE_BATCH = 500
+
+
+def sqlite_dumps(value):
+    if type(value) is int and value in SQLITE_INTEGERS:
+        return value
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def sqlite_loads(value):
+    return value if isinstance(value, int) else pickle.loads(value)
+
+
+def redis_dumps(value):
+    if type(value) is int:
+        return value
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def redis_loads(value):
+    try:
+        return int(value)
+    except ValueError:
+        return pickle.loads(value)
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(
+                self._path, timeout=5, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(SCHEMA)
+            local.connection, local.pid = connection, os.getpid()
+        return local.connection
+
+    def _expires(self, timeout):
+        return self.get_backend_timeout(timeout)
+
+    def _write(self, sql, rows):
+        connection = self._connection()
+        connection.executemany(sql, rows)
+        if random.random() < 1 / self._cull_frequency:
+            self._cull(connection)
+
+    def _cull(self, connection):
+        connection.execute(
+            'DELETE FROM cache WHERE expires < ?', (time.time(),)
+        )
+        count, = connection.execute('SELECT COUNT(*) FROM cache').fetchone()
+        if count > self._max_entries:
+            connection.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count // self._cull_frequency,),
+            )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires < ?',
+                (key, time.time()),
+            )
+            cursor = connection.execute(
+                'INSERT OR IGNORE INTO cache VALUES (?, ?, ?)',
+                (key, sqlite_dumps(value), self._expires(timeout)),
+            )
+        finally:
+            connection.execute('COMMIT')
+        return cursor.rowcount == 1
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        row = self._connection().execute(
+            'SELECT value FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires >= ?)',
+            (key, time.time()),
+        ).fetchone()
+        return default if row is None else sqlite_loads(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self.make_key(key, version=version): key for key in keys}
+        if not keys:
+            return {}
+        rows = self._connection().execute(
+            'SELECT key, value FROM cache WHERE key IN ({}) '
+            'AND (expires IS NULL OR expires >= ?)'.format(
+                ', '.join('?' * len(keys))
+            ),
+            (*keys, time.time()),
+        )
+        return {keys[key]: sqlite_loads(value) for key, value in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self._expires(timeout)
+        rows = []
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            rows.append((key, sqlite_dumps(value), expires))
+        self._write('REPLACE INTO cache VALUES (?, ?, ?)', rows)
+        return []
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        update = (
+            'UPDATE cache SET value = value + ? WHERE key = ? '
+            "AND typeof(value) = 'integer' "
+            'AND (expires IS NULL OR expires >= ?)'
+        )
+        params = (delta, key, time.time())
+        connection = self._connection()
+        if SQLITE_RETURNING:
+            rows = connection.execute(
+                update + ' RETURNING value', params
+            ).fetchall()
+        else:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                rows = []
+                if connection.execute(update, params).rowcount:
+                    rows = connection.execute(
+                        'SELECT value FROM cache WHERE key = ?', (key,)
+                    ).fetchall()
+            finally:
+                connection.execute('COMMIT')
+        if not rows:
+            raise ValueError(f"Key '{key}' not found or not an integer")
+        return rows[0][0]
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        cursor = self._connection().execute(
+            'UPDATE cache SET expires = ? WHERE key = ?',
+            (self._expires(timeout), key),
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        self._connection().executemany(
+            'DELETE FROM cache WHERE key = ?',
+            [(self.make_key(key, version=version),) for key in keys],
+        )
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version=version) is not self
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+
+
+class RedisCache(BaseCache):
+    def __init__(self, server, params):
+        super().__init__(params)
+        self._server = server
+        self._client_class = params.get('OPTIONS', {}).get('CLIENT_CLASS')
+
+    @cached_property
+    def _client(self):
+        if self._client_class:
+            return import_string(self._client_class).from_url(self._server)
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured(
+                'Для RedisCache установите пакет redis '
+                'или укажите OPTIONS["CLIENT_CLASS"].'
+            )
+        return redis.Redis.from_url(self._server)
+
+    def _ttl(self, timeout):
+        if timeout == DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        return None if timeout is None else max(0, int(timeout))
+
+    def _set(self, key, value, timeout, nx=False):
+        ttl = self._ttl(timeout)
+        if ttl == 0:
+            self._client.delete(key)
+            return False
+        return bool(self._client.set(
+            key, redis_dumps(value), ex=ttl, nx=nx
+        ))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._set(key, value, timeout, nx=True)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        value = self._client.get(key)
+        return default if value is None else redis_loads(value)
+
+    def get_many(self, keys, version=None):
+        keys = {self.make_key(key, version=version): key for key in keys}
+        if not keys:
+            return {}
+        values = self._client.mget(list(keys))
+        return {
+            original: redis_loads(value)
+            for original, value in zip(keys.values(), values)
+            if value is not None
+        }
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._set(key, value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        for key, value in data.items():
+            self.set(key, value, timeout, version=version)
+        return []
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        if not self._client.exists(key):
+            raise ValueError(f"Key '{key}' not found")
+        return self._client.incrby(key, delta)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        ttl = self._ttl(timeout)
+        if ttl is None:
+            return bool(self._client.persist(key))
+        return bool(self._client.expire(key, ttl))
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        if keys:
+            self._client.delete(*keys)
+
+    def has_key(self, key, version=None):
+        return bool(self._client.exists(self.make_key(key, version=version)))
+
+    def clear(self):
+        """Удаляет только ключи с KEY_PREFIX этого кеша (при стандартной
+        KEY_FUNCTION): в той же базе redis могут лежать чужие данные."""
+        pattern = re.sub(r'([*?\[\]\\])', r'\\\1', self.key_prefix) + ':*'
+        keys = []
+        for key in self._client.scan_iter(
+            match=pattern, count=REDIS_DELETE_BATCH
+        ):
+            keys.append(key)
+            if len(keys) == REDIS_DELETE_BATCH:
+                self._client.delete(*keys)
+                keys = []
+        if keys:
+            self._client.delete(*keys)
@@ -0,0 +1,122 @@
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .profiling import record_cache
+
+
+class Namespace:
+    """Пространство ключей кеша с общей версией.
+
+    invalidate() сдвигает версию, и все ключи пространства разом
+    перестают находиться, даже если кеш общий для нескольких процессов.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.version_key = f'namespace:{name}'
+
+    def version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, 1, None)
+            version = cache.get(self.version_key, 1)
+        return version
+
+    def key(self, key):
+        return f'{self.name}:{self.version()}:{key}'
+
+    def invalidate(self):
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.add(self.version_key, 1, None)
+
+
+class LocalCache:
+    """Кеш объектов в памяти процесса, общий для всех его запросов.
+
+    Хранит не больше max_size значений, вытесняя давно не читанные;
+    каждое значение живёт timeout секунд.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                item = self._items.get(key)
+                if item is None:
+                    continue
+                if item[1] < now:
+                    del self._items[key]
+                    continue
+                self._items.move_to_end(key)
+                found[key] = item[0]
+        return found
+
+    def set_many(self, mapping, timeout):
+        expires = time.monotonic() + timeout
+        with self._lock:
+            for key, value in mapping.items():
+                self._items[key] = (value, expires)
+                self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+def get_or_compute(key, compute, timeout, beta=1.0):
+    """cache.get_or_set с защитой от лавины пересчётов.
+
+    Значение пересчитывается заранее с вероятностью, растущей к концу
+    срока жизни (probabilistic early expiration), а блокировка через
+    cache.add пускает к пересчёту один процесс: остальные отдают
+    прежнее значение, а если его нет, ждут нового не дольше
+    CACHE_LOCK_WAIT и затем считают сами.
+    """
+    entry = cache.get(key)
+    record_cache(int(entry is not None), int(entry is None))
+    if entry is not None:
+        value, delta, expires = entry
+        early = delta * beta * math.log(1 - random.random())
+        if time.time() - early < expires:
+            return value
+    lock_key = f'{key}:lock'
+    locked = cache.add(lock_key, 1, settings.CACHE_LOCK_TIMEOUT)
+    if not locked:
+        if entry is not None:
+            return entry[0]
+        deadline = time.time() + settings.CACHE_LOCK_WAIT
+        while time.time() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry[0]
+    try:
+        started = time.time()
+        value = compute()
+        delta = time.time() - started
+        cache.set(key, (value, delta, time.time() + timeout), timeout)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return value
@@ -0,0 +1,88 @@
+"""PostgreSQL с пулом соединений внутри процесса.
+
+При OPTIONS['pool_size'] > 0 соединения берутся из ThreadedConnectionPool
+psycopg2 и при закрытии возвращаются в него, так что запрос не платит за
+установку соединения. CONN_MAX_AGE с пулом должен быть 0: иначе каждый
+поток держит своё соединение и пул быстро кончается. Когда свободных
+соединений нет, поток ждёт до OPTIONS['pool_timeout'] секунд. Пул общий
+для всех потоков процесса и создаётся на каждый набор параметров
+подключения.
+"""
+import threading
+
+import psycopg2
+import psycopg2.extras
+from django.db.backends.postgresql import base
+from psycopg2.pool import ThreadedConnectionPool
+
+_pools = {}
+_lock = threading.Lock()
+
+
+class BlockingPool(ThreadedConnectionPool):
+    """Пул, который при исчерпании ждёт освободившееся соединение,
+    а не бросает PoolError."""
+
+    def __init__(self, size, timeout, **conn_params):
+        super().__init__(1, size, **conn_params)
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(size)
+
+    def getconn(self, key=None):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise psycopg2.OperationalError(
+                f'Нет свободного соединения в пуле за {self.timeout} с'
+            )
+        try:
+            return super().getconn(key)
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self.slots.release()
+
+
+def get_pool(size, timeout, conn_params):
+    key = (size, timeout, repr(sorted(conn_params.items())))
+    with _lock:
+        if key not in _pools:
+            _pools[key] = BlockingPool(size, timeout, **conn_params)
+        return _pools[key]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    pool = None
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pool_size = params.pop('pool_size', 0)
+        self.pool_timeout = params.pop('pool_timeout', 10)
+        return params
+
+    def get_new_connection(self, conn_params):
+        if not self.pool_size:
+            self.pool = None
+            return super().get_new_connection(conn_params)
+        self.pool = get_pool(self.pool_size, self.pool_timeout, conn_params)
+        connection = self.pool.getconn()
+        isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level'
+        )
+        if isolation_level is not None:
+            connection.set_session(isolation_level=isolation_level)
+        self.isolation_level = connection.isolation_level
+        psycopg2.extras.register_default_jsonb(
+            conn_or_curs=connection, loads=lambda value: value
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is None or self.pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            # Пул откатывает незавершённую транзакцию сам.
+            self.pool.putconn(self.connection)
@@ -0,0 +1,21 @@
+"""SQLite, настроенный для нескольких воркеров.
+
+PRAGMA из OPTIONS['pragmas'] выполняются на каждом новом соединении:
+WAL позволяет читать во время записи, synchronous=NORMAL в режиме WAL
+не рискует целостностью базы, mmap_size и cache_size сокращают чтение с
+диска. OPTIONS['timeout'] задаёт, сколько секунд ждать блокировку записи.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = params.pop('pragmas', {})
+        return params
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        return connection
@@ -0,0 +1,91 @@
+"""Чтение с реплик для лент и страниц постов.
+
+Запросы уходят на реплику только внутри представлений, помеченных
+read_from_replica. Запись, чтение внутри транзакции и всё, что идёт
+после записи в том же запросе, остаются на основной базе. Пользователь,
+который недавно писал, закреплён за основной базой cookie от
+PrimaryPinMiddleware и видит свои изменения без задержки репликации.
+Страницы, которые получат свежий ETag, рисуются по основной базе
+(primary()); кеш страниц для анонимов не сохраняет страницы, ключи
+которых сбросили за время возможного отставания реплики.
+"""
+import random
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_state = threading.local()
+
+
+@contextmanager
+def request_state(pinned):
+    """Состояние маршрутизации на время запроса; wrote станет True,
+    если запрос что-то записал."""
+    previous = getattr(_state, 'request', None)
+    _state.request = state = RequestState(pinned)
+    try:
+        yield state
+    finally:
+        _state.request = previous
+
+
+class RequestState:
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.replica = False
+        self.wrote = False
+
+
+def read_from_replica(view):
+    """Разрешает представлению читать с реплики."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        state = getattr(_state, 'request', None)
+        if state is None:
+            return view(request, *args, **kwargs)
+        previous, state.replica = state.replica, True
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            state.replica = previous
+    return wrapper
+
+
+@contextmanager
+def primary():
+    """Читать внутри блока с основной базы, например когда результат
+    закешируют как свежий: реплика может ещё не догнать последнюю правку."""
+    state = getattr(_state, 'request', None)
+    if state is None:
+        yield
+        return
+    previous, state.replica = state.replica, False
+    try:
+        yield
+    finally:
+        state.replica = previous
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = getattr(_state, 'request', None)
+        if (not settings.REPLICA_DATABASES or state is None
+                or not state.replica or state.pinned or state.wrote
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.REPLICA_DATABASES)
+
+    def db_for_write(self, model, **hints):
+        state = getattr(_state, 'request', None)
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.REPLICA_DATABASES
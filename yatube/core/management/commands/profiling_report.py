@@ -0,0 +1,58 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core import profiling
+
+
+class Command(BaseCommand):
+    help = (
+        'Сводка метрик запросов по представлениям из всех процессов, '
+        'сохранивших гистограммы в PROFILING_DIR.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true')
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Удалить накопленные гистограммы после вывода.',
+        )
+
+    def handle(self, *args, **options):
+        stats = profiling.load_all()
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+        else:
+            self.write_table(stats)
+        if options['reset']:
+            profiling.reset()
+
+    def write_table(self, stats):
+        self.stdout.write(
+            '{:<28} {:>8} {:>8} {:>9} {:>9} {:>9} {:>7} {:>7}'.format(
+                'view', 'requests', 'queries', 'sql ms', 'tpl ms',
+                'total ms', 'hit %', 'budget',
+            )
+        )
+        for view_name, values in sorted(stats.items()):
+            requests = values['requests'] or 1
+            lookups = values['cache_hits'] + values['cache_misses']
+            hit_rate = 100 * values['cache_hits'] / lookups if lookups else 0
+            self.stdout.write(
+                '{:<28} {:>8} {:>8.1f} {:>9.1f} {:>9.1f} {:>9.1f} '
+                '{:>7.1f} {:>7}'.format(
+                    view_name,
+                    values['requests'],
+                    values['queries'] / requests,
+                    values['sql_ms'] / requests,
+                    values['template_ms'] / requests,
+                    values['total_ms'] / requests,
+                    hit_rate,
+                    values['over_budget'],
+                )
+            )
+            self.stdout.write('    latency ms: ' + ' '.join(
+                f'<={bound}:{count}' for bound, count in zip(
+                    (*profiling.LATENCY_BUCKETS, 'inf'), values['latency']
+                )
+            ))
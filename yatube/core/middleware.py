@@ -0,0 +1,87 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.signing import BadSignature
+from django.db import connections
+
+from . import db_router, profiling
+
+logger = logging.getLogger('yatube.profiling')
+
+
+class ProfilingMiddleware:
+    """Считает SQL-запросы, время SQL и шаблонов, попадания в кеш.
+
+    Метрики отдаются заголовком Server-Timing и копятся в гистограмме
+    по имени представления; превышение бюджета запросов логируется.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with profiling.collect() as collector, ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(collector.execute)
+                )
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - started) * 1000
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+        budget = profiling.query_budget(view_name)
+        over_budget = collector.queries > budget
+        if over_budget:
+            logger.warning(
+                '%s: %s SQL-запросов при бюджете %s',
+                view_name, collector.queries, budget,
+            )
+            response['X-Query-Budget'] = f'{collector.queries}/{budget}'
+        response['Server-Timing'] = ', '.join((
+            'sql;dur={:.1f};desc="{} queries"'.format(
+                collector.sql_time * 1000, collector.queries
+            ),
+            'tpl;dur={:.1f}'.format(collector.template_time * 1000),
+            'cache;desc="hits={} misses={}"'.format(
+                collector.cache_hits, collector.cache_misses
+            ),
+            'total;dur={:.1f}'.format(total_ms),
+        ))
+        profiling.record(view_name, collector, total_ms, over_budget)
+        return response
+
+
+class PrimaryPinMiddleware:
+    """Закрепляет пользователя за основной базой после записи.
+
+    Запрос, который писал в базу, ставит подписанную cookie на
+    REPLICA_STICKY_SECONDS; пока она жива, чтение не уходит на реплики.
+    """
+
+    cookie_name = 'yatube_primary'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REPLICA_DATABASES:
+            return self.get_response(request)
+        try:
+            request.get_signed_cookie(
+                self.cookie_name, max_age=settings.REPLICA_STICKY_SECONDS
+            )
+            pinned = True
+        except (KeyError, BadSignature):
+            pinned = False
+        with db_router.request_state(pinned) as state:
+            response = self.get_response(request)
+        if state.wrote or request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            response.set_signed_cookie(
+                self.cookie_name, '1',
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
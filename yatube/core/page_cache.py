@@ -0,0 +1,189 @@
+"""Кеш целых страниц для анонимных посетителей.
+
+Представление помечает страницу суррогатными ключами через
+add_surrogate_keys(), и она сохраняется вместе с версиями этих ключей.
+Версия — время последнего сброса ключа: страница, во время рисования
+которой ключ сбросили, в кеш не попадает (часы воркеров считаются
+согласованными). purge() сдвигает версии, и все
+страницы с такими ключами перестают находиться. Те же ключи отдаются в
+заголовке Surrogate-Key, а сброс дублируется запросом PURGE на
+SURROGATE_PURGE_URL, чтобы внешний CDN или кеширующий прокси мог
+сбрасывать свои копии так же. Ключи одной транзакции собираются в один
+сброс, а запросы в прокси отправляет фоновый поток, объединяя ключи,
+накопившиеся за время предыдущего запроса.
+"""
+import hashlib
+import logging
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+from .caching import Namespace
+from .profiling import record_cache
+
+logger = logging.getLogger(__name__)
+
+PAGE_CACHE = Namespace('pages')
+KEY_PREFIX = 'surrogate-purged:'
+
+_executor = None
+_queued = set()
+_lock = threading.Lock()
+
+
+def add_surrogate_keys(request, *keys):
+    request.surrogate_keys = getattr(request, 'surrogate_keys', set())
+    request.surrogate_keys.update(keys)
+
+
+def _versions(keys, started):
+    """Версии ключей или None, если ключ сбросили после started.
+
+    Ключ, которого нет в кеше, получает версию started: любой следующий
+    сброс её сменит.
+    """
+    names = {KEY_PREFIX + key: key for key in keys}
+    found = cache.get_many(names)
+    if any(version >= started for version in found.values()):
+        return None
+    for name in names.keys() - found.keys():
+        cache.add(name, started, None)
+    found.update(cache.get_many(names.keys() - found.keys()))
+    return {names[name]: found.get(name) for name in names}
+
+
+def _is_fresh(versions):
+    current = cache.get_many([KEY_PREFIX + key for key in versions])
+    return all(
+        current.get(KEY_PREFIX + key) == version
+        for key, version in versions.items()
+    )
+
+
+def _bump(keys):
+    now = time.time()
+    cache.set_many({KEY_PREFIX + key: now for key in keys}, None)
+
+
+def _send_queued():
+    with _lock:
+        keys = set(_queued)
+        _queued.clear()
+    request = urllib.request.Request(
+        settings.SURROGATE_PURGE_URL,
+        method='PURGE',
+        headers={'Surrogate-Key': ' '.join(sorted(keys))},
+    )
+    try:
+        urllib.request.urlopen(
+            request, timeout=settings.SURROGATE_PURGE_TIMEOUT
+        ).close()
+    except OSError:
+        logger.warning('Прокси не принял сброс ключей %s', keys, exc_info=True)
+
+
+def _notify_proxy(keys):
+    """Ставит ключи в очередь фонового потока; ключи, пришедшие до
+    отправки, уходят тем же запросом."""
+    global _executor
+    with _lock:
+        scheduled = bool(_queued)
+        _queued.update(keys)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='surrogate-purge'
+            )
+    if not scheduled:
+        _executor.submit(_send_queued)
+
+
+def drain():
+    """Дожидается отправки сбросов в прокси и останавливает поток."""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+class _CommittedPurge:
+    """Сброс ключей после коммита, один на транзакцию."""
+
+    def __init__(self, keys):
+        self.keys = set(keys)
+
+    def __call__(self):
+        _bump(self.keys)
+        if settings.SURROGATE_PURGE_URL:
+            _notify_proxy(self.keys)
+
+
+def purge(*keys):
+    """Сбрасывает страницы с ключами сейчас и ещё раз после коммита,
+    чтобы не закешировать страницу, отрисованную до коммита."""
+    keys = set(keys)
+    if not keys:
+        return
+    _bump(keys)
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        for _, callback in connection.run_on_commit:
+            if isinstance(callback, _CommittedPurge):
+                callback.keys |= keys
+                return
+    transaction.on_commit(_CommittedPurge(keys))
+
+
+def anonymous_page_cache(view):
+    """Отдаёт анонимам сохранённую страницу, пока её ключи не сброшены.
+
+    Кешируются только ответы 200 без cookies, помеченные ключами.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (request.method not in ('GET', 'HEAD')
+                or request.user.is_authenticated):
+            return view(request, *args, **kwargs)
+        key = PAGE_CACHE.key(
+            hashlib.md5(request.get_full_path().encode()).hexdigest()
+        )
+        entry = cache.get(key)
+        if entry is not None and _is_fresh(entry['versions']):
+            record_cache(1, 0)
+            response = HttpResponse(entry['content'])
+            for header, value in entry['headers']:
+                response[header] = value
+            response['X-Cache'] = 'HIT'
+            return response
+        record_cache(0, 1)
+        started = time.time()
+        response = view(request, *args, **kwargs)
+        keys = getattr(request, 'surrogate_keys', None)
+        if (response.status_code != 200 or response.streaming
+                or response.cookies or not keys):
+            return response
+        response['Surrogate-Key'] = ' '.join(sorted(keys))
+        response['Surrogate-Control'] = (
+            f'max-age={settings.PAGE_CACHE_TIMEOUT}'
+        )
+        # Страница могла быть нарисована по реплике: если ключ сбросили
+        # за время её возможного отставания, страницу отдаём, но не
+        # сохраняем, иначе кеш закрепит старую копию до следующей правки.
+        lag = settings.REPLICA_MAX_LAG if settings.REPLICA_DATABASES else 0
+        versions = _versions(keys, started - lag)
+        if versions is not None:
+            cache.set(key, {
+                'content': response.content,
+                'headers': list(response.items()),
+                'versions': versions,
+            }, settings.PAGE_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
+    return wrapper
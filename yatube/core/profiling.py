@@ -0,0 +1,161 @@
+"""Сбор метрик запросов: SQL, шаблоны, кеш и время ответа.
+
+Метрики текущего запроса копятся в Collector, а итоги по каждому
+представлению — в гистограмме процесса, которая периодически
+сбрасывается в PROFILING_DIR и читается командой profiling_report.
+"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_local = threading.local()
+_lock = threading.Lock()
+_stats = {}
+_requests_since_flush = 0
+
+
+class Collector:
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_time += time.perf_counter() - started
+
+
+def current():
+    return getattr(_local, 'collector', None)
+
+
+@contextmanager
+def collect():
+    collector = _local.collector = Collector()
+    try:
+        yield collector
+    finally:
+        _local.collector = None
+
+
+@contextmanager
+def template_timer():
+    collector = current()
+    if collector is None or collector.template_depth:
+        yield
+        return
+    collector.template_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        collector.template_depth -= 1
+        collector.template_time += time.perf_counter() - started
+
+
+def record_cache(hits, misses):
+    collector = current()
+    if collector is not None:
+        collector.cache_hits += hits
+        collector.cache_misses += misses
+
+
+def query_budget(view_name):
+    return settings.QUERY_BUDGETS.get(view_name, settings.QUERY_BUDGET)
+
+
+def _empty_stats():
+    return {
+        'requests': 0,
+        'queries': 0,
+        'sql_ms': 0.0,
+        'template_ms': 0.0,
+        'total_ms': 0.0,
+        'cache_hits': 0,
+        'cache_misses': 0,
+        'over_budget': 0,
+        'latency': [0] * (len(LATENCY_BUCKETS) + 1),
+    }
+
+
+def _bucket(total_ms):
+    for index, bound in enumerate(LATENCY_BUCKETS):
+        if total_ms <= bound:
+            return index
+    return len(LATENCY_BUCKETS)
+
+
+def record(view_name, collector, total_ms, over_budget):
+    global _requests_since_flush
+    with _lock:
+        stats = _stats.setdefault(view_name, _empty_stats())
+        stats['requests'] += 1
+        stats['queries'] += collector.queries
+        stats['sql_ms'] += collector.sql_time * 1000
+        stats['template_ms'] += collector.template_time * 1000
+        stats['total_ms'] += total_ms
+        stats['cache_hits'] += collector.cache_hits
+        stats['cache_misses'] += collector.cache_misses
+        stats['over_budget'] += int(over_budget)
+        stats['latency'][_bucket(total_ms)] += 1
+        _requests_since_flush += 1
+        if _requests_since_flush >= settings.PROFILING_FLUSH_EVERY:
+            _requests_since_flush = 0
+            flush()
+
+
+def flush():
+    """Сохраняет гистограмму процесса в файл PROFILING_DIR/<pid>.json."""
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    path = os.path.join(settings.PROFILING_DIR, f'{os.getpid()}.json')
+    with open(path + '.tmp', 'w') as file:
+        json.dump(_stats, file)
+    os.replace(path + '.tmp', path)
+
+
+def merge(snapshots):
+    merged = defaultdict(_empty_stats)
+    for stats in snapshots:
+        for view_name, values in stats.items():
+            total = merged[view_name]
+            for key, value in values.items():
+                if key == 'latency':
+                    total[key] = [a + b for a, b in zip(total[key], value)]
+                else:
+                    total[key] += value
+    return dict(merged)
+
+
+def load_all():
+    if not os.path.isdir(settings.PROFILING_DIR):
+        return {}
+    snapshots = []
+    for name in os.listdir(settings.PROFILING_DIR):
+        if name.endswith('.json'):
+            path = os.path.join(settings.PROFILING_DIR, name)
+            with open(path) as file:
+                snapshots.append(json.load(file))
+    return merge(snapshots)
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+    if os.path.isdir(settings.PROFILING_DIR):
+        for name in os.listdir(settings.PROFILING_DIR):
+            if name.endswith('.json'):
+                os.remove(os.path.join(settings.PROFILING_DIR, name))
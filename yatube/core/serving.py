@@ -0,0 +1,221 @@
+"""Отдача статики и медиа прямо из WSGI-приложения.
+
+FileServingMiddleware оборачивает WSGI-приложение Django и отвечает на
+GET и HEAD для файлов из STATIC_ROOT и MEDIA_ROOT, остальные запросы
+передаёт дальше. Поддерживаются ETag и Last-Modified с ответом 304,
+один диапазон Range и заранее сжатые копии статики .br и .gz, которые
+кладёт collectstatic. Файлы с хешем в имени (статика из манифеста,
+загрузки с адресацией по содержимому, миниатюры) не меняются, поэтому
+кешируются навсегда. Файл целиком отдаётся через wsgi.file_wrapper:
+gunicorn и uWSGI пересылают его в сокет вызовом sendfile без
+копирования через Python.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.handlers.wsgi import get_path_info
+from django.utils.http import http_date, parse_http_date_safe
+
+# Форматы картинок постов, которых нет в старых таблицах mimetypes.
+mimetypes.add_type('image/avif', '.avif')
+mimetypes.add_type('image/webp', '.webp')
+
+IMMUTABLE_NAME = re.compile(r'[./][0-9a-f]{12,}\.\w+$')
+RANGE = re.compile(r'bytes=(\d*)-(\d*)$')
+# Кодировка Content-Encoding и расширение сжатой копии по предпочтению.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+BLOCK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def accepted_encodings(header):
+    """Кодировки из Accept-Encoding, кроме запрещённых через q=0."""
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        quality = params.replace(' ', '')
+        if quality.startswith('q='):
+            try:
+                if not float(quality[2:]):
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def byte_range(header, size):
+    """Начало и длина единственного диапазона из заголовка Range.
+
+    None — заголовок не разобран или диапазонов несколько: по RFC 7233
+    тогда отдаётся весь файл.
+    """
+    match = RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        length = min(int(last), size)
+        if not length:
+            raise RangeNotSatisfiable
+        return size - length, length
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    return start, end - start + 1
+
+
+class FileSlice:
+    """Тело ответа: length байт файла с текущей позиции."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.length = length
+
+    def __iter__(self):
+        remaining = self.length
+        while remaining > 0:
+            chunk = self.file.read(min(BLOCK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+    def close(self):
+        self.file.close()
+
+
+class FileServingMiddleware:
+    def __init__(self, application):
+        self.application = application
+        # Префикс URL, каталог и есть ли в нём сжатые копии.
+        self.mounts = [
+            (url, root, compressed)
+            for url, root, compressed in (
+                (settings.STATIC_URL, settings.STATIC_ROOT, True),
+                (settings.MEDIA_URL, settings.MEDIA_ROOT, False),
+            )
+            if url and url.startswith('/') and root
+        ]
+
+    def __call__(self, environ, start_response):
+        if environ['REQUEST_METHOD'] in ('GET', 'HEAD'):
+            path = get_path_info(environ)
+            for url, root, compressed in self.mounts:
+                if not path.startswith(url):
+                    continue
+                filename = self.find(root, path[len(url):])
+                if filename:
+                    return self.serve(
+                        environ, start_response, filename, compressed
+                    )
+                break
+        return self.application(environ, start_response)
+
+    def find(self, root, name):
+        parts = [part for part in name.split('/') if part]
+        # Заодно отсекаются '..' и временные файлы хранилища.
+        if not parts or any(part.startswith('.') for part in parts):
+            return None
+        filename = os.path.join(root, *parts)
+        return filename if os.path.isfile(filename) else None
+
+    def variant(self, environ, filename, compressed):
+        """Сжатая копия под Accept-Encoding клиента или сам файл."""
+        if compressed and 'HTTP_RANGE' not in environ:
+            accepted = accepted_encodings(
+                environ.get('HTTP_ACCEPT_ENCODING', '')
+            )
+            for encoding, extension in ENCODINGS:
+                if (encoding in accepted
+                        and os.path.isfile(filename + extension)):
+                    return filename + extension, encoding
+        return filename, None
+
+    def serve(self, environ, start_response, filename, compressed):
+        path, encoding = self.variant(environ, filename, compressed)
+        stat = os.stat(path)
+        etag = '"{:x}-{:x}{}"'.format(
+            stat.st_mtime_ns, stat.st_size, f'-{encoding}' if encoding else ''
+        )
+        content_type = mimetypes.guess_type(filename)[0]
+        headers = [
+            ('Content-Type', content_type or 'application/octet-stream'),
+            ('Last-Modified', http_date(stat.st_mtime)),
+            ('ETag', etag),
+            ('Cache-Control', self.cache_control(filename)),
+            ('Accept-Ranges', 'bytes'),
+            ('X-Content-Type-Options', 'nosniff'),
+        ]
+        if compressed:
+            headers.append(('Vary', 'Accept-Encoding'))
+        if encoding:
+            headers.append(('Content-Encoding', encoding))
+        if self.not_modified(environ, etag, stat.st_mtime):
+            start_response('304 Not Modified', headers)
+            return []
+        status, start, length = '200 OK', 0, stat.st_size
+        if self.range_applies(environ, etag, stat.st_mtime):
+            try:
+                requested = byte_range(environ['HTTP_RANGE'], stat.st_size)
+            except RangeNotSatisfiable:
+                start_response('416 Range Not Satisfiable', headers + [
+                    ('Content-Range', f'bytes */{stat.st_size}'),
+                    ('Content-Length', '0'),
+                ])
+                return []
+            if requested:
+                start, length = requested
+                status = '206 Partial Content'
+                headers.append(('Content-Range', 'bytes {}-{}/{}'.format(
+                    start, start + length - 1, stat.st_size
+                )))
+        headers.append(('Content-Length', str(length)))
+        start_response(status, headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        return self.body(environ, path, start, length, stat.st_size)
+
+    def body(self, environ, path, start, length, size):
+        file = open(path, 'rb')
+        if length == size and 'wsgi.file_wrapper' in environ:
+            return environ['wsgi.file_wrapper'](file, BLOCK_SIZE)
+        file.seek(start)
+        return FileSlice(file, length)
+
+    def cache_control(self, filename):
+        if IMMUTABLE_NAME.search(filename):
+            return 'public, max-age={}, immutable'.format(
+                settings.FILES_IMMUTABLE_MAX_AGE
+            )
+        return f'public, max-age={settings.FILES_MAX_AGE}'
+
+    def not_modified(self, environ, etag, mtime):
+        if 'HTTP_IF_NONE_MATCH' in environ:
+            tags = [
+                tag.strip().replace('W/', '', 1)
+                for tag in environ['HTTP_IF_NONE_MATCH'].split(',')
+            ]
+            return etag in tags or '*' in tags
+        since = parse_http_date_safe(
+            environ.get('HTTP_IF_MODIFIED_SINCE', '')
+        )
+        return since is not None and int(mtime) <= since
+
+    def range_applies(self, environ, etag, mtime):
+        """Есть Range, и If-Range (если он задан) совпал с файлом."""
+        if 'HTTP_RANGE' not in environ:
+            return False
+        condition = environ.get('HTTP_IF_RANGE')
+        if condition is None or condition.strip() == etag:
+            return True
+        since = parse_http_date_safe(condition)
+        return since is not None and int(mtime) <= since
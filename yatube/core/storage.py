@@ -0,0 +1,113 @@
+"""Файловые хранилища: загрузки с адресацией по содержимому и статика
+со сжатыми копиями.
+
+Загруженный файл сохраняется под именем
+<каталог>/<2 символа хеша>/<sha256><расширение>, где каталог берётся из
+запрошенного имени (upload_to поля). Повторная загрузка того же
+содержимого не пишет ничего нового и возвращает имя уже сохранённого
+файла, поэтому диск растёт только с уникальным содержимым.
+Один файл может быть у нескольких записей: удалять его можно только
+сборкой мусора, которая проверяет ссылки и не трогает недавно
+сохранённые файлы (команда collect_media); повторная загрузка обновляет
+дату файла.
+"""
+import gzip
+import hashlib
+import os
+import posixpath
+import uuid
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def gzip_compress(data):
+    # mtime=0: одинаковый файл всегда сжимается в одинаковые байты.
+    return gzip.compress(data, 9, mtime=0)
+
+
+COMPRESSORS = [('.gz', gzip_compress)]
+if brotli is not None:
+    COMPRESSORS.append(('.br', brotli.compress))
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # Имя всё равно определяется содержимым в _save().
+        return name
+
+    def _save(self, name, content):
+        directory, filename = posixpath.split(name.replace('\\', '/'))
+        digest = content_hash(content)
+        name = posixpath.join(
+            directory,
+            digest[:2],
+            digest + os.path.splitext(filename)[1].lower(),
+        )
+        if self.exists(name):
+            try:
+                # Свежая дата не даст сборке мусора удалить файл, пока
+                # запись, которая на него сошлётся, ещё не сохранена.
+                os.utime(self.path(name))
+                return name
+            except FileNotFoundError:
+                pass
+        # Пишем во временный файл и атомарно переименовываем: параллельная
+        # загрузка того же содержимого просто заменит файл таким же.
+        temporary = super()._save(
+            posixpath.join(posixpath.dirname(name), f'.{uuid.uuid4().hex}'),
+            content,
+        )
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Статика с хешем содержимого в именах и заранее сжатыми копиями.
+
+    Пока collectstatic не запускался (разработка, тесты), манифеста нет
+    и ссылки ведут на исходные имена.
+    """
+    compressible = (
+        '.css', '.js', '.map', '.svg', '.json', '.txt', '.xml', '.html',
+        '.ico', '.ttf', '.eot', '.otf',
+    )
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(paths) | set(self.hashed_files.values()):
+            if name.lower().endswith(self.compressible):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as file:
+            data = file.read()
+        for extension, compress in COMPRESSORS:
+            compressed = compress(data)
+            if self.exists(name + extension):
+                self.delete(name + extension)
+            # Сжатие, которое почти ничего не даёт, не стоит распаковки.
+            if len(compressed) < len(data) * 0.95:
+                self._save(name + extension, ContentFile(compressed))
@@ -0,0 +1,25 @@
+from django.template.backends.django import DjangoTemplates
+
+from .profiling import template_timer
+
+
+class ProfiledTemplate:
+    def __init__(self, template):
+        self._wrapped = template
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+    def render(self, context=None, request=None):
+        with template_timer():
+            return self._wrapped.render(context, request)
+
+
+class ProfiledDjangoTemplates(DjangoTemplates):
+    """Шаблонизатор Django, замеряющий время рендеринга для профилировщика."""
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return ProfiledTemplate(super().get_template(template_name))
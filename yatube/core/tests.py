@@ -0,0 +1,533 @@
+import fnmatch
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, override_settings
+)
+
+from . import page_cache, profiling
+from .cache_backends import RedisCache, SQLiteCache
+from .caching import LocalCache, Namespace, get_or_compute
+from .serving import FileServingMiddleware
+from .storage import ContentAddressedStorage
+
+
+class LocalRedis:
+    """Локальная замена redis-клиента для RedisCache."""
+
+    def __init__(self):
+        self.data = {}
+
+    @classmethod
+    def from_url(cls, url):
+        return cls()
+
+    def _alive(self, key):
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and expires < time.time():
+            self.data.pop(key)
+            return None
+        return value
+
+    def get(self, key):
+        return self._alive(key)
+
+    def mget(self, keys):
+        return [self._alive(key) for key in keys]
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and self._alive(key) is not None:
+            return None
+        if isinstance(value, int):
+            value = str(value).encode()
+        self.data[key] = (value, None if ex is None else time.time() + ex)
+        return True
+
+    def incrby(self, key, amount):
+        value = int(self._alive(key) or 0) + amount
+        expires = self.data.get(key, (None, None))[1]
+        self.data[key] = (str(value).encode(), expires)
+        return value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def exists(self, key):
+        return int(self._alive(key) is not None)
+
+    def expire(self, key, ttl):
+        if self._alive(key) is None:
+            return False
+        self.data[key] = (self.data[key][0], time.time() + ttl)
+        return True
+
+    def persist(self, key):
+        value = self._alive(key)
+        if value is None:
+            return False
+        self.data[key] = (value, None)
+        return True
+
+    def scan_iter(self, match='*', count=None):
+        return [
+            key for key in list(self.data)
+            if fnmatch.fnmatchcase(key, match) and self._alive(key)
+        ]
+
+
+class SharedCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def check_backend(self, first, second):
+        first.set('post', {'text': 'Пост'}, 60)
+        self.assertEqual(second.get('post'), {'text': 'Пост'})
+        self.assertFalse(second.add('post', 'другой'))
+        self.assertTrue(second.add('lock', 1, 60))
+        second.set_many({'a': 1, 'b': 2})
+        self.assertEqual(first.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+        second.delete_many(['a', 'post'])
+        self.assertIsNone(first.get('post'))
+        self.assertFalse(first.has_key('a'))
+        first.set('expired', 1, 0)
+        self.assertIsNone(second.get('expired'))
+        first.set('count', 5)
+        self.assertEqual(second.incr('count', 2), 7)
+        self.assertEqual(first.decr('count'), 6)
+        self.assertEqual(second.get('count'), 6)
+        with self.assertRaises(ValueError):
+            first.incr('missing')
+
+    def test_sqlite_cache_is_shared(self):
+        """Два экземпляра SQLiteCache видят записи друг друга."""
+        path = os.path.join(self.directory, 'cache.sqlite3')
+        self.check_backend(SQLiteCache(path, {}), SQLiteCache(path, {}))
+
+    def test_sqlite_cache_without_returning(self):
+        """incr работает и на SQLite старше 3.35, без RETURNING."""
+        path = os.path.join(self.directory, 'cache.sqlite3')
+        with mock.patch('core.cache_backends.SQLITE_RETURNING', False):
+            self.check_backend(SQLiteCache(path, {}), SQLiteCache(path, {}))
+
+    def test_redis_cache_with_local_client(self):
+        """RedisCache работает с локальной заменой клиента."""
+        backend = RedisCache('redis://localhost:6379/0', {
+            'OPTIONS': {'CLIENT_CLASS': 'core.tests.LocalRedis'},
+        })
+        self.check_backend(backend, backend)
+
+    def test_redis_clear_keeps_other_prefixes(self):
+        """clear() удаляет только ключи своего префикса."""
+        backend = RedisCache('redis://localhost:6379/0', {
+            'KEY_PREFIX': 'yatube',
+            'OPTIONS': {'CLIENT_CLASS': 'core.tests.LocalRedis'},
+        })
+        backend._client.set('other:1:post', b'other')
+        backend.set_many({f'post-{number}': number for number in range(600)})
+        backend.clear()
+        self.assertEqual(list(backend._client.data), ['other:1:post'])
+
+
+@override_settings(CACHE_LOCK_TIMEOUT=1)
+class CachingHelpersTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_namespace_invalidate(self):
+        """Сброс пространства делает недоступными его ключи."""
+        feed = Namespace('feed')
+        cache.set(feed.key('hot_authors'), {1})
+        feed.invalidate()
+        self.assertIsNone(cache.get(feed.key('hot_authors')))
+
+    def test_get_or_compute_once(self):
+        """Значение вычисляется один раз, пока не истекло."""
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(get_or_compute('value', compute, 60), 1)
+        self.assertEqual(get_or_compute('value', compute, 60), 1)
+        self.assertEqual(len(calls), 1)
+
+    def test_get_or_compute_serves_stale_while_locked(self):
+        """Пока другой процесс пересчитывает, отдаётся прежнее значение."""
+        cache.set('value', ('старое', 1.0, time.time() - 1))
+        cache.add('value:lock', 1)
+        self.assertEqual(
+            get_or_compute('value', lambda: 'новое', 60), 'старое'
+        )
+
+    @override_settings(CACHE_LOCK_WAIT=0.1, CACHE_LOCK_TIMEOUT=10)
+    def test_get_or_compute_waits_briefly(self):
+        """Без прежнего значения запрос недолго ждёт чужого пересчёта
+        и считает сам."""
+        cache.add('value:lock', 1)
+        started = time.time()
+        self.assertEqual(get_or_compute('value', lambda: 'новое', 60), 'новое')
+        self.assertLess(time.time() - started, 1)
+
+    def test_local_cache_evicts_and_expires(self):
+        """Локальный кеш вытесняет давно не читанное и устаревшее."""
+        local = LocalCache(max_size=2)
+        local.set_many({1: 'один', 2: 'два'}, 60)
+        local.get_many([1])
+        local.set_many({3: 'три'}, 60)
+        self.assertEqual(local.get_many([1, 2, 3]), {1: 'один', 3: 'три'})
+        local.set_many({4: 'четыре'}, -1)
+        self.assertEqual(local.get_many([4]), {})
+
+
+class ContentAddressedStorageTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.storage = ContentAddressedStorage(location=directory)
+
+    def test_same_content_stored_once(self):
+        """Одинаковое содержимое сохраняется одним файлом по хешу."""
+        first = self.storage.save('posts/a.GIF', ContentFile(b'gif'))
+        second = self.storage.save('posts/b.gif', ContentFile(b'gif'))
+        other = self.storage.save('posts/c.gif', ContentFile(b'png'))
+        digest = hashlib.sha256(b'gif').hexdigest()
+        self.assertEqual(first, f'posts/{digest[:2]}/{digest}.gif')
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertEqual(
+            self.storage.listdir(f'posts/{digest[:2]}'), ([], [first[9:]])
+        )
+
+    def test_same_content_refreshes_date(self):
+        """Повторная загрузка обновляет дату файла для сборки мусора."""
+        name = self.storage.save('posts/a.gif', ContentFile(b'gif'))
+        os.utime(self.storage.path(name), (0, 0))
+        self.storage.save('posts/b.gif', ContentFile(b'gif'))
+        self.assertGreater(os.path.getmtime(self.storage.path(name)), 0)
+
+
+class StaticFilesTest(SimpleTestCase):
+    def setUp(self):
+        source, root = tempfile.mkdtemp(), tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source)
+        self.addCleanup(shutil.rmtree, root)
+        os.mkdir(os.path.join(source, 'css'))
+        with open(os.path.join(source, 'css', 'site.css'), 'w') as file:
+            file.write('body { color: black; }\n' * 100)
+        static_settings = self.settings(
+            STATICFILES_DIRS=[source], STATIC_ROOT=root
+        )
+        static_settings.enable()
+        self.addCleanup(static_settings.disable)
+        self.root = root
+
+    def test_collectstatic_hashes_and_compresses(self):
+        """collectstatic хеширует имена и кладёт рядом сжатые копии."""
+        self.assertEqual(
+            staticfiles_storage.url('css/site.css'), '/static/css/site.css'
+        )
+        call_command('collectstatic', interactive=False, verbosity=0)
+        url = staticfiles_storage.url('css/site.css')
+        self.assertRegex(url, r'^/static/css/site\.[0-9a-f]{12}\.css$')
+        name = os.path.join(self.root, url[len('/static/'):])
+        with open(name, 'rb') as file, open(name + '.gz', 'rb') as packed:
+            self.assertEqual(gzip.decompress(packed.read()), file.read())
+
+
+class FileServingTest(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        static, media = os.path.join(root, 's'), os.path.join(root, 'm')
+        os.makedirs(os.path.join(static, 'css'))
+        os.makedirs(os.path.join(media, 'posts'))
+        self.css = b'body { color: black; }\n' * 100
+        self.css_name = 'css/site.0123456789ab.css'
+        with open(os.path.join(static, self.css_name), 'wb') as file:
+            file.write(self.css)
+        with open(os.path.join(static, self.css_name + '.gz'), 'wb') as file:
+            file.write(gzip.compress(self.css))
+        for name in ('posts/photo.jpg', 'posts/.upload'):
+            with open(os.path.join(media, name), 'wb') as file:
+                file.write(b'0123456789')
+        with self.settings(
+            STATIC_ROOT=static, MEDIA_ROOT=media, FILES_MAX_AGE=60
+        ):
+            self.application = FileServingMiddleware(self.django)
+
+    def django(self, environ, start_response):
+        start_response('404 Not Found', [])
+        return [b'django']
+
+    def get(self, path, method='GET', **headers):
+        response = {}
+
+        def start_response(status, headers):
+            response['status'] = int(status.split()[0])
+            response.update(headers)
+
+        environ = {
+            'REQUEST_METHOD': method, 'PATH_INFO': path,
+            'wsgi.input': BytesIO(),
+        }
+        environ.update(headers)
+        body = self.application(environ, start_response)
+        response['body'] = b''.join(body)
+        getattr(body, 'close', lambda: None)()
+        return response
+
+    def test_static_with_compression(self):
+        """Хешированная статика кешируется навсегда, сжатая копия — по
+        Accept-Encoding."""
+        url = '/static/' + self.css_name
+        plain = self.get(url)
+        self.assertEqual(plain['status'], 200)
+        self.assertEqual(plain['body'], self.css)
+        self.assertEqual(plain['Content-Type'], 'text/css')
+        self.assertIn('immutable', plain['Cache-Control'])
+        self.assertEqual(plain['Vary'], 'Accept-Encoding')
+        packed = self.get(url, HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        self.assertEqual(packed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(packed['body']), self.css)
+        self.assertNotEqual(packed['ETag'], plain['ETag'])
+
+    def test_conditional_requests(self):
+        response = self.get('/media/posts/photo.jpg')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        self.assertNotIn('Vary', response)
+        for headers in (
+            {'HTTP_IF_NONE_MATCH': response['ETag']},
+            {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']},
+        ):
+            with self.subTest(headers=headers):
+                cached = self.get('/media/posts/photo.jpg', **headers)
+                self.assertEqual(cached['status'], 304)
+                self.assertEqual(cached['body'], b'')
+
+    def test_ranges(self):
+        url = '/media/posts/photo.jpg'
+        cases = (
+            ('bytes=2-4', 206, b'234', 'bytes 2-4/10'),
+            ('bytes=7-', 206, b'789', 'bytes 7-9/10'),
+            ('bytes=-2', 206, b'89', 'bytes 8-9/10'),
+            ('bytes=0-1,4-5', 200, b'0123456789', None),
+            ('bytes=10-', 416, b'', 'bytes */10'),
+        )
+        for header, status, body, content_range in cases:
+            with self.subTest(header=header):
+                response = self.get(url, HTTP_RANGE=header)
+                self.assertEqual(response['status'], status)
+                self.assertEqual(response['body'], body)
+                self.assertEqual(response.get('Content-Range'), content_range)
+        stale = self.get(url, HTTP_RANGE='bytes=2-4', HTTP_IF_RANGE='"old"')
+        self.assertEqual(stale['status'], 200)
+        head = self.get(url, method='HEAD')
+        self.assertEqual(head['Content-Length'], '10')
+        self.assertEqual(head['body'], b'')
+
+    def test_passes_other_requests_to_django(self):
+        """Скрытые файлы, выход из каталога и прочие пути уходят в Django."""
+        for path, method in (
+            ('/media/posts/.upload', 'GET'),
+            ('/media/posts/../posts/photo.jpg', 'GET'),
+            ('/media/posts/missing.jpg', 'GET'),
+            ('/media/posts/photo.jpg', 'POST'),
+            ('/posts/1/', 'GET'),
+        ):
+            with self.subTest(path=path, method=method):
+                self.assertEqual(
+                    self.get(path, method)['body'], b'django'
+                )
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Настройки SQLite')
+class SQLiteSettingsTest(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied(self):
+        """PRAGMA из настроек применяются к каждому соединению."""
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('cache_size'), -64 * 1024)
+        self.assertEqual(self.pragma('temp_store'), 2)
+
+
+POSTGRES_URL = os.getenv('YATUBE_TEST_POSTGRES_URL')
+
+
+@skipUnless(POSTGRES_URL, 'YATUBE_TEST_POSTGRES_URL не задан')
+class PostgresPoolTest(SimpleTestCase):
+    def make_wrapper(self, **options):
+        from urllib.parse import urlsplit
+
+        from .db_backends.postgresql.base import DatabaseWrapper
+
+        url = urlsplit(POSTGRES_URL)
+        return DatabaseWrapper({
+            'ENGINE': 'core.db_backends.postgresql',
+            'NAME': url.path.lstrip('/'),
+            'USER': url.username or '',
+            'PASSWORD': url.password or '',
+            'HOST': url.hostname or '',
+            'PORT': url.port or '',
+            'CONN_MAX_AGE': 0,
+            'AUTOCOMMIT': True,
+            'ATOMIC_REQUESTS': False,
+            'TIME_ZONE': None,
+            'OPTIONS': {'pool_size': 2, **options},
+        })
+
+    def test_connections_are_reused(self):
+        """Закрытое соединение возвращается в пул и выдаётся снова."""
+        wrapper = self.make_wrapper()
+        wrapper.ensure_connection()
+        first = wrapper.connection
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        wrapper.close()
+        wrapper.ensure_connection()
+        self.assertIs(wrapper.connection, first)
+        wrapper.close()
+
+    def test_exhausted_pool_waits(self):
+        """Когда пул занят, новое соединение ждёт таймаут и получает
+        ошибку базы, а освободившееся соединение выдаётся снова."""
+        wrappers = [self.make_wrapper(pool_timeout=1) for _ in range(3)]
+        wrappers[0].ensure_connection()
+        wrappers[1].ensure_connection()
+        with self.assertRaises(OperationalError):
+            wrappers[2].ensure_connection()
+        wrappers[0].close()
+        wrappers[2].ensure_connection()
+        wrappers[1].close()
+        wrappers[2].close()
+
+
+@page_cache.anonymous_page_cache
+def tagged_view(request):
+    tagged_view.calls += 1
+    tagged_view.during()
+    page_cache.add_surrogate_keys(request, 'post-1', 'index')
+    response = HttpResponse(f'Страница {tagged_view.calls}')
+    if 'cookie' in request.GET:
+        response.set_cookie('seen', '1')
+    return response
+
+
+class PageCacheTest(SimpleTestCase):
+    databases = {'default'}
+
+    def setUp(self):
+        cache.clear()
+        tagged_view.calls = 0
+        tagged_view.during = lambda: None
+        self.factory = RequestFactory()
+
+    def get(self, path='/page/', user=None):
+        request = self.factory.get(path)
+        request.user = user or mock.Mock(is_authenticated=False)
+        return tagged_view(request)
+
+    def test_hit_until_purged(self):
+        """Страница отдаётся из кеша, пока не сброшен один из её ключей."""
+        first = self.get()
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(first['Surrogate-Key'], 'index post-1')
+        second = self.get()
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+        page_cache.purge('post-2')
+        self.assertEqual(self.get()['X-Cache'], 'HIT')
+        page_cache.purge('post-1')
+        self.assertEqual(self.get().content.decode(), 'Страница 2')
+
+    def test_authenticated_and_cookies_bypass(self):
+        """Пользователи и ответы с cookies мимо кеша."""
+        self.get(user=mock.Mock(is_authenticated=True))
+        self.get(user=mock.Mock(is_authenticated=True))
+        self.get('/page/?cookie=1')
+        self.get('/page/?cookie=1')
+        self.assertEqual(tagged_view.calls, 4)
+
+    def test_purge_during_render_not_cached(self):
+        """Страница, во время рисования которой сбросили её ключ, не
+        кешируется."""
+        tagged_view.during = lambda: page_cache.purge('index')
+        self.get()
+        tagged_view.during = lambda: None
+        self.assertEqual(self.get()['X-Cache'], 'MISS')
+        self.assertEqual(self.get()['X-Cache'], 'HIT')
+
+    @override_settings(SURROGATE_PURGE_URL='http://proxy.local/')
+    def test_purge_notifies_proxy(self):
+        """Ключи транзакции уходят в прокси одним запросом PURGE из
+        фонового потока."""
+        with mock.patch('urllib.request.urlopen') as urlopen:
+            with transaction.atomic():
+                page_cache.purge('post-1', 'index')
+                page_cache.purge('post-2')
+            page_cache.drain()
+        self.assertEqual(urlopen.call_count, 1)
+        request = urlopen.call_args[0][0]
+        self.assertEqual(request.get_method(), 'PURGE')
+        self.assertEqual(
+            request.get_header('Surrogate-key'), 'index post-1 post-2'
+        )
+
+
+class ProfilingMiddlewareTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        profiling_settings = override_settings(
+            PROFILING_DIR=directory, PROFILING_FLUSH_EVERY=1
+        )
+        profiling_settings.enable()
+        self.addCleanup(profiling_settings.disable)
+
+    def test_server_timing_header(self):
+        """Ответ содержит метрики запроса в заголовке Server-Timing."""
+        response = self.client.get('/')
+        self.assertRegex(
+            response['Server-Timing'], r'sql;dur=[\d.]+;desc="\d+ queries"'
+        )
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+        self.assertNotIn('X-Query-Budget', response)
+
+    @override_settings(QUERY_BUDGETS={'posts:index': 0})
+    def test_query_budget_exceeded(self):
+        """Превышение бюджета запросов отмечается в ответе."""
+        with self.assertLogs('yatube.profiling', 'WARNING'):
+            response = self.client.get('/')
+        self.assertIn('X-Query-Budget', response)
+
+    def test_profiling_report(self):
+        """Команда profiling_report сводит метрики по представлениям."""
+        profiling.reset()
+        self.client.get('/')
+        self.client.get('/')
+        out = StringIO()
+        call_command('profiling_report', json=True, stdout=out)
+        stats = json.loads(out.getvalue())
+        self.assertEqual(stats['posts:index']['requests'], 2)
+        self.assertEqual(sum(stats['posts:index']['latency']), 2)
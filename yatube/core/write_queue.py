@@ -0,0 +1,112 @@
+"""Надёжная локальная очередь записей в отдельном файле SQLite.
+
+Постановка в очередь — короткая вставка в собственный WAL-файл, она не
+берёт блокировку основной базы, поэтому веб-воркеры не ждут друг друга.
+Разборщик забирает записи пачками и удаляет применённые; неудачные
+остаются в файле с текстом ошибки. Каждая запись помнит владельца
+(ключ сессии), чтобы автор видел свои ещё не применённые записи.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS writes ('
+    'id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL UNIQUE, '
+    'kind TEXT NOT NULL, owner TEXT NOT NULL, payload TEXT NOT NULL, '
+    'created REAL NOT NULL, error TEXT)',
+    'CREATE INDEX IF NOT EXISTS writes_owner ON writes (owner, kind)',
+)
+
+Write = namedtuple('Write', 'id key kind payload created')
+
+_queues = {}
+_lock = threading.Lock()
+
+
+class WriteQueue:
+    def __init__(self, path):
+        self._path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(
+                self._path, timeout=5, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=FULL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            local.connection, local.pid = connection, os.getpid()
+        return local.connection
+
+    def put(self, kind, owner, payload):
+        key = uuid.uuid4().hex
+        self._connection().execute(
+            'INSERT INTO writes (key, kind, owner, payload, created) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (key, kind, owner, json.dumps(payload), time.time()),
+        )
+        return key
+
+    def take(self, limit):
+        rows = self._connection().execute(
+            'SELECT id, key, kind, payload, created FROM writes '
+            'WHERE error IS NULL ORDER BY id LIMIT ?',
+            (limit,),
+        )
+        return [
+            Write(id, key, kind, json.loads(payload), created)
+            for id, key, kind, payload, created in rows
+        ]
+
+    def pending(self, owner, kind):
+        """Ещё не применённые записи владельца, от старых к новым."""
+        rows = self._connection().execute(
+            'SELECT id, key, kind, payload, created FROM writes '
+            'WHERE owner = ? AND kind = ? AND error IS NULL ORDER BY id',
+            (owner, kind),
+        )
+        return [
+            Write(id, key, kind, json.loads(payload), created)
+            for id, key, kind, payload, created in rows
+        ]
+
+    def payloads(self, kind):
+        """Данные всех записей вида kind, включая неудачные."""
+        rows = self._connection().execute(
+            'SELECT payload FROM writes WHERE kind = ?', (kind,)
+        )
+        return [json.loads(payload) for payload, in rows]
+
+    def done(self, ids):
+        self._connection().executemany(
+            'DELETE FROM writes WHERE id = ?', [(id,) for id in ids]
+        )
+
+    def fail(self, id, error):
+        self._connection().execute(
+            'UPDATE writes SET error = ? WHERE id = ?', (error, id)
+        )
+
+    def counts(self):
+        """Число ожидающих и неудачных записей."""
+        return self._connection().execute(
+            'SELECT count(*) - count(error), count(error) FROM writes'
+        ).fetchone()
+
+
+def get_queue():
+    path = settings.WRITE_QUEUE_PATH
+    with _lock:
+        if path not in _queues:
+            _queues[path] = WriteQueue(path)
+        return _queues[path]
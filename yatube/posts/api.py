@@ -0,0 +1,236 @@
+"""JSON API лент только для чтения.
+
+Строки выбираются через values_list() без создания моделей и
+сериализуются по одной; страницы больше API_STREAM_THRESHOLD отдаются
+потоком. Параметр fields выбирает поля через запятую, limit — размер
+страницы, cursor — продолжение ленты из поля next предыдущего ответа.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_safe
+
+from core.db_router import read_from_replica
+from . import export
+from .feeds import FollowFeed
+from .models import Comment, Group, Post, User
+from .utils import decode_cursor, keyset, make_cursor
+
+CONTENT_TYPE = 'application/json'
+
+
+def image_url(name):
+    return default_storage.url(name) if name else None
+
+
+# Имя поля в ответе: (поле для values_list, преобразование значения).
+POST_FIELDS = {
+    'id': ('id', None),
+    'text': ('text', None),
+    'pub_date': ('pub_date', None),
+    'author': ('author__username', None),
+    'group': ('group__slug', None),
+    'image': ('image', image_url),
+    'comments_count': ('comments_count', None),
+}
+COMMENT_FIELDS = {
+    'id': ('id', None),
+    'text': ('text', None),
+    'created': ('created', None),
+    'author': ('author__username', None),
+}
+
+encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def json_response(data, status=200):
+    return HttpResponse(
+        encoder.encode(data), content_type=CONTENT_TYPE, status=status
+    )
+
+
+def api_view(view):
+    @require_safe
+    @read_from_replica
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as error:
+            return json_response({'error': error.message}, error.status)
+    return wrapper
+
+
+def selected_fields(request, available):
+    names = [
+        name.strip()
+        for name in request.GET.get('fields', '').split(',')
+        if name.strip()
+    ]
+    unknown = set(names) - set(available)
+    if unknown:
+        raise ApiError('Неизвестные поля: ' + ', '.join(sorted(unknown)))
+    return names or list(available)
+
+
+def page_size(request):
+    try:
+        size = int(request.GET.get('limit', settings.API_PAGE_SIZE))
+    except ValueError:
+        raise ApiError('limit должен быть числом')
+    return max(1, min(size, settings.API_MAX_PAGE_SIZE))
+
+
+def build_row(names, available, row):
+    data = {}
+    for name, value in zip(names, row):
+        convert = available[name][1]
+        data[name] = convert(value) if convert else value
+    return data
+
+
+def serialize(rows, names, available, size):
+    """Отдаёт ответ по кускам; последние два столбца строки — ключ
+    курсора (дата, id)."""
+    yield '{"results":['
+    has_more = False
+    for number, row in enumerate(rows.iterator()):
+        if number == size:
+            has_more = True
+            break
+        yield (',' if number else '') + encoder.encode(
+            build_row(names, available, row)
+        )
+        last = row
+    yield '],"next":{}}}'.format(encoder.encode(
+        make_cursor(*last[-2:]) if has_more else None
+    ))
+
+
+def cursor_position(request):
+    cursor = request.GET.get('cursor')
+    if not cursor:
+        return None
+    position = decode_cursor(cursor)
+    if position is None or position[2]:
+        raise ApiError('Неверный курсор')
+    return position
+
+
+def feed_response(request, queryset, available, field='pub_date'):
+    names = selected_fields(request, available)
+    size = page_size(request)
+    queryset = keyset(queryset, cursor_position(request), field)
+    # База выбирается сразу: поток читается уже после выхода из
+    # представления, где маршрутизатор не знает о репликах.
+    rows = queryset.using(router.db_for_read(queryset.model)).values_list(
+        *(available[name][0] for name in names), field, 'pk'
+    )[:size + 1]
+    chunks = serialize(rows, names, available, size)
+    if size > settings.API_STREAM_THRESHOLD:
+        return StreamingHttpResponse(chunks, content_type=CONTENT_TYPE)
+    return HttpResponse(''.join(chunks), content_type=CONTENT_TYPE)
+
+
+def get_pk(queryset, message):
+    pk = queryset.values_list('pk', flat=True).first()
+    if pk is None:
+        raise ApiError(message, 404)
+    return pk
+
+
+@api_view
+def index(request):
+    return feed_response(request, Post.objects.all(), POST_FIELDS)
+
+
+@api_view
+def group_posts(request, slug):
+    group_id = get_pk(Group.objects.filter(slug=slug), 'Группа не найдена')
+    return feed_response(
+        request, Post.objects.filter(group_id=group_id), POST_FIELDS
+    )
+
+
+@api_view
+def profile(request, username):
+    author_id = get_pk(
+        User.objects.filter(username=username), 'Автор не найден'
+    )
+    return feed_response(
+        request, Post.objects.filter(author_id=author_id), POST_FIELDS
+    )
+
+
+@api_view
+def follow_index(request):
+    if not request.user.is_authenticated:
+        raise ApiError('Нужно войти на сайт', 401)
+    rows = FollowFeed(request.user).rows(
+        cursor_position(request), page_size(request) + 1
+    )
+    return feed_response(
+        request, Post.objects.filter(pk__in=[pk for _, pk in rows]),
+        POST_FIELDS,
+    )
+
+
+@api_view
+def export_data(request, kind):
+    """Выгрузка таблицы для сотрудников; after продолжает её с id."""
+    if not request.user.is_authenticated:
+        raise ApiError('Нужно войти на сайт', 401)
+    if not request.user.is_staff:
+        raise ApiError('Выгрузка доступна только сотрудникам', 403)
+    if kind not in export.TABLES:
+        raise ApiError('Неизвестная таблица', 404)
+    file_format = request.GET.get('format', 'jsonl')
+    if file_format not in export.FORMATS:
+        raise ApiError('Неизвестный формат')
+    try:
+        after = int(request.GET.get('after', 0))
+    except ValueError:
+        raise ApiError('after должен быть числом')
+    content_type, extension = export.FORMATS[file_format]
+    using = router.db_for_read(export.TABLES[kind][0])
+    response = StreamingHttpResponse(
+        export.stream(kind, file_format, after, using=using),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{kind}.{extension}"'
+    )
+    return response
+
+
+@api_view
+def post_detail(request, post_id):
+    names = selected_fields(request, POST_FIELDS)
+    row = Post.objects.filter(pk=post_id).values_list(
+        *(POST_FIELDS[name][0] for name in names)
+    ).first()
+    if row is None:
+        raise ApiError('Пост не найден', 404)
+    return json_response(build_row(names, POST_FIELDS, row))
+
+
+@api_view
+def post_comments(request, post_id):
+    post_id = get_pk(Post.objects.filter(pk=post_id), 'Пост не найден')
+    return feed_response(
+        request,
+        Comment.objects.filter(post_id=post_id),
+        COMMENT_FIELDS,
+        field='created',
+    )
@@ -0,0 +1,127 @@
+"""Условные GET-запросы для лент и страницы поста.
+
+Для каждой области — вся лента, группа, профиль, пост — в кеше хранится
+время её последнего изменения, сигналы обновляют его при правках. Из этих
+отметок, времени правки поста и пользователя собираются ETag и
+Last-Modified, так что ответ 304 обходится без рендеринга страницы.
+ETag учитывает пользователя, а Last-Modified отдаётся только анонимам:
+дата не знает о входе на сайт, и после него браузер получил бы 304 со
+страницей анонима.
+Вытесненная из кеша отметка создаётся заново текущим временем: клиент
+лишь один раз получит полный ответ.
+"""
+import hashlib
+import time
+from contextlib import nullcontext
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers,
+)
+from django.utils.http import http_date, quote_etag
+
+from core import db_router
+
+SITE = 'site'
+INDEX = 'index'
+STAMP_PREFIX = 'stamp:'
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def profile_scope(user_id):
+    return f'profile:{user_id}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def post_scopes(post, *group_ids):
+    """Области, где виден пост: лента, его группа, профиль и сам пост."""
+    group_ids = {post.group_id, *group_ids} - {None}
+    return (
+        INDEX,
+        profile_scope(post.author_id),
+        post_scope(post.pk),
+        *map(group_scope, group_ids),
+    )
+
+
+def _touch(scopes):
+    now = time.time()
+    cache.set_many({STAMP_PREFIX + scope: now for scope in scopes}, None)
+
+
+def touch(*scopes):
+    """Отмечает изменение областей сейчас и ещё раз после коммита, чтобы
+    параллельный запрос не закрепил старую страницу за новым ETag."""
+    _touch(scopes)
+    transaction.on_commit(lambda: _touch(scopes))
+
+
+def stamps(scopes):
+    keys = [STAMP_PREFIX + scope for scope in scopes]
+    found = cache.get_many(keys)
+    missing = {key: time.time() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+    return [found.get(key) or missing[key] for key in keys]
+
+
+def rendering_source(modified):
+    """Недавно изменённая страница рисуется по основной базе: реплика
+    могла не догнать правку, а ответ получит уже новый ETag."""
+    if time.time() - modified < settings.REPLICA_MAX_LAG:
+        return db_router.primary()
+    return nullcontext()
+
+
+def condition(state):
+    """Отвечает 304 Not Modified, если страница не менялась.
+
+    state(*args, **kwargs) возвращает области страницы и время правки
+    самого объекта (или 0) либо None, если объекта нет — тогда
+    представление отрабатывает как обычно.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            found = state(*args, **kwargs)
+            if found is None:
+                return view(request, *args, **kwargs)
+            scopes, updated = found
+            values = stamps((SITE, *scopes))
+            modified = max(values + [updated])
+            anonymous = not request.user.is_authenticated
+            etag = quote_etag(hashlib.md5(repr(
+                (values, updated, request.user.pk)
+            ).encode()).hexdigest())
+            response = get_conditional_response(
+                request, etag=etag,
+                last_modified=int(modified) if anonymous else None,
+            )
+            if response is None:
+                with rendering_source(modified):
+                    response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                response['ETag'] = etag
+                if anonymous:
+                    response['Last-Modified'] = http_date(modified)
+            patch_vary_headers(response, ('Cookie',))
+            patch_cache_control(
+                response,
+                no_cache=True,
+                private=not anonymous,
+            )
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,72 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Counters, Follow, Post, User
+
+
+def _count(model, field):
+    return Coalesce(Subquery(
+        model.objects
+        .filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    ), 0)
+
+
+def with_counts(users):
+    return users.annotate(
+        real_posts_count=_count(Post, 'author'),
+        real_followers_count=_count(Follow, 'author'),
+        real_following_count=_count(Follow, 'user'),
+    )
+
+
+def recount(user_id):
+    user = with_counts(User.objects.filter(pk=user_id)).get()
+    counters, _ = Counters.objects.update_or_create(
+        user_id=user_id,
+        defaults={
+            'posts_count': user.real_posts_count,
+            'followers_count': user.real_followers_count,
+            'following_count': user.real_following_count,
+        },
+    )
+    return counters
+
+
+def counters_for(user):
+    try:
+        return user.counters
+    except Counters.DoesNotExist:
+        return recount(user.pk)
+
+
+def bump(user_id, field, delta):
+    """Сдвигает счётчик пользователя в текущей транзакции.
+
+    Строка счётчиков создаётся пересчётом только при увеличении:
+    при каскадном удалении пользователя её создавать нельзя.
+    """
+    counters = Counters.objects.filter(user_id=user_id)
+    if delta < 0:
+        counters = counters.filter(**{f'{field}__gte': -delta})
+    updated = counters.update(**{field: F(field) + delta})
+    if not updated and delta > 0:
+        recount(user_id)
+
+
+def bump_comments(post_id, delta):
+    posts = Post.objects.filter(pk=post_id)
+    if delta < 0:
+        posts = posts.filter(comments_count__gte=-delta)
+    posts.update(
+        comments_count=F('comments_count') + delta
+    )
+
+
+def comments_drift():
+    return Post.objects.annotate(
+        real_comments_count=_count(Comment, 'post')
+    ).exclude(comments_count=F('real_comments_count'))
@@ -0,0 +1,92 @@
+"""Потоковая выгрузка постов, комментариев, подписок и групп.
+
+Строки читаются пачками по возрастанию id: каждая пачка — отдельный
+короткий запрос с условием id > последнего выгруженного, поэтому память
+не растёт с размером таблицы, а долгая транзакция не мешает записи.
+Продолжить выгрузку можно с любого id: он первым полем есть в каждой
+строке, а в формате columns — в last_id каждой пачки.
+"""
+import csv
+import io
+from datetime import datetime
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Comment, Follow, Group, Post
+
+TABLES = {
+    'posts': (Post, (
+        'id', 'text', 'pub_date', 'updated', 'author_id', 'group_id',
+        'image', 'comments_count',
+    )),
+    'comments': (Comment, ('id', 'post_id', 'author_id', 'text', 'created')),
+    'follows': (Follow, ('id', 'user_id', 'author_id')),
+    'groups': (Group, ('id', 'title', 'slug', 'description')),
+}
+# Формат: (тип содержимого, расширение файла). columns — JSON Lines, где
+# каждая строка — пачка в виде столбцов {"поле": [значения]}.
+FORMATS = {
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'columns': ('application/x-ndjson', 'columns.jsonl'),
+}
+
+encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def scan(kind, after=0, batch_size=None, using=None):
+    """Пачки строк таблицы с id больше after."""
+    model, fields = TABLES[kind]
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    while True:
+        rows = list(
+            model.objects.using(using).filter(pk__gt=after).order_by('pk')
+            .values_list(*fields)[:batch_size]
+            .iterator(chunk_size=batch_size)
+        )
+        if not rows:
+            return
+        yield rows
+        after = rows[-1][0]
+
+
+def csv_header(kind):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(TABLES[kind][1])
+    return buffer.getvalue()
+
+
+def format_batch(kind, file_format, rows):
+    fields = TABLES[kind][1]
+    if file_format == 'jsonl':
+        return ''.join(
+            encoder.encode(dict(zip(fields, row))) + '\n' for row in rows
+        )
+    if file_format == 'columns':
+        return encoder.encode({
+            'columns': dict(zip(fields, map(list, zip(*rows)))),
+            'last_id': rows[-1][0],
+        }) + '\n'
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        [
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in row
+        ]
+        for row in rows
+    )
+    return buffer.getvalue()
+
+
+def stream(kind, file_format, after=0, batch_size=None, using=None):
+    """Выгрузка по кускам, по одному на пачку; заголовок CSV выводится
+    только в начале, а не при продолжении.
+
+    using нужно выбрать заранее: потоковый ответ читается уже после
+    выхода из представления, где маршрутизатор не знает о репликах.
+    """
+    if file_format == 'csv' and not after:
+        yield csv_header(kind)
+    for rows in scan(kind, after, batch_size, using):
+        yield format_batch(kind, file_format, rows)
@@ -0,0 +1,154 @@
+"""Ленты подписок.
+
+Посты обычных авторов раскладываются по лентам подписчиков при
+публикации (FeedEntry с копией даты поста), и лента читается диапазоном
+по индексу (user, -pub_date, -post). Посты популярных авторов
+(Counters.hot) не раскладываются, а подмешиваются при чтении. Флаг
+ставит и снимает команда update_hot_authors; автору, который перестал
+быть популярным, она дозаполняет ленты подписчиков.
+"""
+import heapq
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from core.caching import Namespace, get_or_compute
+from .models import Counters, FeedEntry, Follow, Post
+from .utils import keyset
+
+FEED_CACHE = Namespace('feed')
+
+
+def hot_authors():
+    """Авторы, чьи посты не раскладываются по лентам подписчиков."""
+    return get_or_compute(
+        FEED_CACHE.key('hot_authors'),
+        lambda: set(
+            Counters.objects.filter(hot=True).values_list('user', flat=True)
+        ),
+        settings.FEED_HOT_AUTHORS_TIMEOUT,
+    )
+
+
+def forget_hot_authors():
+    cache.delete(FEED_CACHE.key('hot_authors'))
+
+
+def copy_posts(condition, params):
+    """Раскладывает посты авторов по лентам их подписчиков одним
+    INSERT ... SELECT; condition отбирает строки подписок f и постов p."""
+    connection = connections[router.db_for_write(FeedEntry)]
+    ops = connection.ops
+    with connection.cursor() as cursor:
+        cursor.execute(
+            '{insert} {entry} (user_id, post_id, pub_date) '
+            'SELECT f.user_id, p.id, p.pub_date '
+            'FROM {follow} f JOIN {post} p ON p.author_id = f.author_id '
+            'WHERE {condition} {suffix}'.format(
+                insert=ops.insert_statement(ignore_conflicts=True),
+                entry=ops.quote_name(FeedEntry._meta.db_table),
+                follow=ops.quote_name(Follow._meta.db_table),
+                post=ops.quote_name(Post._meta.db_table),
+                condition=condition,
+                suffix=ops.ignore_conflicts_suffix_sql(ignore_conflicts=True),
+            ),
+            params,
+        )
+
+
+def fan_out(post):
+    if post.author_id not in hot_authors():
+        copy_posts('p.id = %s', [post.pk])
+
+
+def backfill(user_id, author_id):
+    if author_id not in hot_authors():
+        copy_posts('f.user_id = %s AND f.author_id = %s', [user_id, author_id])
+
+
+def prune(user_id, author_id):
+    FeedEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+class FollowFeed:
+    """Лента подписок пользователя по ключу (дата, id).
+
+    rows() берёт страницу записей ленты по индексу и столько же свежих
+    постов популярных авторов из подписок и сливает их; queryset нужен
+    для нумерованных страниц и подсчёта.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def hot_following(self):
+        authors = hot_authors()
+        if not authors:
+            return []
+        return list(Follow.objects.filter(
+            user=self.user, author__in=authors
+        ).values_list('author', flat=True))
+
+    @property
+    def queryset(self):
+        condition = Q(pk__in=FeedEntry.objects.filter(
+            user=self.user
+        ).values('post'))
+        if self.hot_following:
+            condition |= Q(author__in=self.hot_following)
+        return Post.objects.filter(condition)
+
+    def rows(self, position, limit):
+        """До limit пар (дата, id) после курсора: для курсора назад —
+        по возрастанию, иначе по убыванию."""
+        sources = [keyset(
+            FeedEntry.objects.filter(user=self.user), position, pk='post_id'
+        ).values_list('pub_date', 'post_id')[:limit]]
+        if self.hot_following:
+            sources.append(keyset(
+                Post.objects.filter(author__in=self.hot_following), position
+            ).values_list('pub_date', 'pk')[:limit])
+        backwards = position is not None and position[2]
+        rows, seen = [], set()
+        # Пост автора, ставшего популярным, может быть и в ленте.
+        for row in heapq.merge(*map(list, sources), reverse=not backwards):
+            if row[1] not in seen:
+                seen.add(row[1])
+                rows.append(row)
+        return rows[:limit]
+
+    def hydrate(self, pks):
+        posts = Post.objects.in_bulk(pks)
+        return [posts[pk] for pk in pks if pk in posts]
+
+
+def rebuild(batch_size=1000):
+    """Заполняет ленты подписок заново, например после массовой загрузки,
+    при которой сигналы не отправляются: по одному INSERT ... SELECT на
+    batch_size подписок."""
+    FeedEntry.objects.all().delete()
+    authors = list(
+        Counters.objects.filter(hot=True).values_list('user', flat=True)
+    )
+    excluded = ''
+    if authors:
+        excluded = ' AND f.author_id NOT IN ({})'.format(
+            ', '.join(['%s'] * len(authors))
+        )
+    last = 0
+    while True:
+        pks = list(Follow.objects.filter(pk__gt=last).order_by(
+            'pk'
+        ).values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return
+        copy_posts(
+            'f.id > %s AND f.id <= %s' + excluded, [last, pks[-1], *authors]
+        )
+        last = pks[-1]
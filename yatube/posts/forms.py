@@ -1,5 +1,6 @@
 from django import forms
 
+from . import images
 from .models import Post, Comment
 
 
@@ -14,6 +15,13 @@ class PostForm(forms.ModelForm):
             'group': 'Группа, к которой будет относиться пост'
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        # У нового файла ImageField оставляет открытую Pillow картинку.
+        if image and getattr(image, 'image', None) is not None:
+            images.validate_upload(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
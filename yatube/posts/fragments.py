@@ -0,0 +1,83 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from core.caching import Namespace
+from core.profiling import record_cache
+from .models import Post
+from .thumbnails import attach_thumbnails
+
+FRAGMENT_CACHE = Namespace('fragments')
+FRAGMENT_TEMPLATE = 'posts/includes/post_fragment.html'
+VARIANTS = ('00', '01', '10', '11')
+
+
+def related_state(post):
+    """Хеш того, что фрагмент показывает об авторе и группе.
+
+    Авторы и группы ленты берутся из памяти процесса и после правки в
+    другом процессе могут быть устаревшими до HYDRATION_TIMEOUT. С этим
+    хешем в ключе фрагмент со старым именем не достанется процессам,
+    которые уже видят правку.
+    """
+    author, group = post.author, post.group
+    state = (
+        author.username, author.first_name, author.last_name,
+        group and (group.slug, group.title),
+    )
+    return hashlib.md5(repr(state).encode()).hexdigest()[:12]
+
+
+def fragment_key(post, variant, prefix=None):
+    prefix = prefix or FRAGMENT_CACHE.key('post')
+    return '{}:{}:{}:{}:{}'.format(
+        prefix, post.pk, post.version, variant, related_state(post)
+    )
+
+
+def attach_fragments(posts, hide_author=False, hide_group=False):
+    """Проставляет постам отрендеренные фрагменты из кеша.
+
+    Недостающие фрагменты рендерятся и сохраняются одним set_many,
+    миниатюры для них загружаются одним запросом.
+    Кнопка редактирования зависит от пользователя и в кеш не попадает.
+    """
+    variant = '{:d}{:d}'.format(hide_author, hide_group)
+    prefix = FRAGMENT_CACHE.key('post')
+    keys = {fragment_key(post, variant, prefix): post for post in posts}
+    fragments = cache.get_many(keys)
+    record_cache(len(fragments), len(keys) - len(fragments))
+    attach_thumbnails(
+        post for key, post in keys.items() if key not in fragments
+    )
+    missing = {}
+    for key, post in keys.items():
+        if key not in fragments:
+            fragments[key] = missing[key] = render_to_string(
+                FRAGMENT_TEMPLATE,
+                {
+                    'post': post,
+                    'hide_author': hide_author,
+                    'hide_group': hide_group,
+                },
+            )
+        post.fragment = mark_safe(fragments[key])
+    if missing:
+        cache.set_many(missing, settings.POST_FRAGMENT_TIMEOUT)
+
+
+def forget_fragments(post):
+    """Удаляет фрагменты поста, если его автор и группа уже загружены;
+    иначе фрагменты просто истекут."""
+    fields = [Post._meta.get_field('author')]
+    if post.group_id is not None:
+        fields.append(Post._meta.get_field('group'))
+    if not all(field.is_cached(post) for field in fields):
+        return
+    prefix = FRAGMENT_CACHE.key('post')
+    cache.delete_many(
+        [fragment_key(post, variant, prefix) for variant in VARIANTS]
+    )
@@ -0,0 +1,62 @@
+"""Сборка постов ленты без JOIN с авторами и группами.
+
+Посты загружаются из одной таблицы, а их авторы и группы — по
+уникальным id через in_bulk. Загруженные объекты лежат в памяти
+процесса HYDRATION_TIMEOUT секунд и общие для всех его запросов, так
+что частые авторы и группы не читаются заново на каждой странице.
+Правка автора или группы убирает их из памяти этого процесса, другие
+процессы увидят её по истечении срока.
+"""
+from django.conf import settings
+
+from core.caching import LocalCache
+from core.profiling import record_cache
+from .models import Group, User
+
+AUTHOR_FIELDS = ('username', 'first_name', 'last_name')
+
+AUTHORS = LocalCache(settings.HYDRATION_CACHE_SIZE)
+GROUPS = LocalCache(settings.HYDRATION_CACHE_SIZE)
+
+
+def cached_in_bulk(queryset, ids, local):
+    found = local.get_many(ids)
+    missing = set(ids) - found.keys()
+    record_cache(len(found), len(missing))
+    if missing:
+        loaded = queryset.in_bulk(missing)
+        local.set_many(loaded, settings.HYDRATION_TIMEOUT)
+        found.update(loaded)
+    return found
+
+
+def hydrate(posts):
+    """Проставляет постам авторов и группы и возвращает список постов.
+
+    Авторы загружаются без пароля и прочих полей, ненужных ленте.
+    """
+    posts = list(posts)
+    authors = cached_in_bulk(
+        User.objects.only(*AUTHOR_FIELDS),
+        {post.author_id for post in posts},
+        AUTHORS,
+    )
+    groups = cached_in_bulk(
+        Group.objects.all(),
+        {post.group_id for post in posts} - {None},
+        GROUPS,
+    )
+    for post in posts:
+        if post.author_id in authors:
+            post.author = authors[post.author_id]
+        if post.group_id is None or post.group_id in groups:
+            post.group = groups.get(post.group_id)
+    return posts
+
+
+def forget_author(author_id):
+    AUTHORS.delete(author_id)
+
+
+def forget_group(group_id):
+    GROUPS.delete(group_id)
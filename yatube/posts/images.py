@@ -0,0 +1,133 @@
+"""Обработка загруженных картинок постов.
+
+Форма отсекает файлы тяжелее POST_IMAGE_MAX_BYTES и с разрешением больше
+POST_IMAGE_MAX_PIXELS. После сохранения поста исходник поворачивается по
+EXIF, уменьшается до POST_IMAGE_MAX_SIZE по большей стороне и
+перекодируется без метаданных в JPEG и в форматы POST_IMAGE_FORMATS,
+которые поддерживает Pillow. Файлы называются по хешу содержимого,
+поэтому одинаковые картинки хранятся один раз. JPEG понимают все
+браузеры, и он становится картинкой поста; остальные форматы
+записываются как миниатюры 'original:<расширение>', из них делаются
+миниатюры для <picture>. Исходник, на который больше никто не ссылается,
+удаляет команда collect_media.
+"""
+import hashlib
+import logging
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .models import Post, Thumbnail
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_DIR = 'posts/r/'
+# Формат Pillow: (расширение, параметры сохранения).
+ENCODERS = {
+    'AVIF': ('avif', {'quality': 60}),
+    'WEBP': ('webp', {'quality': 80, 'method': 4}),
+    'JPEG': ('jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpg': 'image/jpeg'}
+
+
+def validate_upload(image):
+    """Проверяет размер файла и разрешение загруженной картинки."""
+    if image.size > settings.POST_IMAGE_MAX_BYTES:
+        raise ValidationError(
+            'Файл больше %(limit)s МБ.',
+            params={'limit': settings.POST_IMAGE_MAX_BYTES // 1024 // 1024},
+        )
+    width, height = image.image.size
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Разрешение картинки больше %(limit)s мегапикселей.',
+            params={'limit': settings.POST_IMAGE_MAX_PIXELS // 10 ** 6},
+        )
+
+
+def formats():
+    """JPEG и за ним поддерживаемые форматы из POST_IMAGE_FORMATS
+    по предпочтению."""
+    Image.init()
+    return ['JPEG'] + [
+        name for name in settings.POST_IMAGE_FORMATS
+        if name != 'JPEG' and name in ENCODERS and name in Image.SAVE
+    ]
+
+
+def alternatives():
+    """Форматы для <picture>: (формат Pillow, расширение) по
+    предпочтению."""
+    return [(name, ENCODERS[name][0]) for name in formats()[1:]]
+
+
+def prepare(file):
+    image = Image.open(file)
+    image = ImageOps.exif_transpose(image)
+    limit = settings.POST_IMAGE_MAX_SIZE
+    image.thumbnail((limit, limit), Image.LANCZOS)
+    if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+        return image.convert('RGBA')
+    return image.convert('RGB')
+
+
+def encode(image, file_format):
+    """Кодирует картинку без EXIF и прочих метаданных."""
+    extension, options = ENCODERS[file_format]
+    if file_format == 'JPEG' and image.mode == 'RGBA':
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, file_format, **options)
+    data = buffer.getvalue()
+    name = '{}{}.{}'.format(
+        RENDITIONS_DIR, hashlib.sha256(data).hexdigest()[:32], extension
+    )
+    return name, data
+
+
+def store(name, data):
+    if default_storage.exists(name):
+        return name
+    return default_storage.save(name, ContentFile(data))
+
+
+def process_post_image(post_id):
+    post = Post.objects.filter(pk=post_id).only('pk', 'image').first()
+    if (post is None or not post.image
+            or post.image.name.startswith(RENDITIONS_DIR)):
+        return
+    source = post.image.name
+    try:
+        with post.image.open('rb') as file:
+            image = prepare(file)
+    except (OSError, Image.DecompressionBombError):
+        logger.warning('Не удалось обработать картинку %s', source,
+                       exc_info=True)
+        return
+    names = [
+        store(*encode(image, file_format)) for file_format in formats()
+    ]
+    with transaction.atomic():
+        if not Post.objects.filter(pk=post_id, image=source).update(
+            image=names[0]
+        ):
+            return
+        for name in names[1:]:
+            Thumbnail.objects.update_or_create(
+                post_id=post_id,
+                name='original:' + name.rsplit('.', 1)[1],
+                defaults={
+                    'source': names[0],
+                    'url': default_storage.url(name),
+                    'width': image.width,
+                    'height': image.height,
+                },
+            )
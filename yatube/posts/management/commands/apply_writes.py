@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.write_queue import get_queue
+from posts.write_behind import apply_pending
+
+
+class Command(BaseCommand):
+    help = 'Применяет посты и комментарии из очереди отложенной записи.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Пауза между проверками пустой очереди, секунд.',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Разобрать очередь и завершиться.',
+        )
+
+    def handle(self, *args, batch_size, interval, once, **options):
+        total = errors = 0
+        while True:
+            applied, failed = apply_pending(batch_size)
+            total += applied
+            errors += failed
+            if applied or failed:
+                self.stdout.write(f'Применено {total}, ошибок {errors}')
+                continue
+            if once:
+                break
+            time.sleep(interval)
+        broken = get_queue().counts()[1]
+        self.stdout.write(self.style.SUCCESS(
+            f'Очередь разобрана: применено {total}, ошибок {errors}, '
+            f'всего неудачных записей в очереди {broken}'
+        ))
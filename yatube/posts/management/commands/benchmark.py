@@ -0,0 +1,124 @@
+import json
+import math
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from posts.models import Follow, Group, Post, User
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    index = max(0, math.ceil(share * len(ordered)) - 1)
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет основные страницы постов через тестовый клиент и '
+        'выводит задержки p50/p95/p99, число SQL-запросов и пропускную '
+        'способность в JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--output', help='Файл для JSON-отчёта.')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests должно быть больше нуля.')
+        scenarios = self.scenarios()
+        report = {
+            name: self.run(client, method, url, data, options)
+            for name, client, method, url, data in scenarios
+        }
+        result = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(result)
+        self.stdout.write(result)
+
+    def scenarios(self):
+        follow = Follow.objects.select_related('user').first()
+        group = Group.objects.annotate(
+            total=Count('posts')
+        ).order_by('-total').first()
+        author = User.objects.annotate(
+            total=Count('posts')
+        ).order_by('-total').first()
+        post = Post.objects.annotate(
+            total=Count('comments')
+        ).order_by('-total').first()
+        if not (follow and group and author and post):
+            raise CommandError(
+                'Недостаточно данных: заполните базу командой seed.'
+            )
+        guest = Client()
+        reader = Client()
+        reader.force_login(follow.user)
+        return (
+            ('index', guest, 'get', reverse('posts:index'), None),
+            (
+                'group_list', guest, 'get',
+                reverse('posts:group_list', args=(group.slug,)), None
+            ),
+            (
+                'profile', guest, 'get',
+                reverse('posts:profile', args=(author.username,)), None
+            ),
+            (
+                'post_detail', guest, 'get',
+                reverse('posts:post_detail', args=(post.pk,)), None
+            ),
+            (
+                'follow_index', reader, 'get',
+                reverse('posts:follow_index'), None
+            ),
+            (
+                'add_comment', reader, 'post',
+                reverse('posts:add_comment', args=(post.pk,)),
+                {'text': 'Комментарий нагрузочного теста'}
+            ),
+        )
+
+    def run(self, client, method, url, data, options):
+        if method == 'get':
+            return self.measure(client, method, url, data, options)
+        # Пишущий сценарий выполняется в транзакции, которая затем
+        # откатывается, чтобы в базе не оставалось тестовых записей;
+        # очередь отложенной записи прошла бы мимо неё, поэтому отключена.
+        with override_settings(WRITE_BEHIND=False), transaction.atomic():
+            report = self.measure(client, method, url, data, options)
+            transaction.set_rollback(True)
+        return report
+
+    def measure(self, client, method, url, data, options):
+        request = getattr(client, method)
+        for _ in range(options['warmup']):
+            request(url, data)
+        latencies, queries = [], []
+        started = time.perf_counter()
+        for _ in range(options['requests']):
+            with CaptureQueriesContext(connection) as context:
+                begin = time.perf_counter()
+                response = request(url, data)
+                latencies.append((time.perf_counter() - begin) * 1000)
+            queries.append(len(context))
+            if response.status_code >= 400:
+                raise CommandError(f'{url}: ответ {response.status_code}')
+        elapsed = time.perf_counter() - started
+        return {
+            'url': url,
+            'requests': len(latencies),
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'queries_per_request': round(sum(queries) / len(queries), 2),
+            'throughput_rps': round(len(latencies) / elapsed, 1),
+        }
@@ -0,0 +1,84 @@
+import posixpath
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.utils import timezone
+from sorl.thumbnail import delete as delete_with_thumbnails
+from sorl.thumbnail import default as thumbnail_default
+
+from core.write_queue import get_queue
+from posts.models import Post, Thumbnail
+
+
+def walk(directory):
+    directories, files = default_storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(posixpath.join(directory, name))
+
+
+def references():
+    """Сколько записей ссылается на каждый файл хранилища."""
+    counts = Counter(
+        Post.objects.exclude(image='').values_list('image', flat=True)
+        .iterator()
+    )
+    for url in Thumbnail.objects.filter(
+        name__startswith='original:'
+    ).values_list('url', flat=True).iterator():
+        if url.startswith(settings.MEDIA_URL):
+            counts[url[len(settings.MEDIA_URL):]] += 1
+    for payload in get_queue().payloads('post'):
+        if payload.get('image'):
+            counts[payload['image']] += 1
+    return counts
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет картинки постов, на которые не ссылается ни одна запись, '
+        'вместе с их миниатюрами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено.',
+        )
+        parser.add_argument(
+            '--grace', type=int, default=settings.MEDIA_GC_GRACE,
+            help='Не трогать файлы моложе стольких секунд.',
+        )
+
+    def handle(self, *args, dry_run, grace, **options):
+        # Миниатюры от прежней картинки поста больше не покажутся.
+        stale = Thumbnail.objects.exclude(source=F('post__image'))
+        if not dry_run:
+            stale.delete()
+        counts = references()
+        deadline = timezone.now() - timedelta(seconds=grace)
+        total = removed = freed = 0
+        for directory in settings.MEDIA_GC_DIRS:
+            if not default_storage.exists(directory):
+                continue
+            for name in walk(directory):
+                total += 1
+                if (counts[name]
+                        or default_storage.get_modified_time(name) > deadline):
+                    continue
+                removed += 1
+                freed += default_storage.size(name)
+                self.stdout.write(f'Удаляется {name}')
+                if not dry_run:
+                    delete_with_thumbnails(name)
+        if not dry_run:
+            thumbnail_default.kvstore.cleanup()
+        self.stdout.write(self.style.SUCCESS(
+            f'Файлов: {total}, используется: {len(+counts)}, '
+            f'удалено: {removed} ({freed / 1024 / 1024:.1f} МБ)'
+        ))
@@ -0,0 +1,80 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+
+
+def read_checkpoint(path):
+    try:
+        with open(path, encoding='utf-8') as file:
+            return int(file.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+    except ValueError:
+        raise CommandError(f'В {path} должен быть id последней строки')
+
+
+def write_checkpoint(path, last_id):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as file:
+        file.write(str(last_id))
+    os.replace(temporary, path)
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает посты, комментарии, подписки или группы в JSONL, CSV '
+        'или пачками по столбцам, читая таблицу по возрастанию id.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=export.TABLES)
+        parser.add_argument(
+            '--format', choices=export.FORMATS, default='jsonl'
+        )
+        parser.add_argument(
+            '--output', help='Файл выгрузки; по умолчанию stdout.'
+        )
+        parser.add_argument(
+            '--after', type=int, default=0,
+            help='Выгружать строки с id больше этого.',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help=(
+                'Файл с id последней выгруженной строки: обновляется после '
+                'каждой пачки, при повторном запуске выгрузка продолжается '
+                'с него и дописывается в --output.'
+            ),
+        )
+        parser.add_argument('--batch-size', type=int)
+
+    def handle(self, *args, kind, **options):
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError('Размер пачки должен быть больше нуля.')
+        checkpoint = options['checkpoint']
+        after = options['after']
+        if checkpoint:
+            after = max(after, read_checkpoint(checkpoint))
+        output = options['output']
+        file = (
+            open(output, 'a' if after else 'w', encoding='utf-8', newline='')
+            if output else self.stdout
+        )
+        exported = 0
+        try:
+            if options['format'] == 'csv' and not after:
+                file.write(export.csv_header(kind))
+            for rows in export.scan(kind, after, options['batch_size']):
+                # Каждый кусок заканчивается переводом строки, поэтому
+                # OutputWrapper не добавит лишний.
+                file.write(export.format_batch(kind, options['format'], rows))
+                file.flush()
+                if checkpoint:
+                    write_checkpoint(checkpoint, rows[-1][0])
+                exported += len(rows)
+        finally:
+            if output:
+                file.close()
+        self.stderr.write(f'Выгружено строк: {exported}')
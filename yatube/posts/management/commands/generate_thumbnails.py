@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Count, F, Q
+
+from posts.images import RENDITIONS_DIR
+from posts.models import Post
+from posts.thumbnails import process
+
+
+def _generate(post_id):
+    try:
+        process(post_id)
+        return None
+    except Exception as error:
+        return post_id, error
+
+
+def _generate_in_thread(post_id):
+    try:
+        return _generate(post_id)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Обрабатывает старые картинки постов и создаёт недостающие '
+        'миниатюры.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать миниатюры всех постов с картинками.',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=settings.THUMBNAIL_WORKERS or 1,
+        )
+
+    def handle(self, *args, force, workers, **options):
+        posts = Post.objects.exclude(image='')
+        if not force:
+            posts = posts.annotate(fresh=Count(
+                'thumbnails',
+                filter=Q(thumbnails__source=F('image')),
+            )).filter(
+                Q(fresh__lt=len(settings.POST_THUMBNAILS))
+                | ~Q(image__startswith=RENDITIONS_DIR)
+            )
+        post_ids = list(posts.order_by('pk').values_list('pk', flat=True))
+        failed = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # С одним воркером посты обрабатываются в текущем потоке.
+            if workers > 1:
+                results = executor.map(_generate_in_thread, post_ids)
+            else:
+                results = map(_generate, post_ids)
+            for done, result in enumerate(results, 1):
+                if result is not None:
+                    failed += 1
+                    self.stderr.write('Пост {}: {}'.format(*result))
+                if done % 100 == 0:
+                    self.stdout.write(f'Обработано {done} из {len(post_ids)}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Миниатюры созданы для {len(post_ids) - failed} постов, '
+            f'ошибок: {failed}'
+        ))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.counters import comments_drift, with_counts
+from posts.models import Counters, Post, User
+
+COUNTER_FIELDS = ('posts_count', 'followers_count', 'following_count')
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики постов, подписок и комментариев.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        with transaction.atomic():
+            users = self.repair_users(batch_size)
+            posts = self.repair_posts(batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счётчиков: пользователей {users}, постов {posts}'
+        ))
+
+    def repair_users(self, batch_size):
+        existing = Counters.objects.in_bulk()
+        created, drifted = [], []
+        for user in with_counts(User.objects.order_by('pk')).iterator():
+            real = {
+                field: getattr(user, f'real_{field}')
+                for field in COUNTER_FIELDS
+            }
+            counters = existing.get(user.pk)
+            if counters is None:
+                created.append(Counters(user_id=user.pk, **real))
+            elif any(getattr(counters, f) != v for f, v in real.items()):
+                for field, value in real.items():
+                    setattr(counters, field, value)
+                drifted.append(counters)
+        Counters.objects.bulk_create(created, batch_size=batch_size)
+        Counters.objects.bulk_update(
+            drifted, COUNTER_FIELDS, batch_size=batch_size
+        )
+        return len(created) + len(drifted)
+
+    def repair_posts(self, batch_size):
+        drifted = []
+        for post in comments_drift().only('pk').iterator():
+            post.comments_count = post.real_comments_count
+            drifted.append(post)
+        Post.objects.bulk_update(
+            drifted, ('comments_count',), batch_size=batch_size
+        )
+        return len(drifted)
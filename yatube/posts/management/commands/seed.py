@@ -0,0 +1,107 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import conditional, feeds, recent, surrogates
+from posts.fragments import FRAGMENT_CACHE
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу случайными пользователями, группами, постами, '
+        'комментариями и подписками для нагрузочного тестирования.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--follows', type=int, default=1000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        prefix = 'seed{}'.format(User.objects.count())
+        with transaction.atomic():
+            users = self.create_users(prefix, options['users'])
+            groups = self.create_groups(prefix, options['groups'])
+            self.create_posts(users, groups, options['posts'])
+            self.create_comments(users, options['comments'])
+            self.create_follows(users, options['follows'])
+        feeds.rebuild()
+        recent.forget_all()
+        call_command('rebuild_search_index', stdout=self.stdout)
+        call_command('recount_counters', stdout=self.stdout)
+        # Массовая загрузка минует сигналы: сдвигаем отметки и сбрасываем
+        # кеши всех страниц.
+        conditional.touch(conditional.SITE)
+        surrogates.purge_all()
+        FRAGMENT_CACHE.invalidate()
+
+    def bulk(self, model, objects):
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        self.stdout.write(f'{model._meta.verbose_name_plural}: {len(objects)}')
+
+    def create_users(self, prefix, count):
+        password = make_password(None)
+        self.bulk(User, [
+            User(username=f'{prefix}_{number}', password=password)
+            for number in range(count)
+        ])
+        return list(User.objects.filter(
+            username__startswith=f'{prefix}_'
+        ).values_list('pk', flat=True))
+
+    def create_groups(self, prefix, count):
+        self.bulk(Group, [
+            Group(
+                title=f'Группа {prefix} {number}',
+                slug=f'{prefix}-{number}',
+                description='Группа для нагрузочного тестирования',
+            )
+            for number in range(count)
+        ])
+        return list(Group.objects.filter(
+            slug__startswith=f'{prefix}-'
+        ).values_list('pk', flat=True))
+
+    def create_posts(self, users, groups, count):
+        choice = self.random.choice
+        self.bulk(Post, [
+            Post(
+                author_id=choice(users),
+                group_id=choice(groups) if groups else None,
+                text=f'Пост номер {number}. ' * 10,
+            )
+            for number in range(count)
+        ])
+
+    def create_comments(self, users, count):
+        post_ids = list(Post.objects.values_list('pk', flat=True))
+        if not post_ids:
+            return
+        choice = self.random.choice
+        self.bulk(Comment, [
+            Comment(
+                post_id=choice(post_ids),
+                author_id=choice(users),
+                text=f'Комментарий номер {number}',
+            )
+            for number in range(count)
+        ])
+
+    def create_follows(self, users, count):
+        pairs = set()
+        limit = len(users) * (len(users) - 1)
+        while len(pairs) < min(count, limit):
+            pairs.add(tuple(self.random.sample(users, 2)))
+        self.bulk(Follow, [
+            Follow(user_id=user, author_id=author) for user, author in pairs
+        ])
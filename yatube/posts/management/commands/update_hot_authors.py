@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import feeds
+from posts.models import Counters, Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Отмечает авторов, у которых подписчиков больше FEED_FANOUT_LIMIT, '
+        'и дозаполняет ленты подписчиков авторов, которые перестали быть '
+        'популярными.'
+    )
+
+    def handle(self, *args, **options):
+        limit = settings.FEED_FANOUT_LIMIT
+        heated = Counters.objects.filter(
+            hot=False, followers_count__gt=limit
+        ).update(hot=True)
+        cooled = list(Counters.objects.filter(
+            hot=True, followers_count__lte=limit
+        ).values_list('user', flat=True))
+        last_pk = Post.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+        for author_id in cooled:
+            # Флаг снимается вместе с дозаполнением: если команда упадёт,
+            # автор останется популярным и при следующем запуске его
+            # ленты дозаполнятся снова.
+            with transaction.atomic():
+                Counters.objects.filter(user_id=author_id).update(hot=False)
+                feeds.copy_posts('f.author_id = %s', [author_id])
+        if heated or cooled:
+            feeds.forget_hot_authors()
+        # Процессы, которые ещё видели автора популярным, могли не разложить
+        # посты, опубликованные во время дозаполнения.
+        for author_id in cooled:
+            feeds.copy_posts(
+                'f.author_id = %s AND p.id > %s', [author_id, last_pk]
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Стали популярными: {heated}, перестали: {len(cooled)}'
+        ))
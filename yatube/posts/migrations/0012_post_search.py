@@ -0,0 +1,35 @@
+# Generated by Django 2.2.16 on 2026-10-16 23:10
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS posts_post_fts USING fts5('
+        "text, group_title, comments, tokenize='unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        'INSERT INTO posts_post_fts (rowid, text, group_title, comments) '
+        "SELECT p.id, p.text, coalesce(g.title, ''), coalesce(("
+        "SELECT group_concat(c.text, char(10)) FROM posts_comment c "
+        "WHERE c.post_id = p.id), '') "
+        'FROM posts_post p LEFT JOIN posts_group g ON g.id = p.group_id'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_post_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_thumbnail'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
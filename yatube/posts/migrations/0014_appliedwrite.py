@@ -0,0 +1,25 @@
+# Generated by Django 2.2.16 on 2026-10-16 23:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppliedWrite',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=32, unique=True, verbose_name='Ключ записи')),
+                ('applied', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата применения')),
+            ],
+            options={
+                'verbose_name': 'Применённая запись',
+                'verbose_name_plural': 'Применённые записи',
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 2.2.16 on 2026-10-17 10:05
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_feeds(apps, schema_editor):
+    """Копирует даты постов и дозаполняет ленты, которые раньше
+    обрезались до 200 постов автора."""
+    FeedEntry = apps.get_model('posts', 'FeedEntry')
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    FeedEntry.objects.update(pub_date=Subquery(
+        Post.objects.filter(pk=OuterRef('post_id')).values('pub_date')[:1]
+    ))
+    for follow in Follow.objects.iterator():
+        FeedEntry.objects.bulk_create(
+            (
+                FeedEntry(user_id=follow.user_id, post_id=pk, pub_date=moment)
+                for pk, moment in Post.objects.filter(
+                    author_id=follow.author_id
+                ).values_list('pk', 'pub_date').iterator()
+            ),
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_appliedwrite'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feedentry',
+            name='pub_date',
+            field=models.DateTimeField(null=True, verbose_name='Дата публикации'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='feedentry',
+            name='pub_date',
+            field=models.DateTimeField(verbose_name='Дата публикации'),
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='feed_user_pub_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='counters',
+            name='hot',
+            field=models.BooleanField(default=False, verbose_name='Популярный автор'),
+        ),
+        migrations.AddIndex(
+            model_name='counters',
+            index=models.Index(condition=models.Q(hot=True), fields=['user'], name='counters_hot_idx'),
+        ),
+    ]
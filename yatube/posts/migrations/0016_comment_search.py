@@ -0,0 +1,61 @@
+# Generated by Django 2.2.16 on 2026-10-17 14:20
+
+from django.db import migrations
+
+TOKENIZE = "tokenize='unicode61 remove_diacritics 2'"
+POSTS = (
+    "SELECT p.id, p.text, coalesce(g.title, '') "
+    'FROM posts_post p LEFT JOIN posts_group g ON g.id = p.group_id'
+)
+
+
+def split_comments(apps, schema_editor):
+    """Комментарии переезжают из общей строки поста в свои строки,
+    чтобы новый комментарий не переписывал все комментарии поста."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS posts_post_fts')
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE posts_post_fts USING fts5('
+        f'text, group_title, {TOKENIZE})'
+    )
+    schema_editor.execute(
+        'INSERT INTO posts_post_fts (rowid, text, group_title) ' + POSTS
+    )
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS posts_comment_fts USING fts5('
+        f'text, post_id UNINDEXED, {TOKENIZE})'
+    )
+    schema_editor.execute(
+        'INSERT INTO posts_comment_fts (rowid, text, post_id) '
+        'SELECT id, text, post_id FROM posts_comment'
+    )
+
+
+def join_comments(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS posts_comment_fts')
+    schema_editor.execute('DROP TABLE IF EXISTS posts_post_fts')
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE posts_post_fts USING fts5('
+        f'text, group_title, comments, {TOKENIZE})'
+    )
+    schema_editor.execute(
+        'INSERT INTO posts_post_fts (rowid, text, group_title, comments) '
+        "SELECT p.id, p.text, coalesce(g.title, ''), coalesce(("
+        "SELECT group_concat(c.text, char(10)) FROM posts_comment c "
+        "WHERE c.post_id = p.id), '') "
+        'FROM posts_post p LEFT JOIN posts_group g ON g.id = p.group_id'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_feed_pub_date'),
+    ]
+
+    operations = [
+        migrations.RunPython(split_comments, join_comments),
+    ]
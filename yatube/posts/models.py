@@ -32,6 +32,10 @@ class Post(models.Model):
         'Дата публикации',
         auto_now_add=True
     )
+    updated = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
     author = models.ForeignKey(
         User,
         verbose_name='Автор',
@@ -52,9 +56,33 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        'Количество комментариев',
+        default=0,
+        editable=False
+    )
+    version = models.PositiveIntegerField(
+        'Версия',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='post_pub_date_idx',
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='post_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=('group', '-pub_date', '-id'),
+                name='post_group_pub_date_idx',
+            ),
+        )
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
@@ -86,6 +114,12 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ('-created',)
+        indexes = (
+            models.Index(
+                fields=('post', '-created', '-id'),
+                name='comment_post_created_idx',
+            ),
+        )
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
 
@@ -108,8 +142,117 @@ class Follow(models.Model):
     )
 
     class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'author'),
+                name='unique_follow',
+            ),
+        )
         verbose_name = 'Подписчик'
         verbose_name_plural = 'Подписчики'
 
     def __str__(self):
         return self.author
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик',
+        related_name='feed_entries',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        verbose_name='Пост',
+        related_name='feed_entries',
+    )
+    # Копия даты поста: лента читается диапазоном по индексу
+    # (user, -pub_date, -post) без обращения к постам.
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-post'),
+                name='feed_user_pub_date_idx',
+            ),
+        )
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Записи ленты подписок'
+
+    def __str__(self):
+        return f'{self.user_id}: {self.post_id}'
+
+
+class Counters(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='counters',
+        primary_key=True,
+    )
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+    # Посты популярного автора не раскладываются по лентам подписчиков;
+    # флаг ставит и снимает команда update_hot_authors.
+    hot = models.BooleanField('Популярный автор', default=False)
+
+    class Meta:
+        indexes = (
+            models.Index(
+                fields=('user',),
+                name='counters_hot_idx',
+                condition=models.Q(hot=True),
+            ),
+        )
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self):
+        return str(self.user)
+
+
+class Thumbnail(models.Model):
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        verbose_name='Пост',
+        related_name='thumbnails',
+    )
+    name = models.CharField('Формат', max_length=32)
+    source = models.CharField('Исходная картинка', max_length=255)
+    url = models.CharField('Адрес', max_length=255)
+    width = models.PositiveIntegerField('Ширина')
+    height = models.PositiveIntegerField('Высота')
+
+    class Meta:
+        unique_together = ('post', 'name')
+        verbose_name = 'Миниатюра'
+        verbose_name_plural = 'Миниатюры'
+
+    def __str__(self):
+        return self.url
+
+
+class AppliedWrite(models.Model):
+    """Квитанция о записи из очереди, применённой к базе.
+
+    Сохраняется в той же транзакции, что и сама запись, поэтому повторный
+    разбор очереди после сбоя не создаёт дубликатов.
+    """
+    key = models.CharField('Ключ записи', max_length=32, unique=True)
+    applied = models.DateTimeField(
+        'Дата применения', auto_now_add=True, db_index=True
+    )
+
+    class Meta:
+        verbose_name = 'Применённая запись'
+        verbose_name_plural = 'Применённые записи'
+
+    def __str__(self):
+        return self.key
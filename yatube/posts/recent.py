@@ -0,0 +1,176 @@
+"""Списки id свежих постов групп и авторов.
+
+Для каждой группы и каждого автора в кеше лежат дата и id последних
+RECENT_POSTS_SIZE постов. Сигналы правят списки после коммита
+сохранения, удаления и смены группы поста (write-through), поэтому
+первые страницы этих лент собираются из списка и одного in_bulk, а
+более глубокие страницы уходят в базу.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.functional import cached_property
+
+from core.caching import Namespace
+from core.profiling import record_cache
+
+RECENT_CACHE = Namespace('recent')
+
+
+def group_key(group_id):
+    return RECENT_CACHE.key(f'group:{group_id}')
+
+
+def author_key(author_id):
+    return RECENT_CACHE.key(f'author:{author_id}')
+
+
+class RecentIds:
+    """Список (дата, id) свежих постов области, от новых к старым.
+
+    complete означает, что в списке все посты области, и тогда им
+    можно отвечать на любую страницу и на вопрос о количестве.
+    """
+
+    def __init__(self, key, queryset):
+        self.key = key
+        self.queryset = queryset.order_by('-pub_date', '-pk')
+
+    @cached_property
+    def _entry(self):
+        entry = cache.get(self.key)
+        record_cache(int(entry is not None), int(entry is None))
+        if entry is None:
+            # Список заполняется с основной базы: реплика может отставать,
+            # а write-through правки не догонят пропущенный пост.
+            rows = list(self.queryset.using(DEFAULT_DB_ALIAS).values_list(
+                'pub_date', 'pk'
+            )[:settings.RECENT_POSTS_SIZE + 1])
+            entry = (
+                rows[:settings.RECENT_POSTS_SIZE],
+                len(rows) <= settings.RECENT_POSTS_SIZE,
+            )
+            cache.set(self.key, entry, settings.RECENT_POSTS_TIMEOUT)
+        return entry
+
+    @property
+    def rows(self):
+        return self._entry[0]
+
+    @property
+    def complete(self):
+        return self._entry[1]
+
+    def window(self, start, stop):
+        """id постов с start по stop или None, если список их не покрывает."""
+        if stop > len(self.rows) and not self.complete:
+            return None
+        return [pk for _, pk in self.rows[start:stop]]
+
+    def index_after(self, moment, pk):
+        """Позиция первого поста старше (moment, pk) или None."""
+        for index, row in enumerate(self.rows):
+            if row < (moment, pk):
+                return index
+        return len(self.rows) if self.complete else None
+
+    def hydrate(self, pks):
+        """Посты по id в порядке списка; пропавшие из базы пропускаются."""
+        posts = self.queryset.in_bulk(pks)
+        return [posts[pk] for pk in pks if pk in posts]
+
+
+class RecentPosts:
+    """Лента области для Paginator: страницы внутри списка собираются
+    через in_bulk, остальные берутся из базы."""
+
+    def __init__(self, recent):
+        self.recent = recent
+
+    def count(self):
+        if self.recent.complete:
+            return len(self.recent.rows)
+        return self.recent.queryset.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        start = item.start or 0
+        stop = self.count() if item.stop is None else item.stop
+        pks = self.recent.window(start, stop)
+        if pks is None:
+            return list(self.recent.queryset[start:stop])
+        return self.recent.hydrate(pks)
+
+
+def for_group(group, queryset):
+    return RecentIds(group_key(group.pk), queryset)
+
+
+def for_author(author, queryset):
+    return RecentIds(author_key(author.pk), queryset)
+
+
+def _locked(key):
+    lock_key = f'{key}:lock'
+    deadline = time.time() + settings.CACHE_LOCK_TIMEOUT
+    while not cache.add(lock_key, 1, settings.CACHE_LOCK_TIMEOUT):
+        if time.time() > deadline:
+            return None
+        time.sleep(0.01)
+    return lock_key
+
+
+def _update(key, row=None, remove=None):
+    lock_key = _locked(key)
+    if lock_key is None:
+        cache.delete(key)
+        return
+    try:
+        entry = cache.get(key)
+        if entry is None:
+            return
+        rows, complete = entry
+        pk = row[1] if row else remove
+        rows = [item for item in rows if item[1] != pk]
+        if row and (complete or (rows and row > rows[-1])):
+            rows = sorted(rows + [row], reverse=True)
+            if len(rows) > settings.RECENT_POSTS_SIZE:
+                rows, complete = rows[:settings.RECENT_POSTS_SIZE], False
+        cache.set(key, (rows, complete), settings.RECENT_POSTS_TIMEOUT)
+    finally:
+        cache.delete(lock_key)
+
+
+def _post_changed(post, previous_group_id, removed):
+    row = None if removed else (post.pub_date, post.pk)
+    keys = [author_key(post.author_id)]
+    if post.group_id:
+        keys.append(group_key(post.group_id))
+    for key in keys:
+        _update(key, row=row, remove=post.pk)
+    if previous_group_id not in (None, post.group_id):
+        _update(group_key(previous_group_id), remove=post.pk)
+
+
+def post_saved(post, previous_group_id=None):
+    """Вносит пост в списки после коммита: до него читатели не нашли бы
+    пост в базе, а при откате в списке остался бы несуществующий id."""
+    transaction.on_commit(
+        lambda: _post_changed(post, previous_group_id, removed=False)
+    )
+
+
+def post_deleted(post):
+    transaction.on_commit(lambda: _post_changed(post, None, removed=True))
+
+
+def forget_all():
+    """Сбрасывает все списки, например после массовой загрузки, при
+    которой сигналы не отправляются."""
+    RECENT_CACHE.invalidate()
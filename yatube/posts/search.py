@@ -0,0 +1,266 @@
+"""Полнотекстовый поиск по постам.
+
+Бэкенд выбирается настройкой SEARCH_BACKEND. SQLiteFTSBackend хранит
+инвертированный индекс в виртуальных таблицах FTS5: текст поста с
+названием группы и отдельно каждый комментарий, так что комментарий
+индексируется без перечитывания остальных. Пост находится, если каждое
+слово запроса есть в нём самом или в одном из его комментариев.
+DatabaseBackend ищет через LIKE и подходит для любой базы, но медленнее
+на больших таблицах.
+"""
+import re
+from functools import reduce
+from operator import and_
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+
+from .hydration import hydrate
+from .models import Comment, Post
+
+MARK_START, MARK_END = '\x02', '\x03'
+SNIPPET_TOKENS = 32
+TERM_RE = re.compile(r'\w+')
+
+
+def get_backend():
+    return import_string(settings.SEARCH_BACKEND)()
+
+
+def terms(query):
+    return TERM_RE.findall(query.lower())
+
+
+def highlight(text):
+    """Экранирует фрагмент и заменяет служебные метки на <mark>."""
+    return mark_safe(
+        escape(text)
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
+
+
+class SearchResults:
+    """Ленивая выдача: Paginator считает её размер и берёт срезы, а бэкенд
+    загружает только посты запрошенной страницы."""
+
+    def __init__(self, backend, query):
+        self.backend = backend
+        self.query = query
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.backend.count(self.query)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        start = item.start or 0
+        stop = self.count() if item.stop is None else item.stop
+        if stop <= start:
+            return []
+        return self.backend.fetch(self.query, start, stop)
+
+
+class BaseBackend:
+    def search(self, query):
+        return SearchResults(self, query)
+
+    def index(self, post_ids):
+        """Обновляет записи индекса; удалённые посты из него убираются."""
+
+    def remove(self, post_ids):
+        pass
+
+    def index_comment(self, comment):
+        pass
+
+    def remove_comment(self, comment_id):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def count(self, query):
+        raise NotImplementedError
+
+    def fetch(self, query, start, stop):
+        raise NotImplementedError
+
+    def filter(self, queryset, query):
+        """Сужает queryset постов до найденных, например для админки."""
+        raise NotImplementedError
+
+
+class DatabaseBackend(BaseBackend):
+    def matching(self, query):
+        words = terms(query)
+        if not words:
+            return Post.objects.none()
+        return Post.objects.filter(reduce(and_, (
+            Q(text__icontains=word)
+            | Q(group__title__icontains=word)
+            | Q(comments__text__icontains=word)
+            for word in words
+        ))).distinct()
+
+    def count(self, query):
+        return self.matching(query).count()
+
+    def fetch(self, query, start, stop):
+        posts = hydrate(self.matching(query)[start:stop])
+        pattern = re.compile(
+            '|'.join(map(re.escape, terms(query))), re.IGNORECASE
+        )
+        for post in posts:
+            post.highlight = highlight(pattern.sub(
+                lambda match: MARK_START + match.group() + MARK_END,
+                post.text[:SNIPPET_TOKENS * 10],
+            ))
+        return posts
+
+    def filter(self, queryset, query):
+        return queryset.filter(pk__in=self.matching(query).values('pk'))
+
+
+class SQLiteFTSBackend(BaseBackend):
+    table = 'posts_post_fts'
+    comments_table = 'posts_comment_fts'
+    batch_size = 500
+
+    def words(self, query):
+        """Слова запроса как безопасные запросы FTS5 по префиксу."""
+        return [f'"{word}"*' for word in terms(query)]
+
+    def found(self, words):
+        """SQL id постов, где каждое слово есть в посте или в одном из
+        его комментариев."""
+        parts = [
+            f'SELECT id FROM (SELECT rowid AS id FROM {self.table} '
+            f'WHERE {self.table} MATCH %s UNION '
+            f'SELECT CAST(post_id AS INTEGER) FROM {self.comments_table} '
+            f'WHERE {self.comments_table} MATCH %s)'
+            for _ in words
+        ]
+        params = [word for word in words for _ in range(2)]
+        return ' INTERSECT '.join(parts), params
+
+    def execute(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def index(self, post_ids):
+        post_ids = list(post_ids)
+        for start in range(0, len(post_ids), self.batch_size):
+            self._index_batch(post_ids[start:start + self.batch_size])
+
+    def _index_batch(self, post_ids):
+        self.remove(post_ids)
+        rows = [
+            (pk, text, group_title or '')
+            for pk, text, group_title in Post.objects.filter(
+                pk__in=post_ids
+            ).values_list('pk', 'text', 'group__title')
+        ]
+        if rows:
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f'INSERT INTO {self.table} (rowid, text, group_title) '
+                    'VALUES (%s, %s, %s)',
+                    rows,
+                )
+
+    def remove(self, post_ids):
+        post_ids = list(post_ids)
+        if post_ids:
+            placeholders = ', '.join(['%s'] * len(post_ids))
+            self.execute(
+                f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})',
+                post_ids,
+            )
+
+    def index_comment(self, comment):
+        self.remove_comment(comment.pk)
+        self.execute(
+            f'INSERT INTO {self.comments_table} (rowid, text, post_id) '
+            'VALUES (%s, %s, %s)',
+            [comment.pk, comment.text, comment.post_id],
+        )
+
+    def remove_comment(self, comment_id):
+        self.execute(
+            f'DELETE FROM {self.comments_table} WHERE rowid = %s',
+            [comment_id],
+        )
+
+    def rebuild(self):
+        self.execute(f'DELETE FROM {self.table}')
+        self.execute(f'DELETE FROM {self.comments_table}')
+        self.index(Post.objects.order_by('pk').values_list('pk', flat=True))
+        self.execute(
+            f'INSERT INTO {self.comments_table} (rowid, text, post_id) '
+            f'SELECT id, text, post_id FROM {Comment._meta.db_table}'
+        )
+
+    def count(self, query):
+        words = self.words(query)
+        if not words:
+            return 0
+        found, params = self.found(words)
+        return self.execute(f'SELECT count(*) FROM ({found})', params)[0][0]
+
+    def fetch(self, query, start, stop):
+        words = self.words(query)
+        if not words:
+            return []
+        found, params = self.found(words)
+        # Совпадения в тексте и группе ранжируются по bm25, посты,
+        # найденные только по комментариям, идут за ними.
+        any_word = ' OR '.join(words)
+        pks = [pk for pk, in self.execute(
+            f'SELECT found.id FROM ({found}) found LEFT JOIN ('
+            f'SELECT rowid, bm25({self.table}, 10.0, 3.0) AS rank '
+            f'FROM {self.table} WHERE {self.table} MATCH %s'
+            ') ranked ON ranked.rowid = found.id '
+            'ORDER BY coalesce(ranked.rank, 0), found.id DESC '
+            'LIMIT %s OFFSET %s',
+            [*params, any_word, stop - start, start],
+        )]
+        if not pks:
+            return []
+        snippets = dict(self.execute(
+            f'SELECT rowid, snippet({self.table}, 0, %s, %s, %s, %s) '
+            f'FROM {self.table} WHERE {self.table} MATCH %s '
+            'AND rowid IN ({})'.format(', '.join(['%s'] * len(pks))),
+            [MARK_START, MARK_END, '…', SNIPPET_TOKENS, any_word, *pks],
+        ))
+        posts = Post.objects.in_bulk(pks)
+        found = []
+        for pk in pks:
+            if pk in posts:
+                post = posts[pk]
+                post.highlight = highlight(
+                    snippets.get(pk, post.text[:SNIPPET_TOKENS * 10])
+                )
+                found.append(post)
+        return hydrate(found)
+
+    def filter(self, queryset, query):
+        words = self.words(query)
+        if not words:
+            return queryset.none()
+        found, params = self.found(words)
+        return queryset.extra(
+            where=[f'{Post._meta.db_table}.id IN ({found})'],
+            params=params,
+        )
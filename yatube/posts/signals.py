@@ -0,0 +1,161 @@
+from django.db.models import F
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from . import (
+    conditional, counters, feeds, fragments, hydration, recent, search,
+    surrogates,
+)
+from .models import Comment, Follow, Group, Post, User
+
+AUTHOR_FRAGMENT_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+@receiver(pre_save, sender=Post)
+def bump_post_version(sender, instance, **kwargs):
+    if instance.pk is not None:
+        instance.version += 1
+        instance.previous_group_id = Post.objects.filter(
+            pk=instance.pk
+        ).values_list('group_id', flat=True).first()
+
+
+@receiver(pre_save, sender=User)
+def remember_author_fields(sender, instance, update_fields, **kwargs):
+    instance.previous_author_fields = None
+    if instance.pk is None:
+        return
+    fields = AUTHOR_FRAGMENT_FIELDS
+    if update_fields is not None:
+        fields = fields & set(update_fields)
+    if fields:
+        instance.previous_author_fields = User.objects.filter(
+            pk=instance.pk
+        ).values(*fields).first()
+
+
+@receiver(post_save, sender=Group)
+def bump_group_posts_version(sender, instance, created, **kwargs):
+    if not created:
+        instance.posts.update(version=F('version') + 1)
+        post_ids = list(instance.posts.values_list('pk', flat=True))
+        search.get_backend().index(post_ids)
+        surrogates.purge_posts(post_ids)
+        surrogates.purge(surrogates.group_key(instance.pk))
+    conditional.touch(conditional.SITE)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def forget_hydrated_group(sender, instance, **kwargs):
+    hydration.forget_group(instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_hydrated_author(sender, instance, **kwargs):
+    hydration.forget_author(instance.pk)
+
+
+@receiver(pre_delete, sender=Group)
+def remember_group_posts(sender, instance, **kwargs):
+    instance.search_post_ids = list(
+        instance.posts.values_list('pk', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    # SET_NULL обновляет посты запросом, минуя pre_save.
+    Post.objects.filter(pk__in=instance.search_post_ids).update(
+        version=F('version') + 1
+    )
+    search.get_backend().index(instance.search_post_ids)
+    surrogates.purge_posts(instance.search_post_ids)
+    surrogates.purge(surrogates.group_key(instance.pk))
+    conditional.touch(conditional.SITE)
+
+
+@receiver(post_save, sender=User)
+def bump_author_posts_version(sender, instance, created, **kwargs):
+    previous = getattr(instance, 'previous_author_fields', None)
+    if created or previous is None:
+        return
+    if all(
+        getattr(instance, field) == value
+        for field, value in previous.items()
+    ):
+        return
+    instance.posts.update(version=F('version') + 1)
+    surrogates.purge_posts(instance.posts.values_list('pk', flat=True))
+    surrogates.purge(surrogates.author_key(instance.pk))
+    conditional.touch(conditional.SITE)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.bump(instance.author_id, 'posts_count', 1)
+        feeds.fan_out(instance)
+    search.get_backend().index([instance.pk])
+    previous_group_id = getattr(instance, 'previous_group_id', None)
+    recent.post_saved(instance, previous_group_id)
+    conditional.touch(*conditional.post_scopes(instance, previous_group_id))
+    surrogates.purge_post(instance, created, previous_group_id)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.bump(instance.author_id, 'posts_count', -1)
+    fragments.forget_fragments(instance)
+    search.get_backend().remove([instance.pk])
+    recent.post_deleted(instance)
+    conditional.touch(*conditional.post_scopes(instance))
+    surrogates.purge_post(instance, listed=True)
+
+
+def touch_follow(follow):
+    conditional.touch(
+        conditional.profile_scope(follow.author_id),
+        conditional.profile_scope(follow.user_id),
+    )
+    surrogates.purge(
+        surrogates.author_key(follow.author_id),
+        surrogates.author_key(follow.user_id),
+    )
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        counters.bump(instance.author_id, 'followers_count', 1)
+        counters.bump(instance.user_id, 'following_count', 1)
+        feeds.backfill(instance.user_id, instance.author_id)
+        touch_follow(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.bump(instance.author_id, 'followers_count', -1)
+    counters.bump(instance.user_id, 'following_count', -1)
+    feeds.prune(instance.user_id, instance.author_id)
+    touch_follow(instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_comments(instance.post_id, 1)
+    search.get_backend().index_comment(instance)
+    conditional.touch(conditional.post_scope(instance.post_id))
+    surrogates.purge(surrogates.comments_key(instance.post_id))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_comments(instance.post_id, -1)
+    search.get_backend().remove_comment(instance.pk)
+    conditional.touch(conditional.post_scope(instance.post_id))
+    surrogates.purge(surrogates.comments_key(instance.post_id))
@@ -0,0 +1,52 @@
+"""Суррогатные ключи страниц с постами для кеша страниц и CDN."""
+from core.page_cache import PAGE_CACHE, purge
+
+INDEX = 'index'
+
+
+def post_key(post_id):
+    return f'post-{post_id}'
+
+
+def author_key(user_id):
+    return f'author-{user_id}'
+
+
+def group_key(group_id):
+    return f'group-{group_id}'
+
+
+def comments_key(post_id):
+    return f'comments-{post_id}'
+
+
+def post_keys(posts):
+    return [post_key(post.pk) for post in posts]
+
+
+def purge_all():
+    """Сбрасывает все сохранённые страницы и главную ленту у прокси,
+    например после массовой загрузки, которая минует сигналы."""
+    PAGE_CACHE.invalidate()
+    purge(INDEX)
+
+
+def purge_posts(post_ids):
+    purge(*map(post_key, post_ids))
+
+
+def purge_post(post, listed=False, previous_group_id=None):
+    """Сбрасывает страницы, где пост есть или должен появиться.
+
+    listed — пост появился в лентах или исчез из них.
+    """
+    keys = {post_key(post.pk)}
+    if listed:
+        keys |= {INDEX, author_key(post.author_id)}
+    if listed or previous_group_id != post.group_id:
+        keys |= {
+            group_key(group_id)
+            for group_id in (post.group_id, previous_group_id)
+            if group_id is not None
+        }
+    purge(*keys)
@@ -0,0 +1,13 @@
+from django import template
+
+from posts.thumbnails import thumbnail_for, thumbnail_sources
+
+register = template.Library()
+
+
+@register.inclusion_tag('posts/includes/picture.html')
+def post_picture(post, name):
+    return {
+        'image': thumbnail_for(post, name),
+        'sources': thumbnail_sources(post, name),
+    }
@@ -0,0 +1,148 @@
+import json
+
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User
+
+
+class FeedApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='api-author')
+        cls.reader = User.objects.create_user(username='api-reader')
+        cls.group = Group.objects.create(title='API', slug='api')
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост {number}',
+                author=cls.author,
+                group=cls.group if number % 2 else None,
+            )
+            for number in range(5)
+        ]
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for number in range(3):
+            Comment.objects.create(
+                post=cls.posts[0], author=cls.reader, text=f'Ответ {number}'
+            )
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def read(self, response):
+        if response.streaming:
+            return json.loads(b''.join(response.streaming_content))
+        return json.loads(response.content)
+
+    def walk(self, url, **params):
+        """Проходит ленту по курсорам и собирает все строки."""
+        results, pages = [], 0
+        while True:
+            data = self.read(self.reader_client.get(url, params))
+            results += data['results']
+            pages += 1
+            if not data['next']:
+                return results, pages
+            params['cursor'] = data['next']
+
+    def test_feeds(self):
+        """Ленты отдают посты от новых к старым по курсорам."""
+        newest_first = [post.pk for post in reversed(self.posts)]
+        feeds = (
+            (reverse('posts:index_api'), newest_first),
+            (
+                reverse('posts:group_list_api', args=(self.group.slug,)),
+                [pk for pk in newest_first if pk in (
+                    self.posts[1].pk, self.posts[3].pk
+                )],
+            ),
+            (
+                reverse('posts:profile_api', args=(self.author.username,)),
+                newest_first,
+            ),
+            (reverse('posts:follow_index_api'), newest_first),
+        )
+        for url, expected in feeds:
+            with self.subTest(url=url):
+                results, pages = self.walk(url, limit=2)
+                self.assertEqual([row['id'] for row in results], expected)
+                self.assertEqual(pages, (len(expected) + 1) // 2 or 1)
+
+    def test_field_selection(self):
+        """fields оставляет в ответе только выбранные поля."""
+        data = self.read(self.client.get(
+            reverse('posts:index_api'), {'fields': 'id,author', 'limit': 1}
+        ))
+        self.assertEqual(
+            data['results'],
+            [{'id': self.posts[-1].pk, 'author': self.author.username}],
+        )
+        response = self.client.get(
+            reverse('posts:index_api'), {'fields': 'id,password'}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', self.read(response)['error'])
+
+    @override_settings(API_STREAM_THRESHOLD=2)
+    def test_large_pages_stream(self):
+        """Большие страницы отдаются потоком."""
+        response = self.client.get(reverse('posts:index_api'), {'limit': 3})
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(self.read(response)['results']), 3)
+        response = self.client.get(reverse('posts:index_api'), {'limit': 2})
+        self.assertFalse(response.streaming)
+
+    def test_post_detail_and_comments(self):
+        """Пост и его комментарии отдаются отдельно."""
+        post = self.posts[0]
+        data = self.read(self.client.get(
+            reverse('posts:post_detail_api', args=(post.pk,))
+        ))
+        self.assertEqual(data['text'], post.text)
+        self.assertEqual(data['comments_count'], 3)
+        self.assertIsNone(data['group'])
+        results, _ = self.walk(
+            reverse('posts:post_comments_api', args=(post.pk,)), limit=2
+        )
+        self.assertEqual(
+            [row['text'] for row in results],
+            ['Ответ 2', 'Ответ 1', 'Ответ 0'],
+        )
+
+    def test_errors(self):
+        """Ошибки приходят в JSON с подходящим статусом."""
+        cases = (
+            (reverse('posts:follow_index_api'), {}, 401),
+            (reverse('posts:group_list_api', args=('missing',)), {}, 404),
+            (reverse('posts:post_detail_api', args=(0,)), {}, 404),
+            (reverse('posts:index_api'), {'cursor': 'не-курсор'}, 400),
+            (reverse('posts:index_api'), {'limit': 'много'}, 400),
+        )
+        for url, params, status in cases:
+            with self.subTest(url=url, params=params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, status)
+                self.assertIn('error', self.read(response))
+        response = self.client.post(reverse('posts:index_api'))
+        self.assertEqual(response.status_code, 405)
+
+    def test_export_for_staff_only(self):
+        """Выгрузку получают только сотрудники, потоком и с продолжением."""
+        url = reverse('posts:export_api', args=('comments',))
+        self.assertEqual(self.reader_client.get(url).status_code, 403)
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.reader_client.force_login(staff)
+        first_id = Comment.objects.order_by('pk').first().pk
+        response = self.reader_client.get(url, {'after': first_id})
+        self.assertTrue(response.streaming)
+        self.assertIn('comments.jsonl', response['Content-Disposition'])
+        rows = [
+            json.loads(line)
+            for line in b''.join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual(
+            [row['text'] for row in rows], ['Ответ 1', 'Ответ 2']
+        )
+        response = self.reader_client.get(url, {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,297 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from core.write_queue import get_queue
+
+from ..models import (
+    Comment, Counters, FeedEntry, Follow, Group, Post, User
+)
+
+
+class SeedAndBenchmarkTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_seed_creates_data(self):
+        """Команда seed заполняет базу и производные таблицы."""
+        call_command(
+            'seed', users=5, groups=2, posts=30, comments=20, follows=6,
+            stdout=StringIO(),
+        )
+        self.assertEqual(Group.objects.count(), 2)
+        self.assertEqual(Post.objects.count(), 30)
+        self.assertEqual(Comment.objects.count(), 20)
+        self.assertEqual(Follow.objects.count(), 6)
+        self.assertTrue(FeedEntry.objects.exists())
+        self.assertEqual(Counters.objects.count(), 5)
+
+    def test_benchmark_report(self):
+        """Команда benchmark выдаёт задержки и число запросов по URL."""
+        call_command(
+            'seed', users=3, groups=1, posts=15, comments=5, follows=2,
+            stdout=StringIO(),
+        )
+        comments = Comment.objects.count()
+        out = StringIO()
+        call_command('benchmark', requests=3, warmup=1, stdout=out)
+        self.assertEqual(Comment.objects.count(), comments)
+        report = json.loads(out.getvalue())
+        self.assertEqual(set(report), {
+            'index', 'group_list', 'profile', 'post_detail',
+            'follow_index', 'add_comment',
+        })
+        for name, values in report.items():
+            with self.subTest(name=name):
+                self.assertEqual(values['requests'], 3)
+                self.assertLessEqual(values['p50_ms'], values['p99_ms'])
+                self.assertGreaterEqual(values['queries_per_request'], 0)
+        # Анонимные страницы после прогрева отдаются из кеша страниц.
+        self.assertEqual(report['index']['queries_per_request'], 0)
+        self.assertGreater(report['follow_index']['queries_per_request'], 0)
+
+
+class ImportDataTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.author = User.objects.create_user(username='author')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def test_import_posts_jsonl(self):
+        """Посты из JSONL загружаются с датами, группами и авторами."""
+        records = (
+            {'id': 100, 'text': 'Первый', 'author': 'author',
+             'group': 'group', 'pub_date': '2020-01-01T10:00:00'},
+            {'text': 'Второй', 'author': 'newbie'},
+            {'text': 'Без группы', 'author': 'author', 'group': 'missing'},
+        )
+        path = self.write(
+            'posts.jsonl', '\n'.join(map(json.dumps, records))
+        )
+        err = StringIO()
+        call_command(
+            'import_data', 'posts', path, chunk_size=2, batch_size=1,
+            create_users=True, stdout=StringIO(), stderr=err,
+        )
+        post = Post.objects.get(pk=100)
+        self.assertEqual(post.group, self.group)
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertTrue(
+            Post.objects.filter(author__username='newbie').exists()
+        )
+        self.assertIn("Строка 3: Группа 'missing' не найден", err.getvalue())
+        self.assertEqual(self.author.counters.posts_count, 1)
+
+    def test_import_changes_validators(self):
+        """После импорта лента не отвечает 304 по старому ETag."""
+        etag = self.client.get(reverse('posts:index'))['ETag']
+        path = self.write('posts.jsonl', json.dumps(
+            {'text': 'Импортированный', 'author': 'author'}
+        ))
+        call_command(
+            'import_data', 'posts', path, stdout=StringIO(), stderr=StringIO()
+        )
+        response = self.client.get(
+            reverse('posts:index'), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_import_drops_cached_pages(self):
+        """После импорта аноним видит новые посты, а не кеш страницы."""
+        self.client.get(reverse('posts:index'))
+        path = self.write('posts.jsonl', json.dumps(
+            {'text': 'Импортированный', 'author': 'author'}
+        ))
+        call_command(
+            'import_data', 'posts', path, stdout=StringIO(), stderr=StringIO()
+        )
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertContains(response, 'Импортированный')
+
+    def test_import_skips_broken_rows(self):
+        """Битые строки пропускаются, остальные загружаются."""
+        post = Post.objects.create(text='Пост', author=self.author)
+        posts = self.write('posts.jsonl', '\n'.join((
+            json.dumps({'id': 200, 'text': 'Первый', 'author': 'author'}),
+            '{"text": ',
+            '[1, 2]',
+            json.dumps({'id': 200, 'text': 'Дубль', 'author': 'author'}),
+            json.dumps({'id': post.pk, 'text': 'Дубль', 'author': 'author'}),
+            json.dumps({'id': 'x', 'text': 'Без id', 'author': 'author'}),
+            json.dumps({'text': None, 'author': 'author'}),
+            json.dumps({'text': 'Последний', 'author': 'author'}),
+        )))
+        comments = self.write('comments.jsonl', '\n'.join((
+            json.dumps({'post': 'x', 'text': 'Мимо', 'author': 'author'}),
+            json.dumps({'post': post.pk, 'text': 'Ок', 'author': 'author'}),
+        )))
+        out = StringIO()
+        call_command(
+            'import_data', 'posts', posts, chunk_size=3,
+            stdout=out, stderr=StringIO(),
+        )
+        call_command(
+            'import_data', 'comments', comments,
+            stdout=out, stderr=StringIO(),
+        )
+        self.assertEqual(Post.objects.get(pk=200).text, 'Первый')
+        self.assertTrue(Post.objects.filter(text='Последний').exists())
+        self.assertEqual(Post.objects.count(), 3)
+        self.assertIn('загружено 2, пропущено 6', out.getvalue())
+        self.assertEqual(post.comments.get().text, 'Ок')
+
+    def test_import_comments_and_follows_csv(self):
+        """Комментарии и подписки загружаются из CSV."""
+        post = Post.objects.create(text='Пост', author=self.author)
+        reader = User.objects.create_user(username='reader')
+        comments = self.write(
+            'comments.csv',
+            f'post,author,text,created\n'
+            f'{post.pk},reader,Комментарий,\n'
+            f'999,reader,Потерянный,\n',
+        )
+        follows = self.write(
+            'follows.csv',
+            'user,author\nreader,author\nreader,author\nauthor,author\n',
+        )
+        call_command(
+            'import_data', 'comments', comments,
+            stdout=StringIO(), stderr=StringIO(),
+        )
+        call_command(
+            'import_data', 'follows', follows,
+            stdout=StringIO(), stderr=StringIO(),
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertTrue(FeedEntry.objects.filter(
+            user=reader, post=post
+        ).exists())
+
+
+class ExportDataTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.posts = [
+            Post.objects.create(text=f'Пост {number}', author=cls.author)
+            for number in range(5)
+        ]
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def export(self, *args, **options):
+        call_command(
+            'export_data', *args, stderr=StringIO(), batch_size=2, **options
+        )
+
+    def test_export_jsonl_to_stdout(self):
+        """Все строки выгружаются пачками в JSONL по возрастанию id."""
+        out = StringIO()
+        self.export('posts', stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(
+            [row['id'] for row in rows], [post.pk for post in self.posts]
+        )
+        self.assertEqual(rows[0]['author_id'], self.author.pk)
+
+    def test_resume_from_checkpoint(self):
+        """С файлом контрольной точки выгрузка продолжается и
+        дописывается в тот же файл без повторного заголовка CSV."""
+        output = os.path.join(self.directory, 'posts.csv')
+        checkpoint = os.path.join(self.directory, 'posts.checkpoint')
+        self.export(
+            'posts', format='csv', output=output, checkpoint=checkpoint
+        )
+        with open(checkpoint) as file:
+            self.assertEqual(file.read(), str(self.posts[-1].pk))
+        new_post = Post.objects.create(text='Новый', author=self.author)
+        self.export(
+            'posts', format='csv', output=output, checkpoint=checkpoint
+        )
+        with open(output, encoding='utf-8', newline='') as file:
+            lines = file.read().splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['id', 'text'])
+        self.assertEqual(len(lines), len(self.posts) + 2)
+        self.assertTrue(lines[-1].startswith(f'{new_post.pk},Новый,'))
+
+    def test_columns_format(self):
+        """Формат columns отдаёт пачки столбцами с id последней строки."""
+        out = StringIO()
+        self.export('posts', format='columns', after=self.posts[0].pk,
+                    stdout=out)
+        chunks = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(
+            chunks[0]['columns']['text'], ['Пост 1', 'Пост 2']
+        )
+        self.assertEqual(chunks[-1]['last_id'], self.posts[-1].pk)
+
+
+class CollectMediaTest(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        media_settings = self.settings(
+            MEDIA_ROOT=directory,
+            WRITE_QUEUE_PATH=os.path.join(directory, 'queue.sqlite3'),
+        )
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.author = User.objects.create_user(username='author')
+
+    def upload(self, content):
+        return default_storage.save('posts/image.gif', ContentFile(content))
+
+    def collect(self, **options):
+        out = StringIO()
+        call_command('collect_media', grace=0, stdout=out, **options)
+        return out.getvalue()
+
+    def test_removes_unreferenced_files(self):
+        """Удаляются только файлы, на которые никто не ссылается."""
+        kept = self.upload(b'kept')
+        replaced = self.upload(b'replaced')
+        queued = self.upload(b'queued')
+        post = Post.objects.create(
+            text='Пост', author=self.author, image=replaced
+        )
+        Post.objects.create(text='Копия', author=self.author, image=kept)
+        post.image = kept
+        post.save()
+        get_queue().put('post', 'owner', {'image': queued})
+        self.assertIn('удалено: 1', self.collect(dry_run=True))
+        self.assertTrue(default_storage.exists(replaced))
+        self.collect()
+        self.assertFalse(default_storage.exists(replaced))
+        self.assertTrue(default_storage.exists(kept))
+        self.assertTrue(default_storage.exists(queued))
+
+    def test_grace_period(self):
+        """Свежие файлы не трогаются: их запись в базу могла не успеть."""
+        name = self.upload(b'fresh')
+        call_command('collect_media', stdout=StringIO())
+        self.assertTrue(default_storage.exists(name))
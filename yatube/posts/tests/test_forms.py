@@ -1,3 +1,4 @@
+import hashlib
 import shutil
 import tempfile
 
@@ -95,7 +96,8 @@ class FormViewsTest(TestCase):
         self.assertEqual(post.text, form_data['text'])
         self.assertEqual(post.author, self.post.author)
         self.assertEqual(post.group, self.group)
-        self.assertEqual(post.image.name, f'posts/{self.uploaded}')
+        digest = hashlib.sha256(self.small_gif).hexdigest()
+        self.assertEqual(post.image.name, f'posts/{digest[:2]}/{digest}.gif')
         self.assertEqual(response2.status_code, HTTPStatus.OK)
 
     def test_post_edit(self):
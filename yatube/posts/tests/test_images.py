@@ -0,0 +1,149 @@
+import hashlib
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from posts.forms import PostForm
+from .. import images
+from ..models import Post, Thumbnail, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def photo(size=(3000, 2000), orientation=None):
+    """JPEG, как с камеры: большой и с EXIF."""
+    exif = Image.Exif()
+    exif[0x010F] = 'Камера'
+    if orientation:
+        exif[0x0112] = orientation
+    buffer = BytesIO()
+    Image.new('RGB', size, 'teal').save(buffer, 'JPEG', exif=exif)
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_IMAGE_MAX_SIZE=800)
+class ImagePipelineTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='photographer')
+
+    def create_post(self, content, name='camera.jpg'):
+        return Post.objects.create(
+            author=self.author,
+            text='Фото',
+            image=SimpleUploadedFile(name, content, 'image/jpeg'),
+        )
+
+    def test_reencodes_original(self):
+        """Исходник уменьшается, теряет EXIF и заменяется файлом с именем
+        по хешу содержимого."""
+        post = self.create_post(photo(orientation=6))
+        images.process_post_image(post.pk)
+        post.refresh_from_db()
+        self.assertTrue(post.image.name.startswith(images.RENDITIONS_DIR))
+        with post.image.open('rb') as file:
+            data = file.read()
+        self.assertIn(hashlib.sha256(data).hexdigest()[:32], post.image.name)
+        image = Image.open(BytesIO(data))
+        self.assertEqual(image.size, (533, 800))
+        self.assertFalse(image.getexif())
+
+    def test_alternative_formats(self):
+        """Картинкой поста становится JPEG, остальные форматы
+        сохраняются рядом."""
+        post = self.create_post(photo())
+        images.process_post_image(post.pk)
+        post.refresh_from_db()
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        self.assertEqual(
+            set(Thumbnail.objects.filter(
+                post=post, name__startswith='original:'
+            ).values_list('name', flat=True)),
+            {'original:' + ext for _, ext in images.alternatives()},
+        )
+
+    def test_picture_sources(self):
+        """Миниатюры в других форматах отдаются через <picture>."""
+        post = self.create_post(photo(size=(64, 64)))
+        images.process_post_image(post.pk)
+        post.refresh_from_db()
+        for name in ('feed', 'feed:webp'):
+            Thumbnail.objects.create(
+                post=post, name=name, source=post.image.name,
+                url=f'/media/{name}', width=64, height=64,
+            )
+        with mock.patch.object(
+            images, 'alternatives', return_value=[('WEBP', 'webp')]
+        ):
+            html = Template(
+                '{% load post_thumbnails %}{% post_picture post "feed" %}'
+            ).render(Context({'post': post}))
+        self.assertIn(
+            '<source srcset="/media/feed:webp" type="image/webp">', html
+        )
+        self.assertIn('<img class="card-img my-2" src="/media/feed">', html)
+
+    def test_identical_images_stored_once(self):
+        """Одинаковые картинки разных постов хранятся одним файлом."""
+        content = photo(size=(1000, 1000))
+        first = self.create_post(content, 'first.jpg')
+        second = self.create_post(content, 'second.jpg')
+        for post in (first, second):
+            images.process_post_image(post.pk)
+            post.refresh_from_db()
+        self.assertEqual(first.image.name, second.image.name)
+
+    def test_command_processes_legacy_images(self):
+        """generate_thumbnails перекодирует старые картинки, даже если
+        миниатюры к ним уже есть, и создаёт миниатюры для новых файлов."""
+        post = self.create_post(photo(size=(64, 64)), 'legacy.jpg')
+        legacy = post.image.name
+        for name in settings.POST_THUMBNAILS:
+            Thumbnail.objects.create(
+                post=post, name=name, source=legacy,
+                url=f'/media/{name}', width=64, height=64,
+            )
+        call_command('generate_thumbnails', workers=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertTrue(post.image.name.startswith(images.RENDITIONS_DIR))
+        self.assertEqual(
+            Thumbnail.objects.filter(
+                post=post, source=post.image.name,
+                name__in=settings.POST_THUMBNAILS,
+            ).count(),
+            len(settings.POST_THUMBNAILS),
+        )
+
+    @override_settings(POST_IMAGE_MAX_BYTES=100, POST_IMAGE_MAX_PIXELS=10)
+    def test_upload_limits(self):
+        """Форма отклоняет слишком тяжёлые и слишком большие картинки."""
+        form = PostForm(
+            data={'text': 'Фото'},
+            files={'image': SimpleUploadedFile(
+                'camera.jpg', photo(size=(64, 64)), 'image/jpeg'
+            )},
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn('Файл больше', form.errors['image'][0])
+        with self.settings(POST_IMAGE_MAX_BYTES=10 ** 6):
+            form = PostForm(
+                data={'text': 'Фото'},
+                files={'image': SimpleUploadedFile(
+                    'camera.jpg', photo(size=(64, 64)), 'image/jpeg'
+                )},
+            )
+            self.assertFalse(form.is_valid())
+            self.assertIn('мегапикселей', form.errors['image'][0])
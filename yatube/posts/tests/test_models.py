@@ -1,7 +1,14 @@
+from io import StringIO
+from unittest import skipUnless
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
 
-from ..models import Group, Post
+from ..counters import counters_for
+from ..models import Comment, Counters, FeedEntry, Follow, Group, Post
+from ..utils import keyset
 
 User = get_user_model()
 
@@ -66,3 +73,115 @@ class PostModelTest(TestCase):
             with self.subTest(field=field):
                 self.assertEqual(
                     post._meta.get_field(field).help_text, expected_value)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='CounterAuthor')
+        cls.reader = User.objects.create_user(username='CounterReader')
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются вместе с постами, подписками и комментариями."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        Comment.objects.create(post=post, author=self.reader, text='Ок')
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        author_counters = Counters.objects.get(user=self.author)
+        self.assertEqual(author_counters.posts_count, 1)
+        self.assertEqual(author_counters.followers_count, 1)
+        self.assertEqual(
+            Counters.objects.get(user=self.reader).following_count, 1
+        )
+        follow.delete()
+        post.delete()
+        author_counters.refresh_from_db()
+        self.assertEqual(author_counters.posts_count, 0)
+        self.assertEqual(author_counters.followers_count, 0)
+
+    def test_recount_counters_command(self):
+        """Команда recount_counters исправляет расхождения."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Ок')
+        Counters.objects.filter(user=self.author).update(posts_count=7)
+        Post.objects.filter(pk=post.pk).update(comments_count=5)
+        Counters.objects.filter(user=self.reader).delete()
+        call_command('recount_counters', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(counters_for(self.author).posts_count, 1)
+        self.assertTrue(Counters.objects.filter(user=self.reader).exists())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'План запроса в формате SQLite')
+class FeedIndexesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='IndexAuthor')
+        cls.group = Group.objects.create(
+            title='Группа',
+            slug='index-slug',
+            description='Описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост'
+        )
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return ' '.join(str(row) for row in cursor.fetchall())
+
+    def test_feed_queries_use_indexes(self):
+        """Запросы лент читают посты по составным индексам."""
+        ordering = ('-pub_date', '-pk')
+        queries = (
+            (Post.objects.order_by(*ordering), 'post_pub_date_idx'),
+            (
+                self.author.posts.order_by(*ordering),
+                'post_author_pub_date_idx'
+            ),
+            (
+                self.group.posts.order_by(*ordering),
+                'post_group_pub_date_idx'
+            ),
+            (self.post.comments.all(), 'comment_post_created_idx'),
+            (
+                Follow.objects.filter(user=self.author, author=self.author),
+                'INDEX sqlite_autoindex_posts_follow_1 '
+                '(user_id=? AND author_id=?)'
+            ),
+        )
+        for queryset, expected in queries:
+            with self.subTest(expected=expected):
+                self.assertIn(expected, self.query_plan(queryset[:10]))
+
+    def test_keyset_pages_search_index_range(self):
+        """Страница по курсору ищет диапазон по индексу, а не фильтрует
+        записи с начала."""
+        moment, pk = self.post.pub_date, self.post.pk
+        sources = (
+            (Post.objects.all(), {}, 'post_pub_date_idx (pub_date'),
+            (
+                self.author.posts.all(), {},
+                'post_author_pub_date_idx (author_id=? AND pub_date'
+            ),
+            (
+                self.post.comments.all(), {'field': 'created'},
+                'comment_post_created_idx (post_id=? AND created'
+            ),
+            (
+                FeedEntry.objects.filter(user=self.author), {'pk': 'post_id'},
+                'feed_user_pub_date_idx (user_id=? AND pub_date'
+            ),
+        )
+        for queryset, options, expected in sources:
+            for backwards in (False, True):
+                with self.subTest(expected=expected, backwards=backwards):
+                    self.assertIn(expected, self.query_plan(keyset(
+                        queryset, (moment, pk, backwards), **options
+                    )[:10]))
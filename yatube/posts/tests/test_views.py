@@ -1,16 +1,33 @@
+import os
 import shutil
 import tempfile
+from io import StringIO
+from unittest import mock, skipUnless
 
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.http import urlencode
 
+from core.write_queue import WriteQueue, get_queue
 from posts.forms import PostForm
-from ..models import Follow, Group, Post, User
+from .. import feeds, hydration, recent
+from ..fragments import fragment_key
+from ..thumbnails import generate_thumbnails
+from ..utils import encode_cursor
+from ..write_behind import apply_pending
+from ..models import (
+    Comment, Counters, FeedEntry, Follow, Group, Post, Thumbnail, User
+)
 
 User = get_user_model()
 
@@ -139,19 +156,95 @@ class PostViewsTest(TestCase):
                     self.assertIn('form', response.context)
                     self.assertIsInstance(response.context['form'], PostForm)
 
-    def test_cache_index(self):
-        """Тест кеширования главной страницы."""
+    def test_pregenerated_thumbnails(self):
+        """Лента показывает готовую миниатюру, а до её создания —
+        исходную картинку."""
+        cache.clear()
+        Thumbnail.objects.filter(post=self.post).delete()
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, self.post.image.url)
+        generate_thumbnails(self.post.pk)
+        self.assertEqual(
+            Thumbnail.objects.filter(post=self.post).count(),
+            len(settings.POST_THUMBNAILS)
+        )
+        feed_thumbnail = Thumbnail.objects.get(post=self.post, name='feed')
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, feed_thumbnail.url)
+
+    def test_thumbnails_single_query(self):
+        """Миниатюры всей страницы загружаются одним запросом."""
+        for number in range(3):
+            Post.objects.create(
+                author=self.user,
+                text=f'Пост с картинкой {number}',
+                image=self.post.image.name,
+            )
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(reverse('posts:index'))
+        thumbnail_queries = [
+            query for query in queries
+            if 'FROM "posts_thumbnail"' in query['sql']
+        ]
+        self.assertEqual(len(thumbnail_queries), 1)
+
+    def test_cache_post_fragments(self):
+        """Фрагменты постов кешируются, правка поста видна сразу."""
+        cache.clear()
         new_post = Post.objects.create(
             author=self.user,
             text='Новый тестовый пост',
         )
-        response_1 = self.authorized_client.get(reverse('posts:index'))
+        self.authorized_client.get(reverse('posts:index'))
+        self.assertIsNotNone(
+            cache.get(fragment_key(new_post, '00'))
+        )
+        new_post.text = 'Исправленный тестовый пост'
+        new_post.save()
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Исправленный тестовый пост')
+        self.assertContains(response, 'Редактировать запись')
         new_post.delete()
-        response_2 = self.authorized_client.get(reverse('posts:index'))
-        self.assertEqual(response_1.content, response_2.content)
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'Исправленный тестовый пост')
+
+    def test_group_delete_bumps_post_version(self):
+        """Удаление группы сбрасывает фрагменты её постов."""
+        cache.clear()
+        group = Group.objects.create(title='Временная', slug='temporary')
+        post = Post.objects.create(author=self.user, text='Пост', group=group)
+        self.authorized_client.get(reverse('posts:index'))
+        group.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.version, 1)
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'Временная')
+
+    def test_author_save_bumps_version_only_on_name_change(self):
+        """Полное сохранение автора без смены имени не сбрасывает
+        фрагменты его постов, смена имени — сбрасывает."""
+        post = Post.objects.create(author=self.user, text='Пост автора')
+        author = User.objects.get(pk=self.user.pk)
+        author.set_password('another')
+        author.save()
+        post.refresh_from_db()
+        self.assertEqual(post.version, 0)
+        author.last_name = 'Новаяфамилия'
+        author.save()
+        post.refresh_from_db()
+        self.assertEqual(post.version, 1)
+
+    def test_fragment_not_shared_with_stale_author(self):
+        """Фрагмент со старым именем автора не достаётся процессу,
+        который уже видит новое."""
         cache.clear()
-        response_3 = self.authorized_client.get(reverse('posts:index'))
-        self.assertNotEqual(response_1.content, response_3.content)
+        self.authorized_client.get(reverse('posts:index'))
+        User.objects.filter(pk=self.user.pk).update(first_name='Новоеимя')
+        hydration.AUTHORS.clear()
+        hydration.GROUPS.clear()
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Новоеимя')
 
 
 class FollowTest(TestCase):
@@ -211,6 +304,113 @@ class FollowTest(TestCase):
         count_follows_2 = Follow.objects.count()
         self.assertNotEqual(count_follows_2, count_follows_1)
 
+    def test_unfollow_keeps_other_followers(self):
+        """Отписка не затрагивает подписки других пользователей."""
+        self.authorized_user.get(
+            reverse('posts:profile_unfollow', args=(self.author.username,))
+        )
+        self.assertTrue(Follow.objects.filter(
+            user=self.follower, author=self.author
+        ).exists())
+
+    def test_feed_fan_out(self):
+        """Новый пост раскладывается в ленту подписчика,
+        а отписка убирает посты автора из ленты."""
+        new_post = Post.objects.create(
+            author=self.author,
+            text='Пост для ленты',
+        )
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.follower, post=new_post
+        ).exists())
+        self.authorized_follower.get(
+            reverse('posts:profile_unfollow', args=(self.author.username,))
+        )
+        self.assertFalse(FeedEntry.objects.filter(
+            user=self.follower
+        ).exists())
+
+    def test_feed_hot_author(self):
+        """Посты популярного автора подмешиваются в ленту при чтении,
+        а когда он перестаёт быть популярным, ленты дозаполняются."""
+        cache.clear()
+        with self.settings(FEED_FANOUT_LIMIT=0):
+            call_command('update_hot_authors', stdout=StringIO())
+        new_post = Post.objects.create(
+            author=self.author,
+            text='Пост популярного автора',
+        )
+        self.assertFalse(FeedEntry.objects.filter(post=new_post).exists())
+        response = self.authorized_follower.get(
+            reverse('posts:follow_index')
+        )
+        self.assertIn(new_post, response.context['page_obj'])
+        call_command('update_hot_authors', stdout=StringIO())
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.follower, post=new_post
+        ).exists())
+        cache.clear()
+
+    def test_rebuild_feeds(self):
+        """Пересборка заполняет ленты заново без постов популярных
+        авторов."""
+        cache.clear()
+        hot_author = User.objects.create_user(username='HotRebuild')
+        Follow.objects.create(user=self.follower, author=hot_author)
+        Post.objects.create(author=self.author, text='Обычный')
+        Post.objects.create(author=hot_author, text='Горячий')
+        Counters.objects.filter(user=hot_author).update(hot=True)
+        expected = {
+            (follow.user_id, post.pk, post.pub_date)
+            for follow in Follow.objects.exclude(author=hot_author)
+            for post in Post.objects.filter(author=follow.author_id)
+        }
+        feeds.rebuild(batch_size=1)
+        self.assertEqual(
+            set(FeedEntry.objects.values_list('user', 'post', 'pub_date')),
+            expected,
+        )
+        cache.clear()
+
+    @override_settings(QUANTITY_POSTS=2)
+    def test_feed_pages(self):
+        """Лента подписок листается курсором по записям ленты вместе с
+        постами популярных авторов и без повторов."""
+        cache.clear()
+        hot_author = User.objects.create_user(username='HotAuthor')
+        Follow.objects.create(user=self.follower, author=hot_author)
+        for number in range(3):
+            Post.objects.create(author=self.author, text=f'Обычный {number}')
+        Counters.objects.filter(user=hot_author).update(hot=True)
+        for number in range(2):
+            Post.objects.create(author=hot_author, text=f'Горячий {number}')
+        expected = list(Post.objects.filter(
+            author__in=(self.author, hot_author)
+        ).order_by('-pub_date', '-pk'))
+        seen, url = [], reverse('posts:follow_index')
+        while url:
+            page = self.authorized_follower.get(url).context['page_obj']
+            seen.extend(page)
+            url = page.next_cursor and (
+                reverse('posts:follow_index') + '?cursor=' + page.next_cursor
+            )
+        self.assertEqual(seen, expected)
+        cache.clear()
+
+    def test_follow_copies_all_posts(self):
+        """Подписка раскладывает в ленту все посты автора."""
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'Старый {number}')
+            for number in range(250)
+        )
+        self.authorized_user.get(
+            reverse('posts:profile_follow', args=(self.author.username,))
+        )
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.user).count(),
+            self.author.posts.count(),
+        )
+
 
 class PaginatorViewsTest(TestCase):
     @classmethod
@@ -235,6 +435,7 @@ class PaginatorViewsTest(TestCase):
             )
 
     def setUp(self):
+        cache.clear()
         self.authorized_user = Client()
         self.authorized_user.force_login(self.user)
 
@@ -260,3 +461,802 @@ class PaginatorViewsTest(TestCase):
                         self.assertEqual(
                             len(response.context['page_obj']), count_posts
                         )
+
+
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='CursorAuthor')
+        for new_posts in range(settings.NEW_POSTS):
+            Post.objects.create(
+                text='текст для курсора',
+                author=cls.author,
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_cursor_navigation(self):
+        """Курсоры ведут на следующую и обратно на первую страницу."""
+        url = reverse('posts:profile', args=(self.author.username,))
+        first_page = self.guest_client.get(url).context['page_obj']
+        self.assertEqual(len(first_page), settings.QUANTITY_POSTS)
+        self.assertIsNone(first_page.previous_cursor)
+        self.assertTrue(first_page.has_next())
+        second_page = self.guest_client.get(
+            url, {'cursor': first_page.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(
+            len(second_page), settings.QUANTITY_POSTS_NEXT_PAGE
+        )
+        self.assertIsNone(second_page.next_cursor)
+        self.assertTrue(second_page.has_previous())
+        self.assertFalse(set(first_page) & set(second_page))
+        previous_page = self.guest_client.get(
+            url, {'cursor': second_page.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(previous_page), list(first_page))
+        self.assertFalse(previous_page.has_previous())
+
+    def test_past_end_cursor(self):
+        """Курсор за последним постом даёт пустую страницу с
+        курсором назад."""
+        url = reverse('posts:profile', args=(self.author.username,))
+        oldest = Post.objects.order_by('pub_date', 'pk').first()
+        page = self.guest_client.get(
+            url, {'cursor': encode_cursor(oldest)}
+        ).context['page_obj']
+        self.assertEqual(len(page), 0)
+        self.assertFalse(page.has_next())
+        self.assertIsNone(page.next_cursor)
+        previous_page = self.guest_client.get(
+            url, {'cursor': page.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(len(previous_page), settings.QUANTITY_POSTS)
+
+    def test_invalid_cursor(self):
+        """Испорченный курсор открывает первую страницу."""
+        response = self.guest_client.get(
+            reverse('posts:index'), {'cursor': 'не-курсор'}
+        )
+        self.assertEqual(
+            len(response.context['page_obj']), settings.QUANTITY_POSTS
+        )
+
+
+class RecentWriteThroughTest(TransactionTestCase):
+    """Списки id правятся после коммита, поэтому нужны настоящие
+    транзакции."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='RecentAuthor')
+        self.group = Group.objects.create(title='Свежие', slug='recent')
+        self.other_group = Group.objects.create(
+            title='Другие', slug='other'
+        )
+        for number in range(3):
+            Post.objects.create(
+                text=f'Свежий пост {number}',
+                author=self.author,
+                group=self.group,
+            )
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.client.get(reverse('posts:group_list', args=(self.group.slug,)))
+        self.client.get(reverse('posts:profile', args=(self.author.username,)))
+
+    def cached_ids(self, key):
+        return [pk for _, pk in cache.get(key)[0]]
+
+    def test_write_through(self):
+        """Списки id правятся при создании, переносе и удалении поста."""
+        group_key = recent.group_key(self.group.pk)
+        author_key = recent.author_key(self.author.pk)
+        new_post = Post.objects.create(
+            text='Новый пост', author=self.author, group=self.group
+        )
+        self.assertEqual(self.cached_ids(group_key)[0], new_post.pk)
+        self.assertEqual(self.cached_ids(author_key)[0], new_post.pk)
+        self.author_client.post(
+            reverse('posts:post_edit', args=(new_post.pk,)),
+            {'text': 'Новый пост', 'group': self.other_group.pk},
+        )
+        self.assertNotIn(new_post.pk, self.cached_ids(group_key))
+        self.assertIsNone(cache.get(recent.group_key(self.other_group.pk)))
+        new_post.delete()
+        self.assertEqual(
+            self.cached_ids(author_key),
+            list(self.author.posts.order_by(
+                '-pub_date', '-pk'
+            ).values_list('pk', flat=True)),
+        )
+
+    def test_rolled_back_post_not_listed(self):
+        """Пост из откатившейся транзакции в списки не попадает."""
+        group_key = recent.group_key(self.group.pk)
+        expected = self.cached_ids(group_key)
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                Post.objects.create(
+                    text='Откатится', author=self.author, group=self.group
+                )
+                self.assertEqual(self.cached_ids(group_key), expected)
+                raise RuntimeError
+        self.assertEqual(self.cached_ids(group_key), expected)
+
+
+class RecentPostsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='RecentAuthor')
+        cls.group = Group.objects.create(title='Свежие', slug='recent')
+        cls.other_group = Group.objects.create(title='Другие', slug='other')
+        for number in range(settings.NEW_POSTS):
+            Post.objects.create(
+                text=f'Свежий пост {number}',
+                author=cls.author,
+                group=cls.group,
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def cached_ids(self, key):
+        return [pk for _, pk in cache.get(key)[0]]
+
+    def database_ids(self, queryset):
+        return list(
+            queryset.order_by('-pub_date', '-pk').values_list('pk', flat=True)
+        )
+
+    def test_first_page_from_cached_ids(self):
+        """Первая страница группы собирается из списка id и in_bulk без
+        сортировки ленты в базе."""
+        url = reverse('posts:group_list', args=(self.group.slug,))
+        self.author_client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.author_client.get(url)
+        expected = self.database_ids(self.group.posts.all())
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            expected[:settings.QUANTITY_POSTS],
+        )
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if '"posts_post"."pub_date" DESC' in query['sql']
+        ])
+
+    @override_settings(RECENT_POSTS_SIZE=5)
+    def test_deep_pages_fall_through(self):
+        """Страницы за пределами списка берутся из базы."""
+        expected = self.database_ids(self.author.posts.all())
+        url = reverse('posts:profile', args=(self.author.username,))
+        pages = []
+        for page in (1, 2):
+            response = self.client.get(url, {'page': page})
+            pages += [post.pk for post in response.context['page_obj']]
+        self.assertEqual(pages, expected)
+        cache.clear()
+        first_page = self.client.get(url).context['page_obj']
+        second_page = self.client.get(
+            url, {'cursor': first_page.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(
+            [post.pk for post in [*first_page, *second_page]], expected
+        )
+
+
+class HydrationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='hydrated', first_name='Анна', password='secret'
+        )
+        cls.group = Group.objects.create(title='Общая', slug='shared')
+        for number in range(3):
+            Post.objects.create(
+                text=f'Пост {number}', author=cls.author, group=cls.group
+            )
+
+    def setUp(self):
+        cache.clear()
+        hydration.AUTHORS.clear()
+        hydration.GROUPS.clear()
+
+    def feed(self):
+        cache.clear()
+        return self.client.get(reverse('posts:index')).context['page_obj']
+
+    def test_authors_and_groups_shared(self):
+        """Авторы и группы загружаются один раз на все посты и запросы."""
+        first_page = self.feed()
+        with CaptureQueriesContext(connection) as queries:
+            second_page = self.feed()
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if 'FROM "auth_user"' in query['sql']
+            or 'FROM "posts_group"' in query['sql']
+        ])
+        authors = {id(post.author) for post in [*first_page, *second_page]}
+        groups = {id(post.group) for post in [*first_page, *second_page]}
+        self.assertEqual((len(authors), len(groups)), (1, 1))
+        self.assertIn('password', first_page[0].author.get_deferred_fields())
+
+    def test_rename_forgets_author(self):
+        """Правка автора видна в ленте сразу."""
+        self.feed()
+        author = User.objects.get(pk=self.author.pk)
+        author.first_name = 'Мария'
+        author.save()
+        self.assertEqual(self.feed()[0].author.first_name, 'Мария')
+
+
+class CommentsPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Commentator')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        for number in range(settings.QUANTITY_COMMENTS + 5):
+            Comment.objects.create(
+                post=cls.post,
+                author=cls.author,
+                text=f'Комментарий {number}',
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_post_detail_first_comments(self):
+        """На странице поста только первая порция комментариев."""
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,))
+        )
+        comments = response.context['comments']
+        self.assertEqual(len(comments), settings.QUANTITY_COMMENTS)
+        self.assertEqual(
+            comments[0].text,
+            f'Комментарий {settings.QUANTITY_COMMENTS + 4}'
+        )
+        self.assertIsNotNone(comments.next_cursor)
+
+    def test_post_comments_next_batch(self):
+        """Следующая порция комментариев отдаётся отдельным запросом
+        с авторами за один запрос."""
+        first = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,))
+        ).context['comments']
+        url = reverse('posts:post_comments', args=(self.post.pk,))
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'cursor': first.next_cursor})
+        self.assertTemplateUsed(response, 'posts/includes/comment_list.html')
+        self.assertEqual(len(response.context['comments']), 5)
+        self.assertContains(response, 'Комментарий 0')
+        self.assertNotContains(response, 'Показать ещё')
+
+    def test_comments_past_end_cursor(self):
+        """Курсор за последним комментарием даёт пустую порцию, а не
+        первую снова."""
+        oldest = self.post.comments.order_by('created', 'pk').first()
+        response = self.client.get(
+            reverse('posts:post_comments', args=(self.post.pk,)),
+            {'cursor': encode_cursor(oldest, field='created')},
+        )
+        comments = response.context['comments']
+        self.assertEqual(len(comments), 0)
+        self.assertFalse(comments.has_next())
+        self.assertIsNone(comments.next_cursor)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Индекс FTS5 есть только в SQLite')
+class SearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Астрономия', slug='astro', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Наблюдали <b>комету</b> над городом',
+            group=cls.group,
+        )
+        cls.other = Post.objects.create(
+            author=cls.author, text='Рецепт пирога'
+        )
+        Comment.objects.create(
+            post=cls.other, author=cls.author, text='Добавьте корицу'
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query, **params):
+        return self.client.get(
+            reverse('posts:search'), {'q': query, **params}
+        )
+
+    def test_search_highlights_text(self):
+        """Поиск находит пост по префиксу слова и подсвечивает его."""
+        response = self.search('комет')
+        self.assertEqual(list(response.context['page_obj']), [self.post])
+        self.assertContains(response, '<mark>комету</mark>')
+        self.assertContains(response, '&lt;b&gt;')
+
+    def test_search_group_title_and_comments(self):
+        """В индекс попадают название группы и комментарии."""
+        self.assertEqual(
+            list(self.search('астрономия').context['page_obj']), [self.post]
+        )
+        self.assertEqual(
+            list(self.search('корицу').context['page_obj']), [self.other]
+        )
+
+    def test_index_follows_changes(self):
+        """Правка и удаление поста сразу отражаются в поиске."""
+        other = Post.objects.get(pk=self.other.pk)
+        other.text = 'Рецепт кометы'
+        other.save()
+        self.assertEqual(
+            self.search('комет').context['page_obj'].paginator.count, 2
+        )
+        Post.objects.get(pk=self.post.pk).delete()
+        self.assertEqual(
+            list(self.search('комет').context['page_obj']), [self.other]
+        )
+
+    def test_comment_words_combine_with_post(self):
+        """Слова запроса ищутся и в посте, и в каждом его комментарии;
+        удалённый комментарий из поиска пропадает."""
+        comment = Comment.objects.create(
+            post=self.post, author=self.author, text='Хвост был ярким'
+        )
+        self.assertEqual(
+            list(self.search('комет хвост').context['page_obj']),
+            [self.post],
+        )
+        comment.delete()
+        self.assertEqual(
+            self.search('хвост').context['page_obj'].paginator.count, 0
+        )
+
+    def test_comment_does_not_reindex_post(self):
+        """Новый комментарий добавляет в индекс одну строку и не
+        перечитывает пост с остальными комментариями."""
+        self.client.force_login(self.author)
+        with CaptureQueriesContext(connection) as queries:
+            Comment.objects.create(
+                post=self.other, author=self.author, text='И ваниль'
+            )
+        statements = [query['sql'] for query in queries.captured_queries]
+        self.assertFalse(any(
+            'posts_post_fts' in sql or 'FROM "posts_comment"' in sql
+            for sql in statements
+        ))
+        self.assertEqual(
+            list(self.search('ваниль корицу').context['page_obj']),
+            [self.other],
+        )
+
+    def test_search_pagination_keeps_query(self):
+        """Ссылки пагинации сохраняют поисковый запрос."""
+        Post.objects.bulk_create([
+            Post(author=self.author, text=f'Комета номер {number}')
+            for number in range(settings.QUANTITY_POSTS)
+        ])
+        call_command('rebuild_search_index', stdout=StringIO())
+        response = self.search('комет')
+        self.assertContains(
+            response, '?{}&amp;page=2'.format(urlencode({'q': 'комет'}))
+        )
+        second = self.search('комет', page=2).context['page_obj']
+        self.assertEqual(len(second), 1)
+
+    def test_search_api(self):
+        """API поиска отдаёт найденные посты с подсветкой в JSON."""
+        response = self.client.get(
+            reverse('posts:search_api'), {'q': 'пирог'}
+        )
+        data = response.json()
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['results'][0]['id'], self.other.pk)
+        self.assertIn('<mark>пирога</mark>', data['results'][0]['highlight'])
+
+    def test_empty_query(self):
+        """Запрос без слов ничего не находит и не падает."""
+        response = self.search('"*()')
+        self.assertEqual(response.context['page_obj'].paginator.count, 0)
+
+    def test_admin_uses_index(self):
+        """Поиск в админке идёт по тому же индексу."""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'корицу'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.other]
+        )
+
+
+@override_settings(SEARCH_BACKEND='posts.search.DatabaseBackend')
+class DatabaseSearchTest(TestCase):
+    def test_database_backend(self):
+        """Запасной бэкенд ищет без индекса FTS5 на любой базе."""
+        author = User.objects.create_user(username='author')
+        post = Post.objects.create(author=author, text='Видели комету')
+        Post.objects.create(author=author, text='Рецепт пирога')
+        response = self.client.get(reverse('posts:search'), {'q': 'КОМЕТ'})
+        self.assertEqual(list(response.context['page_obj']), [post])
+        self.assertContains(response, '<mark>комет</mark>у')
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Пост', group=cls.group
+        )
+        cls.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(cls.group.slug,)),
+            reverse('posts:profile', args=(cls.author.username,)),
+            reverse('posts:post_detail', args=(cls.post.pk,)),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_not_modified(self):
+        """Повторный запрос с ETag или датой получает 304 без рендеринга."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn('no-cache', response['Cache-Control'])
+                with self.assertNumQueries(1 if url != self.urls[0] else 0):
+                    not_modified = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag']
+                    )
+                self.assertEqual(not_modified.status_code, 304)
+                self.assertEqual(self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+                ).status_code, 304)
+
+    def test_new_post_changes_feeds(self):
+        """Новый пост меняет валидаторы ленты, группы и профиля."""
+        etags = [self.client.get(url)['ETag'] for url in self.urls[:3]]
+        Post.objects.create(author=self.author, text='Ещё', group=self.group)
+        for url, etag in zip(self.urls, etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_comment_and_edit_change_post(self):
+        """Комментарий и правка поста меняют валидаторы его страницы."""
+        url = self.urls[3]
+        etag = self.client.get(url)['ETag']
+        Comment.objects.create(post=self.post, author=self.author, text='К')
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+        etag = self.client.get(url)['ETag']
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Исправленный пост'
+        post.save()
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+    def test_group_rename_changes_all_pages(self):
+        """Переименование группы меняет валидаторы всех страниц."""
+        etags = [self.client.get(url)['ETag'] for url in self.urls]
+        self.group.title = 'Новое название'
+        self.group.save()
+        for url, etag in zip(self.urls, etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_user(self):
+        """Гость и авторизованный пользователь получают разные ETag."""
+        guest = self.client.get(self.urls[0])['ETag']
+        self.client.force_login(self.author)
+        response = self.client.get(self.urls[0], HTTP_IF_NONE_MATCH=guest)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_login_ignores_anonymous_date(self):
+        """Дата страницы гостя не даёт 304 после входа."""
+        guest = self.client.get(self.urls[0])
+        self.assertIn('Cookie', guest['Vary'])
+        self.client.force_login(self.author)
+        response = self.client.get(
+            self.urls[0], HTTP_IF_MODIFIED_SINCE=guest['Last-Modified']
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_missing_object(self):
+        """Для несуществующей страницы валидаторов нет."""
+        response = self.client.get(
+            reverse('posts:group_list', args=('missing',))
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class PageCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.other = User.objects.create_user(username='other')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Пост', group=cls.group
+        )
+        cls.other_post = Post.objects.create(author=cls.other, text='Другой')
+        cls.index_url = reverse('posts:index')
+        cls.group_url = reverse('posts:group_list', args=(cls.group.slug,))
+        cls.author_url = reverse('posts:profile', args=('author',))
+        cls.other_url = reverse('posts:profile', args=('other',))
+        cls.detail_url = reverse('posts:post_detail', args=(cls.post.pk,))
+
+    def setUp(self):
+        cache.clear()
+        self.urls = (
+            self.index_url, self.group_url, self.author_url,
+            self.other_url, self.detail_url,
+        )
+        for url in self.urls:
+            self.client.get(url)
+
+    def cached(self):
+        return {
+            url for url in self.urls
+            if self.client.get(url).get('X-Cache') == 'HIT'
+        }
+
+    def test_surrogate_keys(self):
+        """Страницы помечены ключами постов, автора и группы."""
+        keys = self.client.get(self.group_url)['Surrogate-Key'].split()
+        self.assertEqual(keys, [
+            f'group-{self.group.pk}', f'post-{self.post.pk}'
+        ])
+        keys = self.client.get(self.detail_url)['Surrogate-Key'].split()
+        self.assertIn(f'author-{self.author.pk}', keys)
+        self.assertIn(f'comments-{self.post.pk}', keys)
+
+    def test_edit_purges_pages_with_post(self):
+        """Правка поста сбрасывает только страницы, где он показан."""
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Исправленный пост'
+        post.save()
+        self.assertEqual(self.cached(), {self.other_url})
+        self.assertContains(self.client.get(self.index_url), 'Исправленный')
+
+    def test_new_post_purges_feeds(self):
+        """Новый пост сбрасывает ленту, его группу и профиль автора."""
+        Post.objects.create(author=self.other, text='Новый')
+        self.assertEqual(
+            self.cached(), {self.group_url, self.author_url, self.detail_url}
+        )
+
+    def test_comment_purges_post_page(self):
+        """Комментарий сбрасывает только страницу поста."""
+        Comment.objects.create(post=self.post, author=self.other, text='К')
+        self.assertEqual(set(self.urls) - self.cached(), {self.detail_url})
+
+    def test_follow_purges_profiles(self):
+        """Подписка сбрасывает профили и страницы постов обоих."""
+        Follow.objects.create(user=self.other, author=self.author)
+        self.assertEqual(self.cached(), {self.index_url, self.group_url})
+
+    def test_authenticated_not_cached(self):
+        """Авторизованным страницы не отдаются из кеша."""
+        self.client.force_login(self.author)
+        self.assertFalse(self.client.get(self.index_url).has_header('X-Cache'))
+
+
+@override_settings(WRITE_BEHIND=True)
+class WriteBehindTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        queue_settings = override_settings(
+            WRITE_QUEUE_PATH=os.path.join(directory, 'queue.sqlite3')
+        )
+        queue_settings.enable()
+        self.addCleanup(queue_settings.disable)
+        self.client.force_login(self.author)
+
+    def test_post_visible_to_author_until_applied(self):
+        """Пост из очереди сразу виден автору и появляется после разбора."""
+        response = self.client.post(
+            reverse('posts:post_create'), {'text': 'Отложенный пост'},
+            follow=True,
+        )
+        self.assertFalse(Post.objects.filter(text='Отложенный пост').exists())
+        self.assertContains(response, 'Публикуется')
+        self.assertContains(response, 'Отложенный пост')
+        reader = Client()
+        reader.force_login(self.reader)
+        profile_url = reverse('posts:profile', args=('author',))
+        self.assertNotContains(reader.get(profile_url), 'Отложенный пост')
+        self.assertEqual(apply_pending(), (1, 0))
+        post = Post.objects.get(text='Отложенный пост')
+        self.assertEqual(post.author, self.author)
+        # В TestCase колбэки после коммита не вызываются, и списки свежих
+        # постов сами не обновятся.
+        cache.clear()
+        response = self.client.get(profile_url)
+        self.assertNotContains(response, 'Публикуется')
+        self.assertContains(response, 'Отложенный пост')
+
+    def test_comment_visible_to_author_until_applied(self):
+        """Комментарий из очереди виден автору на странице поста."""
+        url = reverse('posts:add_comment', args=(self.post.pk,))
+        response = self.client.post(url, {'text': 'Скоро'}, follow=True)
+        self.assertContains(response, 'Комментарий публикуется')
+        self.assertEqual(self.post.comments.count(), 0)
+        call_command('apply_writes', once=True, stdout=StringIO())
+        self.assertEqual(self.post.comments.get().text, 'Скоро')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+
+    def test_failed_write_does_not_block_batch(self):
+        """Ошибочная запись остаётся в очереди, остальные применяются."""
+        doomed = Post.objects.create(author=self.author, text='Удалю')
+        for post in (doomed, self.post):
+            self.client.post(
+                reverse('posts:add_comment', args=(post.pk,)),
+                {'text': 'Комментарий'},
+            )
+        doomed.delete()
+        with self.assertLogs('posts.write_behind', 'ERROR'):
+            self.assertEqual(apply_pending(), (1, 1))
+        self.assertEqual(get_queue().counts(), (0, 1))
+        self.assertEqual(self.post.comments.count(), 1)
+
+    def test_reapply_after_crash(self):
+        """Повтор разбора после сбоя не создаёт дубликатов."""
+        self.client.post(
+            reverse('posts:add_comment', args=(self.post.pk,)),
+            {'text': 'Однажды'},
+        )
+        with mock.patch.object(WriteQueue, 'done'):
+            apply_pending()
+        self.assertEqual(apply_pending(), (1, 0))
+        self.assertEqual(self.post.comments.count(), 1)
+        self.assertEqual(get_queue().counts(), (0, 0))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'реплика — копия файла SQLite')
+class ReplicaReadTest(TransactionTestCase):
+    """Реплика — снимок основной базы в отдельном файле SQLite, поэтому
+    всё, что записано после снимка, на ней не видно."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(
+            author=self.author, text='Пост до снимка'
+        )
+        self.addCleanup(Post.objects.all().delete)
+        # Сессии входят в снимок, иначе на реплике клиенты анонимны.
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(
+            User.objects.create_user(username='reader')
+        )
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'replica.sqlite3')
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM INTO %s', [path])
+        connections.databases['replica'] = {
+            **connections.databases['default'], 'NAME': path
+        }
+        self.addCleanup(self.remove_replica)
+        replica_settings = override_settings(
+            REPLICA_DATABASES=['replica'], REPLICA_MAX_LAG=0
+        )
+        replica_settings.enable()
+        self.addCleanup(replica_settings.disable)
+        Post.objects.create(author=self.author, text='Пост после снимка')
+
+    def remove_replica(self):
+        connections['replica'].close()
+        del connections.databases['replica']
+        if hasattr(connections._connections, 'replica'):
+            del connections._connections.replica
+
+    def write_comment(self):
+        response = self.author_client.post(
+            reverse('posts:add_comment', args=(self.post.pk,)),
+            {'text': 'Комментарий'},
+        )
+        self.assertEqual(Comment.objects.using('default').count(), 1)
+        return response
+
+    def test_feeds_read_from_replica(self):
+        """Ленты читаются с реплики."""
+        response = self.author_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Пост до снимка')
+        self.assertNotContains(response, 'Пост после снимка')
+
+    def test_anonymous_pages_read_from_replica(self):
+        """Страница для общего кеша рисуется по реплике и сохраняется."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'Пост после снимка')
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    @override_settings(REPLICA_MAX_LAG=60)
+    def test_recently_purged_page_not_cached(self):
+        """Страницу, ключи которой сбросили за время отставания реплики,
+        в кеш не кладут: следующий запрос рисует её заново."""
+        self.client.get(reverse('posts:index'))
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+    def test_fresh_pages_read_from_primary(self):
+        """Недавно изменённая страница рисуется по основной базе."""
+        with override_settings(REPLICA_MAX_LAG=60):
+            response = self.author_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Пост после снимка')
+
+    def test_reads_stick_to_primary_after_write(self):
+        """После записи пользователь читает с основной базы."""
+        response = self.write_comment()
+        self.assertIn('yatube_primary', response.cookies)
+        response = self.author_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Пост после снимка')
+        response = self.reader_client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'Пост после снимка')
+
+    def test_streamed_api_reads_from_replica(self):
+        """Потоковый ответ API читает с реплики, выбранной в
+        представлении."""
+        response = self.client.get(
+            reverse('posts:index_api'), {'limit': 1000}
+        )
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn('Пост до снимка', content)
+        self.assertNotIn('Пост после снимка', content)
+
+    @override_settings(REPLICA_STICKY_SECONDS=0)
+    def test_pin_expires(self):
+        """Когда окно закрепления истекло, чтение снова идёт с реплики."""
+        self.write_comment()
+        response = self.author_client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'Пост после снимка')
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_no_replicas(self):
+        """Без реплик всё читается с основной базы и cookie не ставится."""
+        response = self.write_comment()
+        self.assertNotIn('yatube_primary', response.cookies)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Пост после снимка')
@@ -0,0 +1,161 @@
+import logging
+import threading
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail.base import EXTENSIONS
+
+from . import conditional, images, surrogates
+from .models import Post, Thumbnail
+
+logger = logging.getLogger(__name__)
+
+ThumbnailFallback = namedtuple('ThumbnailFallback', 'url width height')
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def generate_thumbnails(post_id):
+    """Создаёт миниатюры всех форматов POST_THUMBNAILS для поста."""
+    post = Post.objects.filter(pk=post_id).only(
+        'pk', 'image', 'author_id', 'group_id'
+    ).first()
+    if post is None or not post.image:
+        return
+    for name, (geometry, options) in settings.POST_THUMBNAILS.items():
+        save_thumbnail(
+            post, name, get_thumbnail(post.image, geometry, **options)
+        )
+    generate_alternatives(post)
+    # Фрагменты ленты отрендерены с запасной картинкой — обновляем их.
+    Post.objects.filter(pk=post_id).update(version=F('version') + 1)
+    conditional.touch(*conditional.post_scopes(post))
+    surrogates.purge_posts([post_id])
+
+
+def save_thumbnail(post, name, image):
+    Thumbnail.objects.update_or_create(
+        post=post,
+        name=name,
+        defaults={
+            'source': post.image.name,
+            'url': image.url,
+            'width': image.width,
+            'height': image.height,
+        },
+    )
+
+
+def generate_alternatives(post):
+    """Миниатюры '<формат>:<расширение>' для <picture> из картинки поста
+    в других форматах, если sorl-thumbnail умеет их записывать."""
+    originals = {
+        thumbnail.name: thumbnail.url[len(settings.MEDIA_URL):]
+        for thumbnail in Thumbnail.objects.filter(
+            post=post, name__startswith='original:', source=post.image.name
+        )
+    }
+    for file_format, extension in images.alternatives():
+        source = originals.get('original:' + extension)
+        if source is None or file_format not in EXTENSIONS:
+            continue
+        for name, (geometry, options) in settings.POST_THUMBNAILS.items():
+            save_thumbnail(post, f'{name}:{extension}', get_thumbnail(
+                source, geometry, format=file_format, **options
+            ))
+
+
+def process(post_id):
+    """Перекодирует картинку поста, если она ещё не обработана, и создаёт
+    к ней миниатюры."""
+    images.process_post_image(post_id)
+    generate_thumbnails(post_id)
+
+
+def _generate_safely(post_id):
+    try:
+        process(post_id)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры поста %s', post_id)
+
+
+def _work(post_id):
+    try:
+        _generate_safely(post_id)
+    finally:
+        with _lock:
+            _pending.discard(post_id)
+        connections.close_all()
+
+
+def schedule(post_id):
+    """Ставит обработку картинки и создание миниатюр в пул воркеров,
+    не дублируя задачи."""
+    global _executor
+    if not settings.THUMBNAIL_WORKERS:
+        _generate_safely(post_id)
+        return
+    with _lock:
+        if post_id in _pending:
+            return
+        _pending.add(post_id)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+    _executor.submit(_work, post_id)
+
+
+def drain():
+    """Дожидается поставленных задач и останавливает пул; следующая
+    задача создаст его заново."""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def attach_thumbnails(posts):
+    """Загружает миниатюры всех постов страницы одним запросом."""
+    posts = [post for post in posts if post.image]
+    if not posts:
+        return
+    thumbnails = defaultdict(dict)
+    for thumbnail in Thumbnail.objects.filter(
+        post_id__in=[post.pk for post in posts]
+    ):
+        thumbnails[thumbnail.post_id][thumbnail.name] = thumbnail
+    for post in posts:
+        post.thumbnail_map = thumbnails[post.pk]
+
+
+def thumbnail_for(post, name):
+    """Готовая миниатюра поста или исходная картинка, пока её нет."""
+    if not post.image:
+        return None
+    if not hasattr(post, 'thumbnail_map'):
+        attach_thumbnails([post])
+    thumbnail = post.thumbnail_map.get(name)
+    if thumbnail is not None and thumbnail.source == post.image.name:
+        return thumbnail
+    return ThumbnailFallback(post.image.url, None, None)
+
+
+def thumbnail_sources(post, name):
+    """(MIME-тип, адрес) миниатюры в других форматах для <picture>."""
+    if not isinstance(thumbnail_for(post, name), Thumbnail):
+        return []
+    sources = []
+    for _, extension in images.alternatives():
+        thumbnail = post.thumbnail_map.get(f'{name}:{extension}')
+        if thumbnail is not None and thumbnail.source == post.image.name:
+            sources.append((images.MIME_TYPES[extension], thumbnail.url))
+    return sources
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 app_name = 'posts'
 
@@ -9,6 +9,11 @@ urlpatterns = [
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
     path('profile/<str:username>/', views.profile, name='profile'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path('create/', views.post_create, name='post_create'),
     path(
@@ -16,6 +21,23 @@ urlpatterns = [
         views.add_comment,
         name='add_comment'
     ),
+    path('search/', views.post_search, name='search'),
+    path('api/search/', views.post_search_api, name='search_api'),
+    path('api/posts/', api.index, name='index_api'),
+    path('api/group/<slug:slug>/', api.group_posts, name='group_list_api'),
+    path('api/profile/<str:username>/', api.profile, name='profile_api'),
+    path('api/follow/', api.follow_index, name='follow_index_api'),
+    path('api/export/<str:kind>/', api.export_data, name='export_api'),
+    path(
+        'api/posts/<int:post_id>/',
+        api.post_detail,
+        name='post_detail_api'
+    ),
+    path(
+        'api/posts/<int:post_id>/comments/',
+        api.post_comments,
+        name='post_comments_api'
+    ),
     path('follow/', views.follow_index, name='follow_index'),
     path(
         'profile/<str:username>/follow/',
@@ -1,8 +1,184 @@
+import base64
+import binascii
+import hashlib
+import json
+
 from django.conf import settings
 from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from core.caching import Namespace, get_or_compute
+from .hydration import hydrate
+from .recent import RecentPosts
+
+COUNTERS_CACHE = Namespace('counters')
+
+
+def make_cursor(moment, pk, backwards=False):
+    payload = json.dumps(
+        [moment.isoformat(), pk, int(backwards)], separators=(',', ':')
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def encode_cursor(obj, backwards=False, field='pub_date'):
+    return make_cursor(getattr(obj, field), obj.pk, backwards)
+
+
+def decode_cursor(token):
+    """Разбирает курсор; для испорченного курсора возвращает None."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        moment, pk, backwards = json.loads(base64.urlsafe_b64decode(padded))
+        moment = parse_datetime(moment)
+    except (TypeError, ValueError, binascii.Error):
+        return None
+    if moment is None or not isinstance(pk, int):
+        return None
+    return moment, pk, bool(backwards)
+
+
+def keyset(queryset, position, field='pub_date', pk='pk'):
+    """Записи после позиции курсора в порядке страницы: назад — по
+    возрастанию ключа (field, pk), иначе по убыванию."""
+    if position is None:
+        return queryset.order_by(f'-{field}', f'-{pk}')
+    moment, last, backwards = position
+    # Отдельное условие field <= moment даёт индексу границу диапазона:
+    # одно OR-условие база проверяет на каждой записи с начала индекса.
+    if backwards:
+        return queryset.filter(**{f'{field}__gte': moment}).filter(
+            Q(**{f'{field}__gt': moment}) | Q(**{f'{pk}__gt': last})
+        ).order_by(field, pk)
+    return queryset.filter(**{f'{field}__lte': moment}).filter(
+        Q(**{f'{field}__lt': moment}) | Q(**{f'{pk}__lt': last})
+    ).order_by(f'-{field}', f'-{pk}')
+
 
+def approximate_count(queryset):
+    """Количество записей выборки, закешированное на короткое время."""
+    key = COUNTERS_CACHE.key(
+        hashlib.md5(str(queryset.query).encode()).hexdigest()
+    )
+    return get_or_compute(
+        key, queryset.count, settings.APPROXIMATE_COUNT_TIMEOUT
+    )
 
-def paginator(request, posts):
-    paginator = Paginator(posts, settings.QUANTITY_POSTS)
+
+class CursorPaginator(Paginator):
+    """Постраничный вывод по ключу (дата, id) без OFFSET и COUNT(*).
+
+    Страницы адресуются непрозрачными курсорами next_cursor и
+    previous_cursor, которые выставляются у возвращаемой страницы.
+    """
+    cursor_mode = True
+
+    def __init__(self, object_list, per_page, field='pub_date', recent=None,
+                 feed=None):
+        self.field = field
+        self.recent = recent
+        self.feed = feed
+        super().__init__(object_list.order_by(f'-{field}', '-pk'), per_page)
+
+    @cached_property
+    def count(self):
+        if self.recent is not None and self.recent.complete:
+            return len(self.recent.rows)
+        return approximate_count(self.object_list)
+
+    def _recent_page(self, position):
+        """Страница вперёд из списка свежих id или None."""
+        start = 0
+        if position is not None:
+            moment, pk, backwards = position
+            start = None if backwards else self.recent.index_after(moment, pk)
+        if start is None:
+            return None
+        pks = self.recent.window(start, start + self.per_page + 1)
+        if pks is None:
+            return None
+        return self.recent.hydrate(pks[:self.per_page]), len(pks)
+
+    def get_page(self, cursor):
+        return self.page(cursor)
+
+    def page(self, cursor=None):
+        position = decode_cursor(cursor) if cursor else None
+        found = None
+        if self.recent is not None:
+            found = self._recent_page(position)
+        if found is not None:
+            object_list, fetched = found
+            return self._build_page(object_list, position, fetched)
+        if self.feed is not None:
+            rows = self.feed.rows(position, self.per_page + 1)
+            object_list = self.feed.hydrate(
+                [pk for _, pk in rows[:self.per_page]]
+            )
+            return self._build_page(object_list, position, len(rows))
+        object_list = list(keyset(
+            self.object_list, position, self.field
+        )[:self.per_page + 1])
+        return self._build_page(
+            object_list[:self.per_page], position, len(object_list)
+        )
+
+    def _build_page(self, object_list, position, fetched):
+        field = self.field
+        backwards = position is not None and position[2]
+        has_more = fetched > self.per_page
+        if backwards:
+            object_list.reverse()
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = position is not None, has_more
+        # Номер страницы неизвестен без OFFSET, поэтому для совместимости
+        # с Page.has_next()/has_previous() хватает соседей текущей страницы.
+        number = 2 if has_previous else 1
+        self.num_pages = number + int(has_next)
+        page = self._get_page(object_list, number, self)
+        page.next_cursor = page.previous_cursor = None
+        if not object_list:
+            # Курсор за краем ленты: пустая страница, назад — от него же.
+            if position is not None:
+                moment, pk, _ = position
+                if has_next:
+                    page.next_cursor = make_cursor(moment, pk)
+                if has_previous:
+                    page.previous_cursor = make_cursor(moment, pk, True)
+            return page
+        if has_next:
+            page.next_cursor = encode_cursor(object_list[-1], field=field)
+        if has_previous:
+            page.previous_cursor = encode_cursor(
+                object_list[0], backwards=True, field=field
+            )
+        return page
+
+
+def paginator(request, posts, recent=None, feed=None):
+    """recent — список свежих id ленты (posts.recent.RecentIds), из
+    которого собираются первые страницы; feed — лента подписок
+    (posts.feeds.FollowFeed), которая сама читает страницы по курсору."""
     page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+    if not settings.CURSOR_PAGINATION or page_number is not None:
+        if recent is not None:
+            posts = RecentPosts(recent)
+        page = Paginator(posts, settings.QUANTITY_POSTS).get_page(page_number)
+    else:
+        page = CursorPaginator(
+            posts, settings.QUANTITY_POSTS, recent=recent, feed=feed
+        ).get_page(request.GET.get('cursor'))
+    page.object_list = hydrate(page.object_list)
+    return page
+
+
+def comments_page(request, post):
+    paginator = CursorPaginator(
+        post.comments.select_related('author'),
+        settings.QUANTITY_COMMENTS,
+        field='created',
+    )
+    return paginator.get_page(request.GET.get('cursor'))
@@ -1,24 +1,87 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
+from django.utils.http import urlencode
 
+from core.db_router import read_from_replica
+from core.page_cache import add_surrogate_keys, anonymous_page_cache
+from . import conditional, recent, search, surrogates, thumbnails, write_behind
+from .counters import counters_for
+from .feeds import FollowFeed
 from .forms import PostForm, CommentForm
+from .fragments import attach_fragments
 from .models import Follow, Group, Post, User
-from .utils import paginator
+from .utils import comments_page, paginator
 
 
+def index_state():
+    return (conditional.INDEX,), 0
+
+
+def group_state(slug):
+    group_id = Group.objects.filter(
+        slug=slug
+    ).values_list('pk', flat=True).first()
+    if group_id is None:
+        return None
+    return (conditional.group_scope(group_id),), 0
+
+
+def profile_state(username):
+    user_id = User.objects.filter(
+        username=username
+    ).values_list('pk', flat=True).first()
+    if user_id is None:
+        return None
+    return (conditional.profile_scope(user_id),), 0
+
+
+def post_state(post_id):
+    post = Post.objects.filter(pk=post_id).values('author', 'updated').first()
+    if post is None:
+        return None
+    scopes = (
+        conditional.post_scope(post_id),
+        conditional.profile_scope(post['author']),
+    )
+    return scopes, post['updated'].timestamp()
+
+
+@read_from_replica
+@conditional.condition(index_state)
+@anonymous_page_cache
 def index(request):
-    posts = Post.objects.select_related('author', 'group').all()
+    posts = Post.objects.all()
     page_obj = paginator(request, posts=posts)
+    attach_fragments(page_obj)
+    add_surrogate_keys(
+        request, surrogates.INDEX, *surrogates.post_keys(page_obj)
+    )
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/index.html', context)
 
 
+@read_from_replica
+@conditional.condition(group_state)
+@anonymous_page_cache
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related('author').all()
-    page_obj = paginator(request, posts=posts)
+    posts = group.posts.all()
+    page_obj = paginator(
+        request, posts=posts, recent=recent.for_group(group, posts)
+    )
+    attach_fragments(page_obj, hide_group=True)
+    add_surrogate_keys(
+        request,
+        surrogates.group_key(group.pk),
+        *surrogates.post_keys(page_obj),
+    )
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -26,42 +89,131 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@read_from_replica
+@conditional.condition(profile_state)
+@anonymous_page_cache
 def profile(request, username):
     author = get_object_or_404(User, username=username)
-    posts = author.posts.select_related('group').all()
-    page_obj = paginator(request, posts=posts)
+    posts = author.posts.all()
+    page_obj = paginator(
+        request, posts=posts, recent=recent.for_author(author, posts)
+    )
+    attach_fragments(page_obj, hide_author=True)
+    add_surrogate_keys(
+        request,
+        surrogates.author_key(author.pk),
+        *surrogates.post_keys(page_obj),
+    )
     following = Follow.objects.filter(
         user=request.user.id,
         author=author
     ).exists
     context = {
         'author': author,
+        'counters': counters_for(author),
         'following': following,
         'page_obj': page_obj,
     }
+    if request.user == author:
+        context['pending_posts'] = write_behind.pending(request, 'post')
     return render(request, 'posts/profile.html', context)
 
 
+@read_from_replica
+@conditional.condition(post_state)
+@anonymous_page_cache
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.select_related('author__counters', 'group'),
+        pk=post_id
+    )
+    add_surrogate_keys(
+        request,
+        surrogates.post_key(post.pk),
+        surrogates.author_key(post.author_id),
+        surrogates.comments_key(post.pk),
+    )
+    comments = comments_page(request, post)
     form = CommentForm(request.POST or None)
     context = {
         'form': form,
         'post': post,
+        'counters': counters_for(post.author),
         'comments': comments,
+        'pending_comments': write_behind.pending(
+            request, 'comment', post=post.pk
+        ),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@read_from_replica
+@anonymous_page_cache
+def post_comments(request, post_id):
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    add_surrogate_keys(request, surrogates.comments_key(post.pk))
+    context = {
+        'post': post,
+        'comments': comments_page(request, post),
+    }
+    return render(request, 'posts/includes/comment_list.html', context)
+
+
+def search_page(request):
+    query = request.GET.get('q', '').strip()
+    results = search.get_backend().search(query) if query else []
+    return query, Paginator(results, settings.QUANTITY_POSTS).get_page(
+        request.GET.get('page')
+    )
+
+
+def post_search(request):
+    query, page_obj = search_page(request)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'pagination_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def post_search_api(request):
+    query, page_obj = search_page(request)
+    results = [
+        {
+            'id': post.pk,
+            'author': post.author.username,
+            'group': post.group.slug if post.group else None,
+            'pub_date': post.pub_date.isoformat(),
+            'text': post.text,
+            'highlight': post.highlight,
+            'url': reverse('posts:post_detail', args=(post.pk,)),
+        }
+        for post in page_obj
+    ]
+    return JsonResponse({
+        'query': query,
+        'count': page_obj.paginator.count,
+        'page': page_obj.number,
+        'num_pages': page_obj.paginator.num_pages,
+        'results': results,
+    }, json_dumps_params={'ensure_ascii': False})
+
+
 @login_required
+@transaction.atomic
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
     if not form.is_valid():
         return render(request, 'posts/create_post.html', {'form': form})
+    if write_behind.enabled():
+        write_behind.queue_post(request, form)
+        return redirect('posts:profile', request.user.username)
     post = form.save(commit=False)
     post.author = request.user
     post.save()
+    if post.image:
+        transaction.on_commit(lambda: thumbnails.schedule(post.pk))
     return redirect('posts:profile', post.author.username)
 
 
@@ -77,6 +229,8 @@ def post_edit(request, post_id):
     )
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data and post.image:
+            transaction.on_commit(lambda: thumbnails.schedule(post.pk))
         return redirect('posts:post_detail', post_id)
     context = {
         'form': form,
@@ -85,10 +239,13 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
-    if form.is_valid():
+    if form.is_valid() and write_behind.enabled():
+        write_behind.queue_comment(request, post, form)
+    elif form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
@@ -97,13 +254,11 @@ def add_comment(request, post_id):
 
 
 @login_required
+@read_from_replica
 def follow_index(request):
-    posts = (
-        Post.objects
-        .select_related('author', 'group')
-        .filter(author__following__user=request.user)
-    )
-    page_obj = paginator(request, posts=posts)
+    feed = FollowFeed(request.user)
+    page_obj = paginator(request, posts=feed.queryset, feed=feed)
+    attach_fragments(page_obj)
     context = {
         'page_obj': page_obj
     }
@@ -111,6 +266,7 @@ def follow_index(request):
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if request.user != author:
@@ -119,6 +275,10 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
-    Follow.objects.filter(author__username=username).delete()
+    Follow.objects.filter(
+        user=request.user,
+        author__username=username
+    ).delete()
     return redirect('posts:profile', username)
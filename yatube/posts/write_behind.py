@@ -0,0 +1,136 @@
+"""Отложенная запись постов и комментариев (настройка WRITE_BEHIND).
+
+Представления кладут запись в локальную очередь и сразу отвечают, а
+apply_pending() применяет записи пачками в общих транзакциях. Пока запись
+не применена, автор видит её на своих страницах: ожидающие записи
+выбираются из очереди по ключу его сессии.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from core.write_queue import get_queue
+from . import conditional, thumbnails
+from .models import AppliedWrite, Group, Post, User
+
+logger = logging.getLogger(__name__)
+
+RECEIPT_TTL = timedelta(days=1)
+
+
+def enabled():
+    return settings.WRITE_BEHIND
+
+
+def _owner(request):
+    if not request.session.session_key:
+        request.session.save()
+    return request.session.session_key
+
+
+def queue_post(request, form):
+    image = form.cleaned_data.get('image')
+    image_name = ''
+    if image:
+        field = Post._meta.get_field('image')
+        image_name = default_storage.save(
+            field.generate_filename(None, image.name), image
+        )
+    group = form.cleaned_data.get('group')
+    get_queue().put('post', _owner(request), {
+        'author': request.user.pk,
+        'text': form.cleaned_data['text'],
+        'group': group.pk if group else None,
+        'image': image_name,
+    })
+    conditional.touch(conditional.profile_scope(request.user.pk))
+
+
+def queue_comment(request, post, form):
+    get_queue().put('comment', _owner(request), {
+        'author': request.user.pk,
+        'post': post.pk,
+        'text': form.cleaned_data['text'],
+    })
+    conditional.touch(conditional.post_scope(post.pk))
+
+
+def pending(request, kind, **filters):
+    """Ещё не применённые записи текущей сессии для показа автору."""
+    if not enabled() or not request.session.session_key:
+        return []
+    items = []
+    for write in get_queue().pending(request.session.session_key, kind):
+        if all(write.payload.get(k) == v for k, v in filters.items()):
+            items.append({
+                **write.payload,
+                'created': datetime.fromtimestamp(write.created, timezone.utc),
+            })
+    return items
+
+
+def _apply_post(payload):
+    post = Post.objects.create(
+        author=User.objects.only('pk').get(pk=payload['author']),
+        text=payload['text'],
+        group=(
+            Group.objects.get(pk=payload['group'])
+            if payload['group'] else None
+        ),
+        image=payload['image'],
+    )
+    if post.image:
+        transaction.on_commit(lambda: thumbnails.schedule(post.pk))
+
+
+def _apply_comment(payload):
+    Post.objects.only('pk').get(pk=payload['post']).comments.create(
+        author=User.objects.only('pk').get(pk=payload['author']),
+        text=payload['text'],
+    )
+
+
+APPLIERS = {'post': _apply_post, 'comment': _apply_comment}
+
+
+def apply_pending(batch_size=None):
+    """Применяет пачку записей в одной транзакции.
+
+    Каждая запись выполняется в своей точке сохранения: ошибочная
+    помечается в очереди и не мешает остальным. Возвращает число
+    применённых и неудачных записей.
+    """
+    queue = get_queue()
+    writes = queue.take(batch_size or settings.WRITE_BEHIND_BATCH_SIZE)
+    if not writes:
+        return 0, 0
+    applied, failed, receipts = [], [], []
+    with transaction.atomic():
+        seen = set(AppliedWrite.objects.filter(
+            key__in=[write.key for write in writes]
+        ).values_list('key', flat=True))
+        for write in writes:
+            if write.key in seen:
+                applied.append(write.id)
+                continue
+            try:
+                with transaction.atomic():
+                    APPLIERS[write.kind](write.payload)
+            except Exception as error:
+                logger.exception('Не удалось применить запись %s', write.key)
+                failed.append((write.id, repr(error)))
+            else:
+                applied.append(write.id)
+                receipts.append(AppliedWrite(key=write.key))
+        AppliedWrite.objects.bulk_create(receipts)
+    queue.done(applied)
+    for id, error in failed:
+        queue.fail(id, error)
+    AppliedWrite.objects.filter(
+        applied__lt=timezone.now() - RECEIPT_TTL
+    ).delete()
+    return len(applied), len(failed)
@@ -1,4 +1,6 @@
 import os
+import tempfile
+from urllib.parse import unquote, urlsplit
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -28,6 +30,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ProfilingMiddleware',
+    'core.middleware.PrimaryPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -42,7 +46,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backends.ProfiledDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -59,12 +63,71 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# sqlite:///путь — SQLite в режиме WAL, по умолчанию db.sqlite3 проекта;
+# postgres://пользователь:пароль@хост:порт/база — PostgreSQL, при
+# YATUBE_DB_POOL_SIZE > 0 через пул соединений внутри процесса; соединения
+# тогда не держатся между запросами, а возвращаются в пул, и запрос ждёт
+# свободное до YATUBE_DB_POOL_TIMEOUT секунд.
+DATABASE_URL = os.getenv('YATUBE_DATABASE_URL', 'sqlite://')
+CONN_MAX_AGE = int(os.getenv('YATUBE_DB_CONN_MAX_AGE', '60'))
+DB_POOL_SIZE = int(os.getenv('YATUBE_DB_POOL_SIZE', '0'))
+DB_POOL_TIMEOUT = int(os.getenv('YATUBE_DB_POOL_TIMEOUT', '10'))
+
+
+def database_from_url(url):
+    if url.startswith(('postgres://', 'postgresql://')):
+        database = urlsplit(url)
+        return {
+            'ENGINE': 'core.db_backends.postgresql',
+            'NAME': database.path.lstrip('/'),
+            'USER': unquote(database.username or ''),
+            'PASSWORD': unquote(database.password or ''),
+            'HOST': database.hostname or '',
+            'PORT': database.port or '',
+            'CONN_MAX_AGE': 0 if DB_POOL_SIZE else CONN_MAX_AGE,
+            'OPTIONS': {
+                'pool_size': DB_POOL_SIZE,
+                'pool_timeout': DB_POOL_TIMEOUT,
+            },
+        }
+    return {
+        'ENGINE': 'core.db_backends.sqlite3',
+        'NAME': (
+            url[len('sqlite://'):] or os.path.join(BASE_DIR, 'db.sqlite3')
+        ),
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'OPTIONS': {
+            'timeout': int(os.getenv('YATUBE_DB_BUSY_TIMEOUT', '20')),
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'mmap_size': 256 * 1024 * 1024,
+                'cache_size': -64 * 1024,
+                'temp_store': 'MEMORY',
+            },
+        },
     }
-}
+
+
+DATABASES = {'default': database_from_url(DATABASE_URL)}
+
+# Реплики только для чтения: адреса через запятую в формате
+# YATUBE_DATABASE_URL. Ленты и страницы постов читают с реплик, после
+# записи пользователь REPLICA_STICKY_SECONDS читает с основной базы.
+REPLICA_DATABASES = []
+for number, url in enumerate(
+    filter(None, os.getenv('YATUBE_REPLICA_URLS', '').split(',')), 1
+):
+    DATABASES[f'replica_{number}'] = {
+        **database_from_url(url.strip()),
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(f'replica_{number}')
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+REPLICA_STICKY_SECONDS: int = 5
+# Наибольшая ожидаемая задержка реплик: страница, изменённая позже, чем
+# столько секунд назад, рисуется по основной базе.
+REPLICA_MAX_LAG: int = 5
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -93,10 +156,79 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
+STATIC_ROOT = os.getenv(
+    'YATUBE_STATIC_ROOT', os.path.join(BASE_DIR, 'staticfiles')
+)
+# collectstatic добавляет к именам хеш содержимого и кладёт рядом сжатые
+# копии .gz и .br (последние — если установлен пакет brotli).
+STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
 
 QUANTITY_POSTS: int = 10
 QUANTITY_POSTS_NEXT_PAGE: int = 3
 NEW_POSTS: int = 13
+QUANTITY_COMMENTS: int = 20
+# Keyset-пагинация лент; ?page=N включает прежний нумерованный вывод.
+CURSOR_PAGINATION: bool = True
+# Сколько свежих id постов каждой группы и автора держать в кеше.
+RECENT_POSTS_SIZE: int = 100
+RECENT_POSTS_TIMEOUT: int = 60 * 10
+# JSON API: размер страницы по умолчанию и наибольший; страницы больше
+# API_STREAM_THRESHOLD отдаются потоком.
+API_PAGE_SIZE: int = 20
+API_MAX_PAGE_SIZE: int = 1000
+API_STREAM_THRESHOLD: int = 100
+# Строк в одной пачке выгрузки export_data.
+EXPORT_BATCH_SIZE: int = 2000
+# Авторы и группы постов ленты хранятся в памяти процесса.
+HYDRATION_TIMEOUT: int = 30
+HYDRATION_CACHE_SIZE: int = 10000
+APPROXIMATE_COUNT_TIMEOUT: int = 60
+# Авторы, у которых подписчиков больше FEED_FANOUT_LIMIT, не раскладываются
+# по лентам подписок при публикации, а подмешиваются при чтении. Список
+# обновляет команда update_hot_authors, которую запускают по расписанию.
+FEED_FANOUT_LIMIT: int = 1000
+FEED_BATCH_SIZE: int = 500
+FEED_HOT_AUTHORS_TIMEOUT: int = 300
+POST_FRAGMENT_TIMEOUT: int = 60 * 60 * 24
+# Кеш целых страниц для анонимов; сброс по суррогатным ключам также
+# уходит запросом PURGE на SURROGATE_PURGE_URL, если он задан.
+PAGE_CACHE_TIMEOUT: int = 60 * 10
+SURROGATE_PURGE_URL = os.getenv('YATUBE_SURROGATE_PURGE_URL', '')
+SURROGATE_PURGE_TIMEOUT: int = 2
+# Отложенная запись постов и комментариев через локальную очередь;
+# очередь разбирает команда apply_writes.
+WRITE_BEHIND: bool = os.getenv('YATUBE_WRITE_BEHIND', '') == '1'
+WRITE_QUEUE_PATH = os.getenv(
+    'YATUBE_WRITE_QUEUE', os.path.join(BASE_DIR, 'write_queue.sqlite3')
+)
+WRITE_BEHIND_BATCH_SIZE: int = 200
+# Бэкенд полнотекстового поиска по постам; posts.search.DatabaseBackend
+# работает на любой базе без индекса FTS5.
+SEARCH_BACKEND = os.getenv(
+    'YATUBE_SEARCH_BACKEND',
+    'posts.search.SQLiteFTSBackend'
+    if DATABASES['default']['ENGINE'].endswith('sqlite3')
+    else 'posts.search.DatabaseBackend',
+)
+
+# Форматы миниатюр, которые создаются сразу после загрузки картинки.
+POST_THUMBNAILS = {
+    'feed': ('400', {'crop': 'center', 'upscale': False}),
+    'detail': ('336x280', {'crop': 'center', 'upscale': False}),
+}
+# Загруженные картинки: пределы размера файла и разрешения, наибольшая
+# сторона после обработки и форматы перекодирования по предпочтению.
+# Форматы, которые не поддерживает Pillow, пропускаются; JPEG
+# создаётся всегда и становится картинкой поста, остальные отдаются
+# через <picture>.
+POST_IMAGE_MAX_BYTES: int = 10 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS: int = 40 * 10 ** 6
+POST_IMAGE_MAX_SIZE: int = 1920
+POST_IMAGE_FORMATS = ('AVIF', 'WEBP', 'JPEG')
+# Размер пула потоков для обработки картинок и миниатюр. По умолчанию 0 —
+# обработка идёт синхронно после коммита, в потоке запроса; пул
+# включается переменной окружения YATUBE_THUMBNAIL_WORKERS.
+THUMBNAIL_WORKERS = int(os.getenv('YATUBE_THUMBNAIL_WORKERS', '0'))
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -109,9 +241,72 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Загрузки хранятся по хешу содержимого; миниатюры sorl-thumbnail — в
+# обычном хранилище, так как sorl сам выбирает их имена.
+DEFAULT_FILE_STORAGE = 'core.storage.ContentAddressedStorage'
+THUMBNAIL_STORAGE = 'django.core.files.storage.FileSystemStorage'
+# collect_media просматривает эти каталоги и не трогает файлы моложе
+# MEDIA_GC_GRACE секунд: их запись в базу могла ещё не завершиться.
+MEDIA_GC_DIRS = ('posts/',)
+MEDIA_GC_GRACE: int = 60 * 60
+# Статику и медиа отдаёт WSGI-обёртка core.serving.FileServingMiddleware,
+# отдельный веб-сервер не нужен. Файлы с хешем в имени кешируются
+# навсегда, остальные — на FILES_MAX_AGE секунд.
+SERVE_FILES: bool = os.getenv('YATUBE_SERVE_FILES', '1') == '1'
+FILES_MAX_AGE: int = 60
+FILES_IMMUTABLE_MAX_AGE: int = 60 * 60 * 24 * 365
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# locmem:// — кеш внутри процесса; sqlite:///путь и file:///путь — общий
+# для воркеров на одной машине; redis://… — общий сетевой кеш.
+CACHE_URL = os.getenv('YATUBE_CACHE_URL', 'locmem://')
+if CACHE_URL.startswith(('redis://', 'rediss://', 'unix://')):
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache_backends.RedisCache',
+            'LOCATION': CACHE_URL,
+            'OPTIONS': {
+                'CLIENT_CLASS': os.getenv('YATUBE_CACHE_CLIENT_CLASS'),
+            },
+        }
     }
-}
+elif CACHE_URL.startswith('sqlite://'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache_backends.SQLiteCache',
+            'LOCATION': (
+                CACHE_URL[len('sqlite://'):]
+                or os.path.join(BASE_DIR, 'cache.sqlite3')
+            ),
+        }
+    }
+elif CACHE_URL.startswith('file://'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': (
+                CACHE_URL[len('file://'):]
+                or os.path.join(BASE_DIR, 'cache')
+            ),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+CACHES['default']['KEY_PREFIX'] = 'yatube'
+CACHE_LOCK_TIMEOUT: int = 10
+# Сколько секунд запрос ждёт чужого пересчёта значения, которого нет в
+# кеше, прежде чем вычислить его сам.
+CACHE_LOCK_WAIT: float = 0.2
+
+# Бюджет SQL-запросов на запрос; QUERY_BUDGETS задаёт его по имени
+# представления, например {'posts:profile': 10}.
+QUERY_BUDGET: int = 20
+QUERY_BUDGETS = {}
+PROFILING_DIR = os.getenv(
+    'YATUBE_PROFILING_DIR',
+    os.path.join(tempfile.gettempdir(), 'yatube-profiling'),
+)
+PROFILING_FLUSH_EVERY: int = 100
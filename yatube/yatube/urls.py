@@ -15,7 +15,8 @@ handler404 = 'core.views.page_not_found'
 handler403 = 'core.views.permission_denied'
 handler500 = 'core.views.server_error'
 
-if settings.DEBUG:
+# Иначе медиа отдаёт core.serving.FileServingMiddleware из wsgi.py.
+if settings.DEBUG and not settings.SERVE_FILES:
     urlpatterns += static(
         settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
     )